@@ -0,0 +1,374 @@
+"""
+Admission control in front of the shared provider keys.
+
+Requests are classified by endpoint into priority classes: resolution, then creation, then
+discovery. Each tenant (an ADMISSION_API_KEYS key sent in ADMISSION_TENANT_HEADER, or else the
+client address) gets a token-bucket rate limit per endpoint and an hourly budget of estimated LLM
+tokens per class; requests over either are rejected with HTTP 429 before any work is done.
+
+Admitted LLM calls then share ADMISSION_LLM_SLOTS concurrent slots. Waiting calls are let in by
+priority class and round-robin across tenants within a class, and the last ADMISSION_RESERVED_SLOTS
+only go to resolutions, so settlement traffic keeps moving while creation and discovery saturate.
+"""
+import os
+import math
+import time
+import heapq
+import asyncio
+import hashlib
+import itertools
+import threading
+import contextvars
+from collections import OrderedDict, Counter as TurnCounter
+from contextlib import contextmanager, asynccontextmanager
+
+from evidence import count_tokens
+from metrics import Counter, Histogram, record_stage, register_collector
+
+ADMISSION_TENANT_HEADER = os.getenv("ADMISSION_TENANT_HEADER", "X-API-Key")  # Header identifying the tenant
+ADMISSION_API_KEYS = os.getenv("ADMISSION_API_KEYS", "")  # Comma-separated keys that identify tenants; others count as their address
+ADMISSION_RATES = os.getenv("ADMISSION_RATES", "")  # e.g. "resolution=10:20,creation=1:5" (requests/s:burst per endpoint)
+ADMISSION_TOKEN_BUDGETS = os.getenv("ADMISSION_TOKEN_BUDGETS", "")  # e.g. "creation=200000" (LLM tokens per hour)
+ADMISSION_LLM_SLOTS = int(os.getenv("ADMISSION_LLM_SLOTS", os.getenv("LLM_MAX_CONCURRENCY", "16")))  # 0 disables the gate
+ADMISSION_RESERVED_SLOTS = int(os.getenv("ADMISSION_RESERVED_SLOTS", "4"))  # Slots only resolutions may use
+ADMISSION_COMPLETION_TOKENS = int(os.getenv("ADMISSION_COMPLETION_TOKENS", "300"))  # Output estimate without max_tokens
+ADMISSION_MAX_TENANTS = int(os.getenv("ADMISSION_MAX_TENANTS", "10000"))  # Rate limit buckets kept in memory
+
+# Lower is served first
+PRIORITIES = {"resolution": 0, "creation": 1, "discovery": 2}
+# Unclassified work (CLI scripts, unwrapped background threads) queues behind every request
+DEFAULT_PRIORITY = "discovery"
+
+ADMISSION_REJECTED = Counter(
+    "bigmarket_admission_rejected_total", "Requests rejected with HTTP 429, by priority class and reason.",
+    ["priority", "reason"]
+)
+ADMISSION_TOKENS = Counter(
+    "bigmarket_admission_tokens_total", "Estimated LLM tokens admitted, by priority class.", ["priority"]
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "bigmarket_admission_wait_seconds", "Time LLM calls waited for a slot, by priority class.", ["priority"]
+)
+
+# (tenant, priority class) of the request being served
+_ticket = contextvars.ContextVar("admission_ticket", default=None)
+# True while this context holds an LLM slot, so calls nested in a stream (repairs) don't wait on a second one
+_holding = contextvars.ContextVar("admission_holding", default=False)
+
+def parse_limits(spec):
+    """Parses "class=value[:value],..." into {class: (float, ...)}; raises ValueError for unknown classes."""
+    limits = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, values = item.partition("=")
+        name = name.strip().lower()
+        if name not in PRIORITIES:
+            raise ValueError(f"Unknown priority class {name!r}; use {', '.join(PRIORITIES)}")
+        limits[name] = tuple(float(value) for value in values.split(":"))
+    return limits
+
+def classify(method, path):
+    """The priority class of a request, or None for requests that never reach the LLM."""
+    if method != "POST":
+        return None
+    if path.startswith(("/resolve-market", "/resolutions/", "/jobs/resolve-market")):
+        return "resolution"
+    if path == "/create-market":
+        return "creation"
+    if path.startswith(("/discover-markets", "/jobs/discover")):
+        return "discovery"
+    return None
+
+def _key_hash(api_key):
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+# Hashes of the configured keys, so the keys themselves are never kept
+KNOWN_KEYS = {_key_hash(key.strip()) for key in ADMISSION_API_KEYS.split(",") if key.strip()}
+
+def tenant_of(headers, remote_addr):
+    """
+    The tenant of a request: its API key if it is one of ADMISSION_API_KEYS, or else the client
+    address. Unknown keys are ignored, so sending a new key per request doesn't get new limits.
+    """
+    api_key = headers.get(ADMISSION_TENANT_HEADER)
+    if api_key:
+        key_hash = _key_hash(api_key)
+        if key_hash in KNOWN_KEYS:
+            return "key:" + key_hash[:12]
+    return f"ip:{remote_addr}"
+
+class TokenBucket:
+    """Holds up to `capacity` tokens, refilled at `rate` per second. May go negative when charged."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount=1):
+        """Takes `amount` tokens if available; returns 0, or the seconds until they will be."""
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0
+        return (amount - self.tokens) / self.rate if self.rate else math.inf
+
+    def charge(self, amount):
+        self._refill()
+        self.tokens -= amount
+
+    def debt(self):
+        """Seconds until the balance is positive again, 0 if it already is."""
+        self._refill()
+        if self.tokens > 0:
+            return 0
+        return (1 - self.tokens) / self.rate if self.rate else math.inf
+
+class Admission:
+    """Per-tenant request rate limits and LLM token budgets."""
+
+    def __init__(self, rates=ADMISSION_RATES, budgets=ADMISSION_TOKEN_BUDGETS, max_tenants=ADMISSION_MAX_TENANTS):
+        self.rates = parse_limits(rates)  # class -> (requests per second, burst)
+        self.budgets = parse_limits(budgets)  # class -> (tokens per hour,)
+        self.max_tenants = max_tenants
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, key, rate, capacity):
+        """The bucket for `key`, created full; the least recently used ones are dropped past max_tenants."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, capacity)
+            if len(self._buckets) > self.max_tenants:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _budget(self, tenant, priority):
+        budget = self.budgets.get(priority)
+        if not budget or not budget[0]:
+            return None
+        return self._bucket((tenant, "budget", priority), budget[0] / 3600, budget[0])
+
+    def check(self, tenant, endpoint, priority):
+        """Admits one request. Returns None, or (reason, retry_after_seconds) when it must be rejected."""
+        with self._lock:
+            budget = self._budget(tenant, priority)
+            if budget is not None:
+                wait = budget.debt()
+                if wait:
+                    return "token_budget", wait
+            rate = self.rates.get(priority)
+            if rate and rate[0]:
+                burst = rate[1] if len(rate) > 1 else max(1, rate[0])
+                # Keyed by class too: /jobs/<job_type> serves several classes, each at its own rate
+                wait = self._bucket((tenant, "rate", priority, endpoint), rate[0], burst).take()
+                if wait:
+                    return "rate_limit", wait
+        return None
+
+    def charge(self, tenant, priority, tokens):
+        """Spends estimated LLM tokens from the tenant's budget; it can go into debt until refilled."""
+        with self._lock:
+            budget = self._budget(tenant, priority)
+            if budget is not None:
+                budget.charge(tokens)
+
+class PriorityGate:
+    """
+    Limits concurrent LLM calls to `slots`. Waiting calls are let in by priority, then round-robin
+    across tenants, then arrival; the last `reserved` slots only go to priority 0.
+    """
+
+    def __init__(self, slots=ADMISSION_LLM_SLOTS, reserved=ADMISSION_RESERVED_SLOTS):
+        self.slots = slots
+        self.reserved = max(0, min(reserved, slots - 1))  # Every class keeps at least one slot
+        self.in_use = 0
+        self._waiting = []  # Heap of (priority, tenant turn, arrival, tenant, wake)
+        self._turns = TurnCounter()  # (priority, tenant) -> calls waiting
+        self._arrivals = itertools.count()
+        self._lock = threading.Lock()
+
+    def _limit(self, priority):
+        return self.slots if priority == 0 else self.slots - self.reserved
+
+    def _enter(self, priority):
+        """Takes a slot if one is free for `priority` and nobody at the same or a higher priority waits."""
+        if self.in_use < self._limit(priority) and (not self._waiting or self._waiting[0][0] > priority):
+            self.in_use += 1
+            return True
+        return False
+
+    def _queue(self, priority, tenant, wake):
+        entry = (priority, self._turns[priority, tenant], next(self._arrivals), tenant, wake)
+        self._turns[priority, tenant] += 1
+        heapq.heappush(self._waiting, entry)
+        return entry
+
+    def _dequeued(self, entry):
+        key = (entry[0], entry[3])
+        self._turns[key] -= 1
+        if not self._turns[key]:
+            del self._turns[key]
+
+    def acquire(self, priority, tenant):
+        """Blocks until a slot is granted; returns the seconds waited."""
+        with self._lock:
+            if self._enter(priority):
+                return 0
+            granted = threading.Event()
+            self._queue(priority, tenant, granted.set)
+        started = time.perf_counter()
+        granted.wait()
+        return time.perf_counter() - started
+
+    async def aacquire(self, priority, tenant):
+        """Async `acquire`; a cancelled waiter gives up its place, or its slot if it was just granted."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._enter(priority):
+                return 0
+            granted = loop.create_future()
+            entry = self._queue(priority, tenant, lambda: loop.call_soon_threadsafe(self._grant, granted))
+        started = time.perf_counter()
+        try:
+            await granted
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = entry in self._waiting
+                if queued:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._dequeued(entry)
+            if not queued and granted.done() and not granted.cancelled():
+                self.release()
+            raise
+        return time.perf_counter() - started
+
+    def _grant(self, granted):
+        if granted.cancelled():
+            self.release()  # The waiter was cancelled after its slot was handed over
+        else:
+            granted.set_result(None)
+
+    def release(self):
+        """Frees a slot and hands free slots to the waiters first in line."""
+        with self._lock:
+            self.in_use -= 1
+            while self._waiting and self.in_use < self._limit(self._waiting[0][0]):
+                entry = heapq.heappop(self._waiting)
+                self._dequeued(entry)
+                self.in_use += 1
+                entry[4]()
+
+    def stats(self):
+        with self._lock:
+            waiting = TurnCounter(entry[0] for entry in self._waiting)
+            return self.in_use, waiting
+
+admission = Admission()
+llm_gate = PriorityGate()
+
+def _collect():
+    in_use, waiting = llm_gate.stats()
+    return [
+        ("bigmarket_admission_slots_in_use", "gauge", "LLM slots held by admitted calls.", [((), in_use)]),
+        ("bigmarket_admission_waiting", "gauge", "LLM calls waiting for a slot, by priority class.",
+         [((("priority", name),), waiting[priority]) for name, priority in PRIORITIES.items()]),
+    ]
+
+register_collector(_collect)
+
+def admit(method, path, endpoint, headers, remote_addr):
+    """
+    Classifies and admits an incoming request, binding its tenant and priority to the current context.
+    Returns None, or (error message, Retry-After seconds) for a 429.
+    """
+    _holding.set(False)
+    priority = classify(method, path)
+    if priority is None:
+        _ticket.set(None)
+        return None
+    tenant = tenant_of(headers, remote_addr)
+    _ticket.set((tenant, priority))
+    rejected = admission.check(tenant, endpoint, priority)
+    if rejected is None:
+        return None
+    reason, wait = rejected
+    ADMISSION_REJECTED.inc(priority=priority, reason=reason)
+    print(f"🚦 Rejected {priority} request from {tenant} ({reason}), retry in {wait:.1f}s")
+    message = "LLM token budget exhausted" if reason == "token_budget" else "Rate limit exceeded"
+    return message, max(1, math.ceil(min(wait, 3600)))
+
+def current_tenant():
+    """The tenant of the request being served, to charge the background work it submits."""
+    ticket = _ticket.get()
+    return ticket[0] if ticket else None
+
+def prioritized(priority, fn):
+    """
+    Wraps a background job handler taking the job's payload, so its LLM calls queue at `priority`
+    and are charged to the tenant that submitted the job.
+    """
+    def run(payload, tenant=None):
+        _ticket.set((tenant, priority))
+        _holding.set(False)
+        return fn(payload)
+    return run
+
+def _admitted(prompt, params):
+    """The (tenant, priority) of an LLM call, after charging its estimated tokens to the tenant."""
+    tenant, priority = _ticket.get() or (None, DEFAULT_PRIORITY)
+    tokens = count_tokens(prompt) + (params.get("max_tokens") or ADMISSION_COMPLETION_TOKENS)
+    ADMISSION_TOKENS.inc(tokens, priority=priority)
+    if tenant is not None:
+        admission.charge(tenant, priority, tokens)
+    return tenant, priority
+
+@contextmanager
+def llm_call(prompt, params):
+    """Holds an LLM slot for the duration of a provider call."""
+    if _holding.get():
+        yield
+        return
+    tenant, priority = _admitted(prompt, params)
+    if not llm_gate.slots:
+        yield
+        return
+    waited = llm_gate.acquire(PRIORITIES[priority], tenant)
+    ADMISSION_WAIT_SECONDS.observe(waited, priority=priority)
+    record_stage("llm_queue", waited)
+    _holding.set(True)
+    try:
+        yield
+    finally:
+        _holding.set(False)
+        llm_gate.release()
+
+@asynccontextmanager
+async def allm_call(prompt, params):
+    """Async `llm_call`."""
+    if _holding.get():
+        yield
+        return
+    tenant, priority = _admitted(prompt, params)
+    if not llm_gate.slots:
+        yield
+        return
+    waited = await llm_gate.aacquire(PRIORITIES[priority], tenant)
+    ADMISSION_WAIT_SECONDS.observe(waited, priority=priority)
+    record_stage("llm_queue", waited)
+    _holding.set(True)
+    try:
+        yield
+    finally:
+        _holding.set(False)
+        llm_gate.release()
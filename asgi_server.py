@@ -0,0 +1,241 @@
+"""
+Async serving mode: the same JSON API as server.py on an ASGI event loop.
+Scrapes and LLM calls are awaited instead of holding a worker thread; SQLite reads and writes
+(caches, market index, audit store) and the thread-pooled batch pipelines run in worker threads.
+
+    hypercorn asgi_server:app --bind 0.0.0.0:5000
+"""
+import time
+import json
+import asyncio
+import threading
+from quart import Quart, Response, g, request, jsonify
+from resolution_pipeline import aresolve_market, areplay_resolution, resolve_markets
+from llm_tools_creation import agenerate_market
+from llm_tools_ai_markets import adiscover_markets_from_news, astream_markets_from_news
+from news_pipeline import discover_markets_from_feeds, max_articles_of
+from job_queue import QueueFull
+from background_jobs import jobs, job_request
+from price_feed import price_feed
+from audit_store import audit_store, AUDIT_HISTORY_LIMIT
+from llm_providers import PROVIDERS
+from consensus import consensus_options
+import admission
+import metrics
+
+app = Quart(__name__)
+
+@app.before_serving
+async def start_background_workers():
+    # Started in the serving process, not at import
+    price_feed.start()
+    jobs.start()
+
+@app.before_request
+async def start_request_trace():
+    g.started = time.perf_counter()
+    g.trace_id = metrics.start_trace(request.headers.get("X-Trace-Id"))
+
+@app.before_request
+async def admit_request():
+    endpoint = request.url_rule.rule if request.url_rule else request.path
+    rejected = admission.admit(request.method, request.path, endpoint, request.headers, request.remote_addr)
+    if rejected is not None:
+        message, retry_after = rejected
+        return jsonify({"error": message}), 429, {"Retry-After": str(retry_after)}
+
+@app.after_request
+async def finish_request_trace(response):
+    if request.path != "/metrics":
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.finish_trace(endpoint, response.status_code, time.perf_counter() - g.started)
+    response.headers["X-Trace-Id"] = g.trace_id
+    return response
+
+_done = object()
+
+async def iterate_in_thread(generator):
+    """
+    Async iteration over a blocking generator, each step run in a worker thread.
+    When the consumer stops early the generator is closed in a thread too, once its running step returns.
+    """
+    lock = threading.Lock()
+
+    def step():
+        with lock:
+            return next(generator, _done)
+
+    def close():
+        with lock:
+            generator.close()
+
+    try:
+        while (item := await asyncio.to_thread(step)) is not _done:
+            yield item
+    finally:
+        asyncio.get_running_loop().run_in_executor(None, close)
+
+def ndjson(items):
+    async def lines():
+        async for item in items:
+            yield json.dumps(item) + "\n"
+    return Response(lines(), mimetype="application/x-ndjson")
+
+@app.route('/metrics', methods=['GET'])
+async def get_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/discover-markets', methods=['POST'])
+async def discover_markets():
+    data = await request.get_json()
+    news_url = data.get("news_url", "")
+
+    if not news_url:
+        return jsonify({"error": "News URL is required"}), 400
+
+    print(f"🔹 Discovering markets from news: {news_url}")
+
+    market_data = await adiscover_markets_from_news(news_url, bool(data.get("force")))
+
+    return jsonify(market_data)
+
+@app.route('/discover-markets/stream', methods=['POST'])
+async def discover_markets_stream():
+    data = await request.get_json()
+    news_url = data.get("news_url", "")
+
+    if not news_url:
+        return jsonify({"error": "News URL is required"}), 400
+
+    print(f"🔹 Streaming markets from news: {news_url}")
+
+    return ndjson(astream_markets_from_news(news_url, bool(data.get("force"))))
+
+@app.route('/discover-markets/feeds', methods=['POST'])
+async def discover_markets_feeds():
+    data = await request.get_json()
+    feeds = data.get("feeds")
+
+    if not isinstance(feeds, list) or not feeds:
+        return jsonify({"error": "A list of feed URLs is required"}), 400
+    max_articles = max_articles_of(data)
+    if max_articles is None:
+        return jsonify({"error": "max_articles must be a positive integer"}), 400
+
+    print(f"🔹 Discovering markets from {len(feeds)} feeds")
+
+    # One JSON line per candidate market, for articles not processed by an earlier scan
+    return ndjson(iterate_in_thread(discover_markets_from_feeds(feeds, max_articles)))
+
+@app.route('/create-market', methods=['POST'])
+async def create_market():
+    data = await request.get_json()
+    user_idea = data.get("user_idea", "")
+    market_type = data.get("market_type", "news")  # Default to news-based
+
+    if not user_idea:
+        return jsonify({"error": "User idea is required"}), 400
+
+    print(f"🔹 User wants to create a {market_type} market: {user_idea}")
+
+    market_data = await agenerate_market(user_idea, market_type, bool(data.get("force")))
+
+    return jsonify(market_data)
+
+@app.route('/resolve-market', methods=['POST'])
+async def resolve_market():
+    data = await request.get_json()
+    print(f"🔹 Received Market Resolution Request: {data}")  # 🛠 Debugging incoming request
+
+    if isinstance(data, dict) and data.get("consensus"):
+        try:
+            consensus_options(data["consensus"])
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": f"Invalid consensus options: {e}"}), 400
+
+    return jsonify(await aresolve_market(data))
+
+@app.route('/resolve-markets', methods=['POST'])
+async def resolve_markets_batch():
+    data = await request.get_json()
+    markets = data.get("markets") if isinstance(data, dict) else data
+
+    if not isinstance(markets, list) or not markets:
+        return jsonify({"error": "A list of markets is required"}), 400
+
+    print(f"🔹 Received Batch Resolution Request for {len(markets)} markets")
+
+    # Stream one JSON line per market as each resolution completes
+    return ndjson(iterate_in_thread(resolve_markets(markets)))
+
+@app.route('/resolutions/<audit_id>', methods=['GET'])
+async def get_resolution(audit_id):
+    store = audit_store()
+    record = await asyncio.to_thread(store.get, audit_id) if store else None
+
+    if record is None:
+        return jsonify({"error": "Resolution not found"}), 404
+
+    return jsonify(record)
+
+@app.route('/markets/<market_id>/resolutions', methods=['GET'])
+async def get_market_resolutions(market_id):
+    store = audit_store()
+
+    if store is None:
+        return jsonify({"error": "Audit store is disabled"}), 404
+
+    limit = request.args.get("limit", AUDIT_HISTORY_LIMIT, type=int)
+    since = request.args.get("since", type=float)
+    records = await asyncio.to_thread(store.history, market_id, limit, since)
+
+    return jsonify({"market_id": market_id, "resolutions": records})
+
+@app.route('/resolutions/<audit_id>/replay', methods=['POST'])
+async def replay_market_resolution(audit_id):
+    data = await request.get_json(silent=True) or {}
+    provider = data.get("provider")
+
+    if provider and provider.lower() not in PROVIDERS:
+        return jsonify({"error": f"Unknown provider: {provider}"}), 400
+
+    print(f"🔹 Replaying resolution {audit_id} with {provider or 'the configured provider'}")
+
+    result = await areplay_resolution(audit_id, provider, data.get("model"))
+
+    if result is None:
+        return jsonify({"error": "Resolution not found"}), 404
+
+    return jsonify(result)
+
+@app.route('/jobs/<job_type>', methods=['POST'])
+async def submit_job(job_type):
+    data = await request.get_json()
+
+    if job_type not in jobs.handlers:
+        return jsonify({"error": f"Unknown job type: {job_type}"}), 404
+    try:
+        payload, callback_url = await asyncio.to_thread(job_request, job_type, data)  # Resolves callback hosts
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        job_id, created = await asyncio.to_thread(jobs.submit, job_type, payload, callback_url, admission.current_tenant())
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429
+
+    print(f"🔹 {'Queued' if created else 'Joined in-flight'} {job_type} job {job_id}")
+
+    return jsonify({"job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+async def get_job(job_id):
+    job = await asyncio.to_thread(jobs.get, job_id)
+
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify(job)
+
+if __name__ == '__main__':
+    app.run(port=5000, debug=True)
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+AUDIT_STORE_PATH = os.getenv("AUDIT_STORE_PATH", "audit.sqlite3")  # SQLite file of resolution records ("" disables)
+AUDIT_HISTORY_LIMIT = int(os.getenv("AUDIT_HISTORY_LIMIT", "20"))  # Records returned per market lookup by default
+
+# Columns holding JSON documents
+JSON_COLUMNS = ("request", "prompt_template", "timings", "consensus")
+
+class AuditStore:
+    """
+    Append-only log of market resolutions: the market as submitted, the evidence snapshot the
+    LLM saw, the prompt, its answer and how long each step took. Records are never updated;
+    a replay is a new record pointing at the one it re-ran.
+    """
+
+    def __init__(self, path=AUDIT_STORE_PATH):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")  # Lookups don't wait on writers
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS resolutions ("
+            "id TEXT PRIMARY KEY, market_id TEXT, created_at REAL NOT NULL, replay_of TEXT, "
+            "request TEXT NOT NULL, evidence TEXT NOT NULL, prompt TEXT NOT NULL, prompt_template TEXT, "
+            "ai_response TEXT, outcome INTEGER, provider TEXT, model TEXT, timings TEXT, trace_id TEXT, "
+            "consensus TEXT)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(resolutions)")}
+        if "consensus" not in columns:  # Stores created before consensus votes were recorded
+            self._db.execute("ALTER TABLE resolutions ADD COLUMN consensus TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS resolutions_market ON resolutions (market_id, created_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS resolutions_created ON resolutions (created_at)")
+        for action in ("UPDATE", "DELETE"):
+            self._db.execute(
+                f"CREATE TRIGGER IF NOT EXISTS resolutions_no_{action.lower()} BEFORE {action} ON resolutions "
+                "BEGIN SELECT RAISE(ABORT, 'resolutions are append-only'); END"
+            )
+        self._db.commit()
+
+    def record(self, market_id, request, evidence, prompt, prompt_template, ai_response, outcome, provider,
+               model, timings, trace_id=None, replay_of=None, consensus=None):
+        """Appends one resolution and returns its ID."""
+        audit_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO resolutions (id, market_id, created_at, replay_of, request, evidence, prompt, "
+                "prompt_template, ai_response, outcome, provider, model, timings, trace_id, consensus) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (audit_id, None if market_id is None else str(market_id), time.time(), replay_of,
+                 json.dumps(request), evidence, str(prompt), json.dumps(prompt_template), ai_response, outcome,
+                 provider, model, json.dumps(timings), trace_id,
+                 None if consensus is None else json.dumps(consensus))
+            )
+            self._db.commit()
+        return audit_id
+
+    def get(self, audit_id):
+        """Returns one record, or None if unknown."""
+        rows = self._select("WHERE id = ?", (audit_id,))
+        return rows[0] if rows else None
+
+    def history(self, market_id, limit=AUDIT_HISTORY_LIMIT, since=None):
+        """The market's records, newest first, optionally only those created after `since`."""
+        if since is None:
+            return self._select("WHERE market_id = ? ORDER BY created_at DESC LIMIT ?", (str(market_id), limit))
+        return self._select(
+            "WHERE market_id = ? AND created_at > ? ORDER BY created_at DESC LIMIT ?", (str(market_id), since, limit)
+        )
+
+    def _select(self, where, params):
+        with self._lock:
+            cursor = self._db.execute(f"SELECT * FROM resolutions {where}", params)
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+        records = []
+        for row in rows:
+            record = dict(zip(columns, row))
+            for column in JSON_COLUMNS:
+                if record[column] is not None:
+                    record[column] = json.loads(record[column])
+            records.append(record)
+        return records
+
+_audit_store = None
+_audit_store_lock = threading.Lock()
+
+def audit_store():
+    """The shared audit store, opened on first use. None when AUDIT_STORE_PATH is empty."""
+    global _audit_store
+    if not AUDIT_STORE_PATH:
+        return None
+    with _audit_store_lock:
+        if _audit_store is None:
+            _audit_store = AuditStore()
+        return _audit_store
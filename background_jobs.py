@@ -0,0 +1,51 @@
+"""
+The background job types behind POST /jobs/<type>, shared by server.py and asgi_server.py.
+Each takes the same payload as its synchronous endpoint.
+"""
+from resolution_pipeline import resolve_market
+from llm_tools_ai_markets import discover_markets_from_news
+from news_pipeline import discover_markets_from_feeds, max_articles_of, NEWS_MAX_ARTICLES
+from job_queue import JobQueue, check_callback_url
+import admission
+import metrics
+
+jobs = JobQueue({
+    "resolve-market": admission.prioritized("resolution", resolve_market),
+    "discover-markets": admission.prioritized(
+        "discovery", lambda data: discover_markets_from_news(data["news_url"], bool(data.get("force")))
+    ),
+    "discover-feeds": admission.prioritized(
+        "discovery", lambda data: list(discover_markets_from_feeds(data["feeds"], int(data.get("max_articles", NEWS_MAX_ARTICLES))))
+    ),
+})
+
+def job_request(job_type, data):
+    """
+    Splits a submission into (payload, callback_url).
+    Raises ValueError with the message for a 400 when the submission is invalid.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("A JSON object is required")
+    if job_type == "discover-markets" and not data.get("news_url"):
+        raise ValueError("News URL is required")
+    if job_type == "discover-feeds" and not (isinstance(data.get("feeds"), list) and data["feeds"]):
+        raise ValueError("A list of feed URLs is required")
+
+    payload = dict(data)
+    if job_type == "discover-feeds":
+        payload["max_articles"] = max_articles_of(data)
+        if payload["max_articles"] is None:
+            raise ValueError("max_articles must be a positive integer")
+    callback_url = payload.pop("callback_url", None)
+    if callback_url is not None:
+        check_callback_url(callback_url)
+    return payload, callback_url
+
+def collect_job_metrics():
+    stats = jobs.stats()
+    return [
+        ("bigmarket_jobs_queued", "gauge", "Background jobs waiting for a worker.", [((), stats["queued"])]),
+        ("bigmarket_jobs_in_flight", "gauge", "Background jobs queued or running.", [((), stats["in_flight"])]),
+    ]
+
+metrics.register_collector(collect_job_metrics)
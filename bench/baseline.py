@@ -0,0 +1,42 @@
+import os
+import json
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+def load(suite, path=BASELINE_PATH):
+    """Returns the saved {case: {metric: value}} results of a suite, or None."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get(suite)
+
+def save(suite, results, path=BASELINE_PATH):
+    """Stores a suite's results, keeping the other suites in the file."""
+    saved = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            saved = json.load(f)
+    saved[suite] = results
+    with open(path, "w") as f:
+        json.dump(saved, f, indent=2, sort_keys=True)
+    print(f"💾 Saved {suite} baseline to {path}")
+
+def compare(results, baseline, metrics, tolerance):
+    """
+    Prints each metric against the baseline and returns the regressions.
+    `metrics` maps a metric name to True when higher is better (e.g. RPS) and False when lower is.
+    """
+    regressions = []
+    for case, values in results.items():
+        for metric, higher_is_better in metrics.items():
+            old = (baseline.get(case) or {}).get(metric)
+            new = values.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = "❌" if worse > tolerance else "✅"
+            print(f"{flag} {case} {metric}: {old:.4g} -> {new:.4g} ({change:+.1%})")
+            if worse > tolerance:
+                regressions.append((case, metric, old, new))
+    return regressions
@@ -0,0 +1,257 @@
+"""
+Load test for the API against the stub LLM and web servers.
+
+    python -m bench.load_test --concurrency 16 --requests 200
+    python -m bench.load_test --server asgi --compare
+    python -m bench.load_test --endpoints resolve-market --saturate create-market
+
+Starts the stubs, then the API in a subprocess pointed at them. It then drives /discover-markets,
+/create-market and /resolve-market and reports latency percentiles, RPS, and the API process's
+CPU and peak RSS. With --saturate, another tenant floods an endpoint for the whole run, to check
+that admission control keeps the measured endpoints moving.
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import itertools
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench import baseline
+from bench.stubs import start_stub_servers
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ("discover-markets", "create-market", "resolve-market")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def payload(endpoint, i, web_url, distinct):
+    """Request body number `i`; with `distinct` every request has new inputs, so no cache can answer it."""
+    n = i if distinct else i % 4
+    if endpoint == "discover-markets":
+        return {"news_url": f"{web_url}/articles/{n}"}
+    if endpoint == "create-market":
+        return {"user_idea": f"Will event {n} happen this week", "market_type": "news"}
+    return {
+        "market_id": i,
+        "market_type": "news",
+        "title": f"Will event {n} happen this week?",
+        "description": "Benchmark market.",
+        "resolution_criteria": "Resolved from the sources.",
+        "outcome_categories": ["Yes", "No"],
+        "sources": [f"{web_url}/articles/{n}", f"{web_url}/articles/{n + 1}?size=250000", f"{web_url}/articles/{n + 2}"],
+    }
+
+def start_api(server, port, env):
+    """Starts server.py (threaded Flask) or asgi_server.py (hypercorn) and waits until it answers."""
+    if server == "asgi":
+        # Served in-process rather than via the hypercorn CLI, whose worker is a child process we could not sample
+        command = [sys.executable, "-c", (
+            "import asyncio, asgi_server; from hypercorn.config import Config; from hypercorn.asyncio import serve; "
+            f"config = Config(); config.bind = ['127.0.0.1:{port}']; asyncio.run(serve(asgi_server.app, config))"
+        )]
+    else:
+        command = [sys.executable, "-c", f"import server; server.app.run(port={port}, threaded=True)"]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API exited with code {process.returncode}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/metrics", timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("API did not start within 30s")
+
+class ProcessMonitor:
+    """Samples a process's CPU time and RSS from /proc (Linux); reports None elsewhere."""
+
+    def __init__(self, pid, interval=0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def cpu_seconds(self):
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS  # utime + stime
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def rss(self):
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return None
+
+    def __enter__(self):
+        self.cpu_start = self.cpu_seconds()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        end = self.cpu_seconds()
+        self.cpu = None if end is None or self.cpu_start is None else end - self.cpu_start
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = self.rss()
+            if rss is not None:
+                self.peak_rss = max(self.peak_rss or 0, rss)
+            self._stop.wait(self.interval)
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def drive(base_url, endpoint, count, concurrency, web_url, distinct):
+    """Sends `count` requests with `concurrency` in flight; returns (latencies, errors, wall seconds)."""
+    local = threading.local()
+
+    def one(i):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = local.session.post(f"{base_url}/{endpoint}", json=payload(endpoint, i, web_url, distinct),
+                                          timeout=120)
+            ok = response.status_code == 200 and "error" not in response.json()
+        except (requests.RequestException, ValueError):
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(count)))
+    wall = time.perf_counter() - started
+    return sorted(latency for latency, _ in results), sum(1 for _, ok in results if not ok), wall
+
+def flood(base_url, endpoint, concurrency, web_url, stop):
+    """Keeps `concurrency` distinct requests to `endpoint` in flight until `stop` is set, as a noisy tenant would."""
+    numbers = itertools.count(10 ** 6)
+
+    def worker():
+        session = requests.Session()
+        while not stop.is_set():
+            try:
+                session.post(f"{base_url}/{endpoint}", json=payload(endpoint, next(numbers), web_url, True),
+                             headers={"X-API-Key": "bench-flood"}, timeout=120)
+            except requests.RequestException:
+                pass
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=["flask", "asgi"], default="flask")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Stub LLM seconds per completion")
+    parser.add_argument("--web-latency", type=float, default=0.02, help="Stub web seconds per page")
+    parser.add_argument("--repeat-inputs", action="store_true",
+                        help="Reuse a handful of inputs so the caches and request coalescing are exercised")
+    parser.add_argument("--saturate", choices=ENDPOINTS, help="Endpoint another tenant floods during the run")
+    parser.add_argument("--saturate-concurrency", type=int, default=32, help="Flood requests in flight")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="Exit 1 if worse than the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    llm_url, web_url, stop_stubs = start_stub_servers(args.llm_latency, args.llm_latency / 4, args.web_latency)
+    port = free_port()
+    env = dict(
+        os.environ,
+        LLM_PROVIDER="openai",
+        OPENAI_BASE_URL=llm_url,
+        OPENAI_API_KEY="bench",
+        NEWS_SEARCH_URL=f"{web_url}/search",
+        PRICE_FEED_URL=f"{web_url}/price",
+        JOB_STORE_PATH=os.path.join(ROOT, "bench", "jobs-bench.sqlite3"),
+        AUDIT_STORE_PATH=os.path.join(ROOT, "bench", "audit-bench.sqlite3"),
+        LLM_CACHE_PATH="",
+        PAGE_CACHE_PATH="",
+        ADMISSION_API_KEYS="bench-flood",  # The flood's tenant; measured requests count as their address
+        MARKET_INDEX_PATH=":memory:",  # Fresh each run, so earlier runs' markets don't skip LLM calls
+    )
+    process = start_api(args.server, port, env)
+
+    results = {}
+    stop_flood = threading.Event()
+    flooders = []
+    try:
+        if args.saturate:
+            flooders = flood(f"http://127.0.0.1:{port}", args.saturate, args.saturate_concurrency, web_url, stop_flood)
+            time.sleep(1)  # Let the flood fill the LLM slots before measuring
+        for endpoint in args.endpoints:
+            with ProcessMonitor(process.pid) as monitor:
+                latencies, errors, wall = drive(f"http://127.0.0.1:{port}", endpoint, args.requests,
+                                                args.concurrency, web_url, not args.repeat_inputs)
+            results[endpoint] = {
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "rps": args.requests / wall,
+                "errors": errors,
+                "cpu_seconds": monitor.cpu,
+                "peak_rss_mb": monitor.peak_rss / 2 ** 20 if monitor.peak_rss else None,
+            }
+    finally:
+        stop_flood.set()
+        process.terminate()
+        process.wait()
+        for thread in flooders:
+            thread.join()
+        stop_stubs()
+
+    saturated = f", {args.saturate} flooded by {args.saturate_concurrency}" if args.saturate else ""
+    print(f"\n📊 {args.server}, concurrency {args.concurrency}, {args.requests} requests per endpoint, "
+          f"stub LLM latency {args.llm_latency}s{saturated}")
+    print(f"{'endpoint':<18}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'rps':>9}{'errors':>8}{'cpu s':>8}{'rss MB':>8}")
+    for endpoint, r in results.items():
+        cpu = f"{r['cpu_seconds']:.2f}" if r["cpu_seconds"] is not None else "n/a"
+        rss = f"{r['peak_rss_mb']:.0f}" if r["peak_rss_mb"] is not None else "n/a"
+        print(f"{endpoint:<18}{r['p50'] * 1000:>9.1f}{r['p95'] * 1000:>9.1f}{r['p99'] * 1000:>9.1f}"
+              f"{r['rps']:>9.1f}{r['errors']:>8}{cpu:>8}{rss:>8}")
+
+    suite = f"load-{args.server}" + (f"-saturated-{args.saturate}" if args.saturate else "")
+    if args.save_baseline:
+        baseline.save(suite, results)
+    if args.compare:
+        saved = baseline.load(suite)
+        if saved is None:
+            print(f"❌ No {suite} baseline saved yet; run with --save-baseline first")
+            return 1
+        metrics = {"p50": False, "p95": False, "p99": False, "rps": True, "cpu_seconds": False}
+        if baseline.compare(results, saved, metrics, args.tolerance):
+            return 1
+    return 1 if any(r["errors"] for r in results.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
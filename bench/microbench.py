@@ -0,0 +1,124 @@
+"""
+Microbenchmarks of hot paths that do not need the API running.
+
+    python -m bench.microbench
+    python -m bench.microbench --save-baseline
+    python -m bench.microbench --compare
+
+Covers `fetch_resolution_data` against the stub web server (page cache off and warm), the
+LLM JSON cleanup, parse and schema validation path, and near-duplicate lookups in a market index
+of INDEXED_MARKETS synthetic markets.
+"""
+import io
+import sys
+import time
+import json
+import random
+import argparse
+import statistics
+from contextlib import redirect_stdout
+
+from bench import baseline
+from bench.stubs import start_stub_servers, MARKET_ANSWER
+
+import scraping_tools
+from page_cache import page_cache
+from llm_json import clean_llm_json, parse_llm_json
+from market_schema import NEWS_MARKET
+from market_index import MarketIndex, market_text
+
+FENCED_MARKET = "```json\n" + json.dumps(MARKET_ANSWER, indent=4) + "\n```"
+FENCED_DISCOVERY = "```json\n" + json.dumps({"markets": [MARKET_ANSWER] * 3}, indent=4) + "\n```"
+INVALID = "Sure! Here is your market: {\"title\": \"unterminated"
+INDEXED_MARKETS = 20000
+
+def synthetic_index(size=INDEXED_MARKETS):
+    """An in-memory market index of `size` markets drawn from a Zipf-like 5000-word vocabulary."""
+    rng = random.Random(0)
+    vocabulary = [f"term{n}" for n in range(5000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    index = MarketIndex(":memory:")
+    for _ in range(size):
+        words = rng.choices(vocabulary, weights, k=30)
+        index.add({"title": " ".join(words[:10]), "description": " ".join(words[10:])}, "news")
+    return index
+
+def measure(fn, repeat, number):
+    """Returns per-call seconds (best and median over `repeat` rounds of `number` calls)."""
+    rounds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - started) / number)
+    return {"best": min(rounds), "median": statistics.median(rounds)}
+
+def quiet(fn):
+    """Runs `fn` with its debug prints discarded, so the terminal does not dominate the timing."""
+    def run():
+        with redirect_stdout(io.StringIO()):
+            return fn()
+    return run
+
+def cases(web_url):
+    urls = [f"{web_url}/articles/{i}?size={size}" for i, size in enumerate((20000, 60000, 250000, 60000))]
+    cache_bytes = page_cache.max_bytes
+    index = quiet(synthetic_index)()
+    indexed = market_text(index.get(INDEXED_MARKETS // 2))
+    story = " ".join([indexed] + ["the market said on monday that officials would announce a decision"] * 20)
+
+    def fetch_cold():
+        page_cache.max_bytes = 0
+        try:
+            return scraping_tools.fetch_resolution_data(urls)
+        finally:
+            page_cache.max_bytes = cache_bytes
+
+    def fetch_cached():
+        return scraping_tools.fetch_resolution_data(urls)
+
+    return {
+        "fetch_resolution_data_cold": (quiet(fetch_cold), 5),
+        "fetch_resolution_data_cached": (quiet(fetch_cached), 200),
+        "clean_llm_json": (lambda: clean_llm_json(FENCED_DISCOVERY), 20000),
+        "parse_llm_json_market": (quiet(lambda: parse_llm_json(FENCED_MARKET)), 5000),
+        "parse_llm_json_discovery": (quiet(lambda: parse_llm_json(FENCED_DISCOVERY)), 5000),
+        "parse_llm_json_invalid": (quiet(lambda: parse_llm_json(INVALID)), 5000),
+        "validate_market": (lambda: NEWS_MARKET.errors(MARKET_ANSWER), 20000),
+        "market_index_idea": (lambda: index.search(indexed.split("\n")[0], "query", ("news",), 0.8, 1), 200),
+        "market_index_story": (lambda: index.search(story, "market", None, 0.6), 200),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--web-latency", type=float, default=0.0, help="Stub web seconds per page")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="Exit 1 if slower than the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    _, web_url, stop_stubs = start_stub_servers(web_latency=args.web_latency)
+    results = {}
+    try:
+        for name, (fn, number) in cases(web_url).items():
+            fn()  # Warm up connections and caches
+            results[name] = measure(fn, args.repeat, number)
+            print(f"⏱️ {name:<32} best {results[name]['best'] * 1e6:>12.1f} µs   "
+                  f"median {results[name]['median'] * 1e6:>12.1f} µs")
+    finally:
+        stop_stubs()
+
+    if args.save_baseline:
+        baseline.save("micro", results)
+    if args.compare:
+        saved = baseline.load("micro")
+        if saved is None:
+            print("❌ No micro baseline saved yet; run with --save-baseline first")
+            return 1
+        if baseline.compare(results, saved, {"median": False}, args.tolerance):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Startup benchmark: import time and resident memory of a fresh worker.
+
+    python -m bench.startup_bench
+    python -m bench.startup_bench --module asgi_server --runs 10 --profile
+    python -m bench.startup_bench --save-baseline
+    python -m bench.startup_bench --compare
+
+Each run imports the server module in a new interpreter, as a gunicorn/hypercorn worker or a
+systemd restart would, and reports the import time, RSS and number of loaded modules. Exits 1
+when the median exceeds the budget (STARTUP_BUDGETS, or --max-import-ms / --max-rss-mb), or with
+--compare when it regressed against the saved baseline. There is no test suite to enforce the
+budget, so run this as a CI step.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from bench import baseline
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Median budgets per worker module; raise them deliberately, not to make a regression pass
+STARTUP_BUDGETS = {
+    "server": {"import_ms": 425, "rss_mb": 50},
+    "asgi_server": {"import_ms": 500, "rss_mb": 55},
+}
+
+CHILD = """
+import sys, time, json
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+rss = None
+try:
+    with open("/proc/self/status") as f:
+        rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS:"))
+except OSError:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+report = {{"import_seconds": seconds, "rss": rss, "modules": len(sys.modules)}}
+sys.__stdout__.write("\\nSTARTUP " + json.dumps(report) + "\\n")
+sys.__stdout__.flush()
+import os
+os._exit(0)  # Skip interpreter teardown and the price feed thread
+"""
+
+def worker_env(workdir):
+    """An environment that keeps the import offline and its SQLite files out of the repository."""
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+        "PRICE_FEED_URL": "http://127.0.0.1:9/",
+        "LLM_PROVIDER": env.get("LLM_PROVIDER", "stub"),
+        "JOB_STORE_PATH": os.path.join(workdir, "jobs.sqlite3"),
+        "NEWS_SEEN_PATH": os.path.join(workdir, "news_seen.sqlite3"),
+        "AUDIT_STORE_PATH": os.path.join(workdir, "audit.sqlite3"),
+    })
+    return env
+
+def run_once(module, workdir, profile=False):
+    """Imports `module` in a new interpreter; returns its measurements and its -X importtime output if profiled."""
+    command = [sys.executable] + (["-X", "importtime"] if profile else []) + ["-c", CHILD.format(module=module)]
+    result = subprocess.run(
+        command, cwd=workdir, env=worker_env(workdir), capture_output=True, text=True, timeout=120
+    )
+    line = next((line for line in result.stdout.splitlines() if line.startswith("STARTUP ")), None)
+    if line is None:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return json.loads(line[len("STARTUP "):]), result.stderr
+
+def slowest_imports(importtime, top=15):
+    """The top-level packages that took longest to import, from -X importtime output."""
+    packages = []
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Direct imports of the imported module are indented by one level below it
+        if cumulative.strip().isdigit() and name.startswith("   ") and not name.startswith("     "):
+            packages.append((int(cumulative) / 1000, name.strip()))
+    return sorted(packages, reverse=True)[:top]
+
+def measure(module, runs, profile=False):
+    with tempfile.TemporaryDirectory() as workdir:
+        run_once(module, workdir)  # Warm the filesystem and bytecode caches
+        samples = [run_once(module, workdir)[0] for _ in range(runs)]
+        if profile:
+            print(f"🔍 Slowest imports of {module} (cumulative ms):")
+            for ms, name in slowest_imports(run_once(module, workdir, profile=True)[1]):
+                print(f"   {ms:>8.1f}  {name}")
+    return {
+        "import_ms": statistics.median(sample["import_seconds"] for sample in samples) * 1000,
+        "rss_mb": statistics.median(sample["rss"] for sample in samples) / 2 ** 20,
+        "modules": statistics.median(sample["modules"] for sample in samples),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", action="append", choices=sorted(STARTUP_BUDGETS),
+                        help="Worker module to import (default: all)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--profile", action="store_true", help="Also list the slowest imports")
+    parser.add_argument("--max-import-ms", type=float, help="Override the import time budget")
+    parser.add_argument("--max-rss-mb", type=float, help="Override the RSS budget")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="Exit 1 if slower than the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    results, over_budget = {}, []
+    for module in args.module or sorted(STARTUP_BUDGETS):
+        results[module] = measure(module, args.runs, args.profile)
+        budget = dict(STARTUP_BUDGETS[module])
+        if args.max_import_ms:
+            budget["import_ms"] = args.max_import_ms
+        if args.max_rss_mb:
+            budget["rss_mb"] = args.max_rss_mb
+        for metric, limit in budget.items():
+            value = results[module][metric]
+            flag = "❌" if value > limit else "✅"
+            print(f"{flag} {module:<12} {metric:<10} {value:>8.1f} (budget {limit})")
+            if value > limit:
+                over_budget.append((module, metric))
+        print(f"   {module:<12} modules    {results[module]['modules']:>8.0f}")
+
+    if args.save_baseline:
+        baseline.save("startup", results)
+    if args.compare:
+        saved = baseline.load("startup")
+        if saved is None:
+            print("❌ No startup baseline saved yet; run with --save-baseline first")
+            return 1
+        if baseline.compare(results, saved, {"import_ms": False, "rss_mb": False}, args.tolerance):
+            return 1
+    return 1 if over_budget else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
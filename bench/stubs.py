@@ -0,0 +1,208 @@
+"""
+Local stand-ins for the services the API depends on, so benchmarks never spend tokens or hit live sites.
+
+    python -m bench.stubs --llm-latency 0.5
+
+starts both servers and prints their URLs. `start_stub_servers()` does the same in-process.
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+# Canned answers, picked by what the prompt asks for
+RESOLUTION_ANSWER = "1"
+MARKET_ANSWER = {
+    "title": "Will the benchmark event happen by Friday?",
+    "description": "A synthetic market produced by the stub LLM. It has the shape of a real answer.",
+    "outcome_categories": ["Yes", "No"],
+    "market_sector": "technology",
+    "resolution_criteria": "Resolved from the stub news site.",
+    "earliest_resolution_date": "2099-01-01",
+    "sources": ["https://example.com/a", "https://example.com/b"],
+}
+
+# Filler for generated pages: roughly the word mix of a news article
+WORDS = (
+    "the market said on monday that officials would announce a decision after the vote "
+    "analysts expect prices to rise as investors weigh the latest report from regulators"
+).split()
+
+def stub_completion(prompt):
+    """Returns the text a real model would plausibly give for one of the app's prompts."""
+    if "single integer" in prompt:
+        return RESOLUTION_ANSWER
+    if '"markets"' in prompt:
+        return "```json\n" + json.dumps({"markets": [MARKET_ANSWER]}, indent=4) + "\n```"
+    return "```json\n" + json.dumps(MARKET_ANSWER, indent=4) + "\n```"
+
+def article_html(seed, size):
+    """A deterministic news-like page of about `size` bytes: head, nav, scripts, then paragraphs."""
+    rng = random.Random(seed)
+    head = (
+        f"<!DOCTYPE html><html><head><title>Stub article {seed}</title>"
+        "<script>" + "var tracking = 1;" * 200 + "</script>"
+        "<style>" + "p { margin: 0 }" * 100 + "</style></head><body>"
+        "<nav>" + "".join(f"<a href='/section/{i}'>Section {i}</a>" for i in range(30)) + "</nav><article>"
+    )
+    parts = [head]
+    length = len(head)
+    while length < size:
+        paragraph = "<p>" + " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120))).capitalize() + ".</p>"
+        parts.append(paragraph)
+        length += len(paragraph)
+    parts.append("</article><footer>Stub news</footer></body></html>")
+    return "".join(parts)
+
+def search_html(query):
+    """A Google News-like results page with ten headlines."""
+    items = "".join(
+        f"<article><h3><a href='./articles/{i}'>{query} headline {i}</a></h3></article>" for i in range(10)
+    )
+    return f"<html><body>{items}</body></html>"
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real services
+    latency = 0.0
+    jitter = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _sleep(self):
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _send(self, status, body, content_type):
+        body = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # Scrapers hang up once they have enough text
+
+class StubLLMHandler(_Handler):
+    """OpenAI/DeepSeek-compatible `/completions` and `/chat/completions`, streamed when asked to."""
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+        chat = self.path.rstrip("/").endswith("/chat/completions")
+        if chat:
+            prompt = "\n".join(message.get("content", "") for message in payload.get("messages", []))
+        else:
+            prompt = payload.get("prompt", "")
+        text = stub_completion(prompt)
+        if payload.get("stream"):
+            self._stream(text, chat)
+            return
+
+        self._sleep()
+        choice = {"index": 0, "finish_reason": "stop"}
+        if chat:
+            choice["message"] = {"role": "assistant", "content": text}
+        else:
+            choice["text"] = text
+        body = {
+            "id": "stub",
+            "object": "chat.completion" if chat else "text_completion",
+            "model": payload.get("model", "stub"),
+            "choices": [choice],
+            # Roughly four characters per token
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4},
+        }
+        self._send(200, json.dumps(body), "application/json")
+
+    def _stream(self, text, chat, size=8):
+        """Sends `text` as server-sent events, spreading it over the configured latency like a real model."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        pieces = [text[start:start + size] for start in range(0, len(text), size)]
+        try:
+            for piece in pieces:
+                delta = {"delta": {"content": piece}} if chat else {"text": piece}
+                self._chunk(f"data: {json.dumps({'choices': [dict(index=0, **delta)]})}\n\n")
+                time.sleep(self.latency / len(pieces))
+            self._chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # The client cancelled the generation
+
+    def _chunk(self, data):
+        data = data.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+class StubWebHandler(_Handler):
+    """
+    News pages and price quotes:
+    `/articles/<n>?size=<bytes>`, `/search?q=...` and a CoinGecko-style `/price?ids=...`.
+    """
+    page_size = 60000
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        self._sleep()
+
+        if url.path.startswith("/articles/"):
+            size = int(query.get("size", [self.page_size])[0])
+            self._send(200, article_html(url.path, size), "text/html; charset=utf-8")
+        elif url.path == "/search":
+            self._send(200, search_html(query.get("q", [""])[0]), "text/html; charset=utf-8")
+        elif url.path == "/price":
+            ids = query.get("ids", [""])[0].split(",")
+            quotes = {asset: {"usd": round(100 + random.random() * 10, 2)} for asset in ids if asset}
+            self._send(200, json.dumps(quotes), "application/json")
+        else:
+            self._send(404, "Not found", "text/plain")
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def _serve(handler, latency, jitter, **attrs):
+    handler = type(handler.__name__, (handler,), dict(latency=latency, jitter=jitter, **attrs))
+    server = _Server(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def start_stub_servers(llm_latency=0.2, llm_jitter=0.05, web_latency=0.02, page_size=StubWebHandler.page_size):
+    """
+    Starts the stub LLM and web servers on free local ports.
+    Returns (llm_url, web_url, stop) where `stop()` shuts both down.
+    """
+    llm = _serve(StubLLMHandler, llm_latency, llm_jitter)
+    web = _serve(StubWebHandler, web_latency, web_latency / 4, page_size=page_size)
+
+    def stop():
+        for server in (llm, web):
+            server.shutdown()
+            server.server_close()
+
+    return f"http://127.0.0.1:{llm.server_port}/v1", f"http://127.0.0.1:{web.server_port}", stop
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per completion")
+    parser.add_argument("--web-latency", type=float, default=0.02, help="Seconds per page")
+    parser.add_argument("--page-size", type=int, default=StubWebHandler.page_size, help="Bytes per article")
+    args = parser.parse_args()
+
+    llm_url, web_url, _ = start_stub_servers(args.llm_latency, args.llm_latency / 4, args.web_latency, args.page_size)
+    print(f"🔹 Stub LLM: OPENAI_BASE_URL={llm_url}")
+    print(f"🔹 Stub web: {web_url}/articles/1, NEWS_SEARCH_URL={web_url}/search, PRICE_FEED_URL={web_url}/price")
+    threading.Event().wait()
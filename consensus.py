@@ -0,0 +1,165 @@
+"""
+Consensus resolution: the same resolution prompt is sent to several models (or several samples of
+one model) at once, and the answer is returned as soon as a quorum agrees on an outcome.
+Calls still pending at that point are cancelled.
+"""
+import os
+import time
+import asyncio
+import contextvars
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import llm_providers
+from llm_tools_resolution import get_llm_response, aget_llm_response, build_resolution_prompt
+from metrics import Counter as MetricCounter
+
+CONSENSUS_MODELS = os.getenv("CONSENSUS_MODELS", "")  # Comma-separated "provider" or "provider:model" voters
+CONSENSUS_SAMPLES = int(os.getenv("CONSENSUS_SAMPLES", "1"))  # Votes asked of each model
+CONSENSUS_TEMPERATURE = float(os.getenv("CONSENSUS_TEMPERATURE", "0.7"))  # Sampling temperature when samples > 1
+CONSENSUS_QUORUM = int(os.getenv("CONSENSUS_QUORUM", "0"))  # Matching votes needed (0 means a majority)
+
+CONSENSUS_VOTES = MetricCounter(
+    "bigmarket_consensus_votes_total", "Consensus votes by status: counted, abstained or cancelled.", ["status"]
+)
+CONSENSUS_RESULTS = MetricCounter(
+    "bigmarket_consensus_results_total", "Consensus resolutions by whether a quorum agreed.", ["result"]
+)
+
+def consensus_options(options):
+    """
+    Expands the `consensus` field of a market payload (true, or {"models", "samples", "quorum"})
+    into (members, quorum). Each member is a (provider, model, params) vote. Raises ValueError for
+    an unknown provider or an impossible quorum.
+    """
+    options = options if isinstance(options, dict) else {}
+    models = options.get("models") or [spec for spec in CONSENSUS_MODELS.split(",") if spec.strip()]
+    models = models or [llm_providers.LLM_PROVIDER]
+    samples = max(1, int(options.get("samples") or CONSENSUS_SAMPLES))
+
+    members = []
+    for spec in models:
+        provider, _, model = spec.strip().partition(":")
+        llm_providers.get_provider(provider)
+        # Repeated samples only differ when the model samples
+        params = {"temperature": CONSENSUS_TEMPERATURE} if samples > 1 else {}
+        members.extend((provider.lower(), model or None, params) for _ in range(samples))
+
+    quorum = int(options.get("quorum") or CONSENSUS_QUORUM) or len(members) // 2 + 1
+    if not 1 <= quorum <= len(members):
+        raise ValueError(f"Quorum must be between 1 and {len(members)}")
+    return members, quorum
+
+def _outcome(ai_response, outcome_count):
+    """The voted outcome index, or None for an error or an index outside the outcome list."""
+    ai_response = ai_response.strip()
+    if not ai_response.isdigit() or int(ai_response) >= outcome_count:
+        return None
+    return int(ai_response)
+
+class Tally:
+    """Counts votes and decides when the outcome can no longer change."""
+
+    def __init__(self, members, quorum, outcome_count):
+        self.members = members
+        self.quorum = quorum
+        self.outcome_count = outcome_count
+        self.votes = [None] * len(members)
+        self.counts = Counter()
+
+    def add(self, index, ai_response, seconds):
+        provider, model, _ = self.members[index]
+        outcome = _outcome(ai_response, self.outcome_count)
+        self.votes[index] = {
+            "provider": provider, "model": model or llm_providers.get_provider(provider).model,
+            "ai_response": ai_response, "outcome": outcome, "seconds": round(seconds, 4)
+        }
+        if outcome is None:
+            CONSENSUS_VOTES.inc(status="abstained")
+        else:
+            CONSENSUS_VOTES.inc(status="counted")
+            self.counts[outcome] += 1
+
+    def decided(self):
+        """True once an outcome has a quorum, or once no outcome can still reach one."""
+        pending = self.votes.count(None)
+        leading = self.counts.most_common(1)[0][1] if self.counts else 0
+        return leading >= self.quorum or leading + pending < self.quorum
+
+    def result(self, prompt):
+        """The (prompt, ai_response, outcome_index, model) resolution and the vote report."""
+        winner = next((outcome for outcome, count in self.counts.most_common(1) if count >= self.quorum), None)
+        cast = [vote for vote in self.votes if vote is not None]
+        for index, vote in enumerate(self.votes):
+            if vote is None:
+                provider, model, _ = self.members[index]
+                model = model or llm_providers.get_provider(provider).model
+                self.votes[index] = {"provider": provider, "model": model, "cancelled": True}
+                CONSENSUS_VOTES.inc(status="cancelled")
+        CONSENSUS_RESULTS.inc(result="agreed" if winner is not None else "no_quorum")
+
+        counted = sum(self.counts.values())
+        report = {
+            "quorum": self.quorum,
+            "agreed": winner is not None,
+            "counts": {str(outcome): count for outcome, count in sorted(self.counts.items())},
+            "agreement": round(self.counts[winner] / counted, 4) if winner is not None else 0,
+            "votes": self.votes,
+        }
+        if winner is None:
+            print(f"⚠️ No consensus: {report['counts']} with quorum {self.quorum}")
+            return (prompt, "NO_CONSENSUS", -1, "consensus"), report
+        ai_response = next(vote["ai_response"] for vote in cast if vote["outcome"] == winner)
+        print(f"✅ Consensus on outcome {winner}: {report['counts']} with quorum {self.quorum}")
+        return (prompt, ai_response, winner, "consensus"), report
+
+def _vote(prompt, member):
+    provider, model, params = member
+    started = time.perf_counter()
+    ai_response = get_llm_response(prompt, provider, model, **params)
+    return ai_response, time.perf_counter() - started
+
+async def _avote(prompt, member):
+    provider, model, params = member
+    started = time.perf_counter()
+    ai_response = await aget_llm_response(prompt, provider, model, **params)
+    return ai_response, time.perf_counter() - started
+
+def get_consensus_resolution(options, market_title, description, resolution_criteria, outcome_categories, evidence):
+    """
+    Asks every consensus member at once and returns as soon as the outcome is decided.
+    Blocking calls can't be interrupted, so undecided ones finish in the background and are ignored.
+    """
+    members, quorum = consensus_options(options)
+    prompt = build_resolution_prompt(market_title, description, resolution_criteria, outcome_categories, evidence)
+    tally = Tally(members, quorum, len(outcome_categories))
+
+    pool = ThreadPoolExecutor(max_workers=len(members), thread_name_prefix="consensus")
+    try:
+        pending = {pool.submit(contextvars.copy_context().run, _vote, prompt, member): index
+                   for index, member in enumerate(members)}
+        while pending and not tally.decided():
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                tally.add(pending.pop(future), *future.result())
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return tally.result(prompt)
+
+async def aget_consensus_resolution(options, market_title, description, resolution_criteria, outcome_categories,
+                                    evidence):
+    """Async `get_consensus_resolution`; undecided calls are cancelled mid-request."""
+    members, quorum = consensus_options(options)
+    prompt = build_resolution_prompt(market_title, description, resolution_criteria, outcome_categories, evidence)
+    tally = Tally(members, quorum, len(outcome_categories))
+
+    pending = {asyncio.ensure_future(_avote(prompt, member)): index for index, member in enumerate(members)}
+    try:
+        while pending and not tally.decided():
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                tally.add(pending.pop(task), *task.result())
+    finally:
+        for task in pending:
+            task.cancel()
+    return tally.result(prompt)
@@ -0,0 +1,176 @@
+import os
+import re
+import math
+from collections import Counter
+
+from metrics import timed
+
+# Evidence compaction settings
+EVIDENCE_TOKEN_BUDGET = int(os.getenv("EVIDENCE_TOKEN_BUDGET", "1200"))  # Tokens of evidence per resolution prompt
+EVIDENCE_PASSAGE_TOKENS = int(os.getenv("EVIDENCE_PASSAGE_TOKENS", "120"))  # Longer passages are split
+EVIDENCE_MIN_PASSAGE_TOKENS = int(os.getenv("EVIDENCE_MIN_PASSAGE_TOKENS", "6"))  # Shorter ones are boilerplate
+EVIDENCE_DEDUP_THRESHOLD = float(os.getenv("EVIDENCE_DEDUP_THRESHOLD", "0.8"))  # Shingle overlap that counts as a copy
+
+# Approximates BPE tokens: words, numbers and individual punctuation marks
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+WORD_PATTERN = re.compile(r"\w+")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# Left out of relevance queries; they match every passage
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "if", "in", "is", "it",
+    "its", "of", "on", "or", "that", "the", "this", "to", "was", "were", "will", "with", "which", "who",
+    "what", "when", "market", "resolve", "resolved", "resolves", "outcome", "based",
+}
+
+def count_tokens(text):
+    """Estimates the LLM tokens in `text` without a model-specific tokenizer."""
+    return len(TOKEN_PATTERN.findall(text))
+
+def terms(text):
+    """Lowercased words used for ranking and deduplication."""
+    return WORD_PATTERN.findall(text.lower())
+
+class Passage:
+    __slots__ = ("source", "position", "text", "tokens", "terms")
+
+    def __init__(self, source, position, text):
+        self.source = source
+        self.position = position
+        self.text = text
+        self.tokens = count_tokens(text)
+        self.terms = terms(text)
+
+def split_passage(text, max_tokens=EVIDENCE_PASSAGE_TOKENS):
+    """Splits a long block at sentence boundaries into pieces of at most about `max_tokens`."""
+    if count_tokens(text) <= max_tokens:
+        return [text]
+
+    pieces, current, current_tokens = [], [], 0
+    for sentence in SENTENCE_END.split(text):
+        sentence_tokens = count_tokens(sentence)
+        if current and current_tokens + sentence_tokens > max_tokens:
+            pieces.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(sentence)
+        current_tokens += sentence_tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+def join_short_blocks(blocks, min_tokens=EVIDENCE_MIN_PASSAGE_TOKENS, max_tokens=EVIDENCE_PASSAGE_TOKENS):
+    """
+    Joins runs of adjacent blocks shorter than `min_tokens`, such as table cells and list items,
+    into " | "-separated passages of up to about `max_tokens`, so a row like "Lakers | 112 | Celtics | 108"
+    is not mistaken for boilerplate. A short block on its own stays short.
+    """
+    joined, run, run_tokens = [], [], 0
+    for block in blocks:
+        tokens = count_tokens(block)
+        if run and (tokens >= min_tokens or run_tokens + tokens > max_tokens):
+            joined.append(" | ".join(run))
+            run, run_tokens = [], 0
+        if tokens >= min_tokens:
+            joined.append(block)
+        else:
+            run.append(block)
+            run_tokens += tokens + 1  # The separator
+    if run:
+        joined.append(" | ".join(run))
+    return joined
+
+def _shingles(words, size=3):
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def dedupe(passages, threshold=EVIDENCE_DEDUP_THRESHOLD):
+    """
+    Drops passages whose word shingles mostly repeat an earlier passage's, e.g. the same wire story
+    syndicated across sources or a page's repeated teaser text.
+    """
+    kept, kept_shingles, seen = [], [], set()
+    for passage in passages:
+        key = " ".join(passage.terms)
+        if key in seen:
+            continue
+        shingles = _shingles(passage.terms)
+        if any(len(shingles & other) / min(len(shingles), len(other)) >= threshold for other in kept_shingles):
+            continue
+        seen.add(key)
+        kept.append(passage)
+        kept_shingles.append(shingles)
+    return kept
+
+class BM25:
+    """Okapi BM25 over a small in-memory set of passages."""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.frequencies = [Counter(document) for document in documents]
+        self.lengths = [len(document) for document in documents]
+        self.average_length = sum(self.lengths) / len(documents) if documents else 0
+        document_frequency = Counter(term for document in documents for term in set(document))
+        count = len(documents)
+        self.idf = {
+            term: math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def scores(self, query):
+        """Returns one relevance score per document for the query terms."""
+        query = [term for term in set(query) if term in self.idf]
+        scores = []
+        for frequencies, length in zip(self.frequencies, self.lengths):
+            normalisation = self.k1 * (1 - self.b + self.b * length / (self.average_length or 1))
+            scores.append(sum(
+                self.idf[term] * frequencies[term] * (self.k1 + 1) / (frequencies[term] + normalisation)
+                for term in query if term in frequencies
+            ))
+        return scores
+
+def market_query(data):
+    """The terms a resolution depends on: title, resolution criteria and outcome names."""
+    text = " ".join([data.get("title", ""), data.get("resolution_criteria", ""),
+                     " ".join(data.get("outcome_categories") or [])])
+    return [term for term in terms(text) if term not in STOPWORDS]
+
+@timed("evidence")
+def compact_evidence(sources, pages, query, budget=EVIDENCE_TOKEN_BUDGET):
+    """
+    Builds the evidence text for a resolution prompt from {url: [passage, ...]}.
+    Short blocks (cells, list items) are joined with their neighbours, passages are deduplicated across sources, ranked by BM25 against `query`, and added best-first
+    until `budget` tokens are used. The kept passages are returned in page order, grouped by source.
+    """
+    passages = []
+    for source in dict.fromkeys(sources):
+        position = 0
+        for block in join_short_blocks(pages.get(source) or []):
+            for piece in split_passage(block):
+                passage = Passage(source, position, piece)
+                position += 1
+                if passage.tokens >= EVIDENCE_MIN_PASSAGE_TOKENS:
+                    passages.append(passage)
+
+    total_tokens = sum(passage.tokens for passage in passages)
+    passages = dedupe(passages)
+    if not passages:
+        return ""
+
+    scores = BM25([passage.terms for passage in passages]).scores(query)
+    # Best match first; ties (e.g. no query overlap) keep the lead of each page first
+    ranked = sorted(range(len(passages)), key=lambda i: (-scores[i], passages[i].position))
+
+    selected, used = [], 0
+    for i in ranked:
+        if used + passages[i].tokens > budget:
+            continue
+        selected.append(passages[i])
+        used += passages[i].tokens
+
+    source_order = {source: index for index, source in enumerate(dict.fromkeys(sources))}
+    selected.sort(key=lambda passage: (source_order[passage.source], passage.position))
+    print(f"🔹 Evidence: kept {len(selected)} of {len(passages)} passages, "
+          f"{used} of {total_tokens} tokens (budget {budget})")
+    return "\n".join(passage.text for passage in selected)
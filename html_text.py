@@ -0,0 +1,211 @@
+import codecs
+import os
+import time
+from html.parser import HTMLParser
+from metrics import record_stage
+
+SCRAPE_MAX_BYTES = int(os.getenv("SCRAPE_MAX_BYTES", str(2 * 1024 * 1024)))  # Stop downloading a page after this
+SCRAPE_CHUNK_SIZE = 16 * 1024
+
+# Content that is never visible text worth keeping
+SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg", "nav", "footer", "aside", "iframe"}
+# Tags whose boundaries separate words
+BLOCK_TAGS = {"p", "div", "br", "li", "td", "th", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "title",
+              "section", "article", "header", "blockquote", "pre", "table", "ul", "ol", "dd", "dt"}
+# Marks block boundaries in collected text; str.split() treats it as whitespace
+BLOCK_BREAK = "\x1e"
+
+class TextCollector:
+    """
+    Receives parser callbacks and keeps only what the caller asked for:
+    up to `max_chars` of visible text, the <title>, and the first `max_paragraphs` <p> texts.
+    """
+
+    def __init__(self, max_chars=0, max_paragraphs=0, want_title=False):
+        self.max_chars = max_chars
+        self.max_paragraphs = max_paragraphs
+        self.want_title = want_title
+        self.title = None
+        self.paragraphs = []
+        self._text = []
+        self._text_len = 0
+        self._skip_depth = 0
+        self._title_parts = None
+        self._paragraph_parts = None
+
+    @property
+    def text(self):
+        return " ".join("".join(self._text).split())[:self.max_chars]
+
+    @property
+    def passages(self):
+        """The visible text split at block boundaries (paragraphs, headings, list items, cells)."""
+        passages = []
+        remaining = self.max_chars
+        for block in "".join(self._text).split(BLOCK_BREAK):
+            block = " ".join(block.split())[:remaining]
+            if block:
+                passages.append(block)
+                remaining -= len(block) + 1
+            if remaining <= 0:
+                break
+        return passages
+
+    @property
+    def done(self):
+        """True once every requested piece has been collected."""
+        return (self._text_len >= self.max_chars
+                and len(self.paragraphs) >= self.max_paragraphs
+                and (self.title is not None or not self.want_title))
+
+    def start(self, tag, attrs=None):
+        tag = tag.lower()
+        if tag in BLOCK_TAGS and self._text_len < self.max_chars:
+            self._text.append(BLOCK_BREAK)
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag == "title" and self.want_title and self.title is None:
+            self._title_parts = []
+        elif tag == "p" and not self._skip_depth and len(self.paragraphs) < self.max_paragraphs:
+            self._finish_paragraph()  # <p> implicitly closes an open paragraph
+            self._paragraph_parts = []
+
+    def end(self, tag):
+        tag = tag.lower()
+        if tag in BLOCK_TAGS and self._text_len < self.max_chars:
+            self._text.append(BLOCK_BREAK)
+        if tag in SKIPPED_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif tag == "title" and self._title_parts is not None:
+            self.title = "".join(self._title_parts).strip()
+            self._title_parts = None
+        elif tag == "p":
+            self._finish_paragraph()
+
+    def data(self, text):
+        if self._skip_depth:
+            return
+        if self._title_parts is not None:
+            self._title_parts.append(text)
+            return
+        if self._paragraph_parts is not None:
+            self._paragraph_parts.append(text)
+        if self._text_len < self.max_chars:
+            self._text.append(text)
+            self._text_len += len(" ".join(text.split()))
+
+    def close(self):
+        self._finish_paragraph()
+
+    def _finish_paragraph(self):
+        if self._paragraph_parts is not None:
+            paragraph = "".join(self._paragraph_parts).strip()
+            if paragraph:
+                self.paragraphs.append(paragraph)
+            self._paragraph_parts = None
+
+class _StdlibParser(HTMLParser):
+    """Forwards html.parser callbacks to a TextCollector."""
+
+    def __init__(self, collector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, attrs)
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+_etree = None
+
+def _lxml_etree():
+    """lxml's etree (the faster C parser) if installed, else False; imported on the first page, not at startup."""
+    global _etree
+    if _etree is None:
+        try:
+            from lxml import etree
+        except ImportError:
+            etree = False
+        _etree = etree
+    return _etree
+
+def _new_parser(collector):
+    """Returns a push parser feeding `collector`, preferring lxml when available."""
+    etree = _lxml_etree()
+    if etree:
+        return etree.HTMLParser(target=collector, recover=True)
+    return _StdlibParser(collector)
+
+def _encoding(declared):
+    """Uses the declared charset, falling back to UTF-8 rather than requests' ISO-8859-1 default."""
+    if declared:
+        try:
+            return codecs.lookup(declared).name
+        except LookupError:
+            pass
+    return "utf-8"
+
+class _Extraction:
+    """Decodes and parses body chunks as they arrive, up to a byte cap."""
+
+    def __init__(self, collector, encoding, max_bytes):
+        self.collector = collector
+        self.parser = _new_parser(collector)
+        self.decoder = codecs.getincrementaldecoder(_encoding(encoding))(errors="replace")
+        self.max_bytes = max_bytes
+        self.received = 0
+        self.parse_seconds = 0.0  # CPU spent parsing, excluding time waiting on the network
+
+    def feed(self, chunk):
+        """Parses one chunk; returns True once no more input is needed."""
+        started = time.perf_counter()
+        chunk = chunk[:self.max_bytes - self.received]
+        self.received += len(chunk)
+        self.parser.feed(self.decoder.decode(chunk))
+        self.parse_seconds += time.perf_counter() - started
+        return self.collector.done or self.received >= self.max_bytes
+
+    def close(self):
+        """Flushes the decoder and the parser, which hold back text after the last tag."""
+        started = time.perf_counter()
+        self.parser.feed(self.decoder.decode(b"", final=True))  # Also keeps lxml from rejecting an empty body
+        self.parser.close()
+        self.parse_seconds += time.perf_counter() - started
+
+def extract(response, max_chars=0, max_paragraphs=0, want_title=False, max_bytes=SCRAPE_MAX_BYTES):
+    """
+    Streams a `requests` response (opened with stream=True) through an incremental parser.
+    Reading stops as soon as the collector has what it needs or `max_bytes` have been read.
+    """
+    collector = TextCollector(max_chars, max_paragraphs, want_title)
+    declared = response.encoding if "charset" in response.headers.get("Content-Type", "").lower() else None
+    extraction = _Extraction(collector, declared, max_bytes)
+    try:
+        for chunk in response.iter_content(chunk_size=SCRAPE_CHUNK_SIZE):
+            if extraction.feed(chunk):
+                break
+    finally:
+        response.close()  # Drops the rest of the body
+    extraction.close()
+    collector.close()
+    record_stage("html_parse", extraction.parse_seconds)
+    return collector
+
+async def aextract(response, max_chars=0, max_paragraphs=0, want_title=False, max_bytes=SCRAPE_MAX_BYTES):
+    """`extract` for a streamed httpx response."""
+    collector = TextCollector(max_chars, max_paragraphs, want_title)
+    extraction = _Extraction(collector, response.charset_encoding, max_bytes)
+    try:
+        async for chunk in response.aiter_bytes(chunk_size=SCRAPE_CHUNK_SIZE):
+            if extraction.feed(chunk):
+                break
+    finally:
+        await response.aclose()
+    extraction.close()
+    collector.close()
+    record_stage("html_parse", extraction.parse_seconds)
+    return collector
@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import uuid
+import queue
+import socket
+import hashlib
+import sqlite3
+import ipaddress
+import threading
+from urllib.parse import urlsplit
+
+import requests
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))  # Queued jobs before submissions get HTTP 429
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "jobs.sqlite3")
+JOB_CALLBACK_TIMEOUT = float(os.getenv("JOB_CALLBACK_TIMEOUT", "10"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "3600"))  # Running jobs of another host taken over after this long
+# Comma-separated hosts callbacks may go to; when empty, any public address is allowed
+JOB_CALLBACK_HOSTS = {host.strip().lower() for host in os.getenv("JOB_CALLBACK_HOSTS", "").split(",") if host.strip()}
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+def check_callback_url(url):
+    """
+    Raises ValueError unless `url` is an http(s) URL of an allowed host: one in JOB_CALLBACK_HOSTS, or
+    when that is empty, one resolving only to public addresses, so callbacks can't reach internal
+    services or cloud metadata endpoints.
+    """
+    if not isinstance(url, str):
+        raise ValueError("callback_url must be a string")
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.scheme not in ("http", "https") or not host:
+        raise ValueError("callback_url must be an http(s) URL")
+    if JOB_CALLBACK_HOSTS:
+        if host not in JOB_CALLBACK_HOSTS:
+            raise ValueError(f"callback_url host {host} is not allowed")
+        return
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parts.port or None, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError, ValueError):
+        raise ValueError(f"callback_url host {host} does not resolve")
+    for address in addresses:
+        if not ipaddress.ip_address(address.split("%")[0]).is_global:
+            raise ValueError(f"callback_url host {host} is not a public address")
+
+class JobQueue:
+    """
+    Runs long requests in the background on a fixed worker pool.
+    Jobs are persisted in SQLite so queued and interrupted work is picked up again after a restart,
+    and identical jobs that are still queued or running share one job ID. Several processes may share
+    one store: a worker claims a job in the database before running it, so each job runs once.
+    """
+
+    def __init__(self, handlers, workers=JOB_WORKERS, max_queued=JOB_QUEUE_SIZE, path=JOB_STORE_PATH):
+        self.handlers = handlers  # kind -> callable(payload, tenant) returning a JSON-serialisable result
+        self.workers = workers
+        self.max_queued = max_queued
+        self._queue = queue.Queue()
+        self._inflight = {}  # dedup key -> job_id
+        self._queued = 0
+        self._lock = threading.Lock()
+        self._started = False
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, dedup_key TEXT NOT NULL, payload TEXT NOT NULL, "
+            "callback_urls TEXT NOT NULL, status TEXT NOT NULL, result TEXT, error TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL, tenant TEXT)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "tenant" not in columns:  # Stores created before jobs were charged to their submitter
+            self._db.execute("ALTER TABLE jobs ADD COLUMN tenant TEXT")
+        if "owner" not in columns:  # Stores created before workers claimed jobs
+            self._db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key, status)")
+        self._db.commit()
+
+    def start(self):
+        """
+        Starts the workers and re-queues jobs left unfinished by a previous run. Safe to call repeatedly.
+        Jobs still running in another live process are left to it.
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            now = time.time()
+            abandoned = [
+                (job_id,) for job_id, owner, updated_at in self._db.execute(
+                    "SELECT id, owner, updated_at FROM jobs WHERE status = 'running'"
+                ).fetchall()
+                if self._abandoned(owner, updated_at, now)
+            ]
+            self._db.executemany(
+                "UPDATE jobs SET status = 'queued', owner = NULL WHERE id = ? AND status = 'running'", abandoned
+            )
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT id, dedup_key FROM jobs WHERE status = 'queued' ORDER BY created_at"
+            ).fetchall()
+            for job_id, dedup_key in rows:
+                self._inflight[dedup_key] = job_id
+                self._queued += 1
+                self._queue.put(job_id)
+
+        if rows:
+            print(f"🔹 Recovered {len(rows)} unfinished jobs")
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True).start()
+
+    def _abandoned(self, owner, updated_at, now):
+        """Whether a running job's worker is gone: a dead process on this host, or no update for JOB_STALE_SECONDS."""
+        host, _, pid = (owner or "").rpartition(":")
+        if not owner or owner == self.owner:
+            return True
+        if host == socket.gethostname() and pid.isdigit():
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return True
+            except PermissionError:
+                pass
+        return now - updated_at >= JOB_STALE_SECONDS
+
+    def submit(self, kind, payload, callback_url=None, tenant=None):
+        """
+        Queues a job for `tenant` and returns (job_id, created). `created` is False when an identical
+        job is already queued or running. Raises QueueFull when the queue is at capacity.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job type: {kind}")
+        dedup_key = hashlib.sha256(json.dumps([kind, payload], sort_keys=True).encode("utf-8")).hexdigest()
+
+        with self._lock:
+            job_id = self._inflight.get(dedup_key)
+            if job_id is None:  # Maybe queued or running in another process sharing the store
+                row = self._db.execute(
+                    "SELECT id FROM jobs WHERE dedup_key = ? AND status IN ('queued', 'running') LIMIT 1", (dedup_key,)
+                ).fetchone()
+                job_id = row and row[0]
+            if job_id is not None:
+                if callback_url:
+                    self._add_callback(job_id, callback_url)
+                return job_id, False
+            if self._queued >= self.max_queued:
+                raise QueueFull(f"Job queue is full ({self.max_queued} jobs waiting)")
+
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            callback_urls = [callback_url] if callback_url else []
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, dedup_key, payload, callback_urls, status, created_at, updated_at, tenant) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, dedup_key, json.dumps(payload), json.dumps(callback_urls), now, now, tenant)
+            )
+            self._db.commit()
+            self._inflight[dedup_key] = job_id
+            self._queued += 1
+
+        self._queue.put(job_id)
+        return job_id, True
+
+    def get(self, job_id):
+        """Returns the job's status and, once finished, its result or error. None if unknown."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, kind, status, result, error, created_at, updated_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = {
+            "job_id": row[0],
+            "type": row[1],
+            "status": row[2],
+            "created_at": row[5],
+            "updated_at": row[6],
+        }
+        if row[3] is not None:
+            job["result"] = json.loads(row[3])
+        if row[4] is not None:
+            job["error"] = row[4]
+        return job
+
+    def stats(self):
+        with self._lock:
+            return {"queued": self._queued, "in_flight": len(self._inflight), "max_queued": self.max_queued}
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                self._queued -= 1
+                claimed = self._db.execute(
+                    "UPDATE jobs SET status = 'running', owner = ?, updated_at = ? WHERE id = ? AND status = 'queued'",
+                    (self.owner, time.time(), job_id)
+                ).rowcount
+                self._db.commit()
+                kind, dedup_key, payload, tenant = self._db.execute(
+                    "SELECT kind, dedup_key, payload, tenant FROM jobs WHERE id = ?", (job_id,)
+                ).fetchone()
+                if not claimed:  # Another process sharing the store got it first
+                    if self._inflight.get(dedup_key) == job_id:
+                        del self._inflight[dedup_key]
+                    continue
+
+            result, error = None, None
+            try:
+                result = json.dumps(self.handlers[kind](json.loads(payload), tenant))
+            except Exception as e:
+                print(f"❌ Job {job_id} ({kind}) failed: {e!r}")
+                error = f"Job failed: {e!r}"
+
+            with self._lock:
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                    ("failed" if error else "done", result, error, time.time(), job_id)
+                )
+                self._db.commit()
+                self._inflight.pop(dedup_key, None)
+                callback_urls = json.loads(self._db.execute(
+                    "SELECT callback_urls FROM jobs WHERE id = ?", (job_id,)
+                ).fetchone()[0])
+
+            job = self.get(job_id)
+            for callback_url in callback_urls:
+                self._notify(callback_url, job)
+
+    def _add_callback(self, job_id, callback_url):
+        """Registers another submitter's callback on an in-flight job."""
+        callback_urls = json.loads(self._db.execute(
+            "SELECT callback_urls FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()[0])
+        if callback_url not in callback_urls:
+            callback_urls.append(callback_url)
+            self._db.execute("UPDATE jobs SET callback_urls = ? WHERE id = ?", (json.dumps(callback_urls), job_id))
+            self._db.commit()
+
+    def _notify(self, callback_url, job):
+        """POSTs the finished job to the submitter's callback URL."""
+        try:
+            check_callback_url(callback_url)  # Again: the host may resolve elsewhere by now
+            requests.post(callback_url, json=job, timeout=JOB_CALLBACK_TIMEOUT, allow_redirects=False)
+        except Exception as e:
+            print(f"❌ Job callback to {callback_url} failed: {e}")
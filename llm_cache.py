@@ -0,0 +1,162 @@
+import os
+import json
+import asyncio
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from metrics import register_collector
+
+# Cache settings
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))  # In-memory entries, 0 disables the cache
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))  # Seconds an answer stays valid
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH")  # SQLite file for the on-disk tier (optional)
+LLM_CACHE_DISK_SIZE = int(os.getenv("LLM_CACHE_DISK_SIZE", "100000"))  # On-disk entries
+
+def cache_key(prompt, provider, model, params):
+    """Hashes the rendered prompt together with everything that affects the completion."""
+    material = json.dumps(
+        {"prompt": prompt, "provider": provider, "model": model, "params": params},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """Two-tier LLM response cache: an LRU dict in memory backed by an optional SQLite file."""
+
+    def __init__(self, max_entries=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL, path=LLM_CACHE_PATH,
+                 disk_max_entries=LLM_CACHE_DISK_SIZE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_max_entries = disk_max_entries
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._db = None
+        if path and max_entries > 0:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+            self._db.commit()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key):
+        """Returns the cached response for `key`, or None on a miss."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+
+            value = self._disk_get(key, now)
+            if value is not None:
+                self._remember(key, value[0], value[1])
+                self.hits += 1
+                self.disk_hits += 1
+                return value[0]
+
+            self.misses += 1
+            return None
+
+    async def aget(self, key):
+        """`get` for the event loop: memory hits are served inline, SQLite lookups from a worker thread."""
+        with self._lock:
+            entry = self._entries.get(key)
+            in_memory = entry is not None and entry[1] > time.time()
+        if in_memory or self._db is None:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key, value):
+        """`put` for the event loop: the SQLite write runs in a worker thread."""
+        if self._db is None:
+            self.put(key, value)
+        else:
+            await asyncio.to_thread(self.put, key, value)
+
+    def put(self, key, value):
+        """Stores a response in both tiers."""
+        if not self.enabled:
+            return
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, value, expires_at, now)
+                )
+                self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.disk_max_entries,)
+                )
+                self._db.commit()
+
+    def clear(self):
+        """Drops every cached response and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.disk_hits = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self):
+        """Returns hit/miss counters and the current in-memory size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "entries": len(self._entries),
+            }
+
+    def _remember(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_get(self, key, now):
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT value, expires_at FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is not None:
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+        return row
+
+# Shared by every endpoint
+response_cache = ResponseCache()
+
+def _collect():
+    stats = response_cache.stats()
+    return [
+        ("bigmarket_llm_cache_hits_total", "counter", "LLM responses served from cache.",
+         [((("tier", "memory"),), stats["hits"] - stats["disk_hits"]), ((("tier", "disk"),), stats["disk_hits"])]),
+        ("bigmarket_llm_cache_misses_total", "counter", "LLM cache lookups that missed.", [((), stats["misses"])]),
+        ("bigmarket_llm_cache_entries", "gauge", "LLM responses held in memory.", [((), stats["entries"])]),
+    ]
+
+register_collector(_collect)
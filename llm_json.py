@@ -0,0 +1,114 @@
+import re
+import json
+from metrics import stage, ERRORS
+
+# Opening fence models put before JSON; the answer may start with any prefix of it
+JSON_FENCE = "```json"
+BRACKETS = {"}": "{", "]": "["}
+# Characters of numbers, true, false and null
+LITERAL_CHARS = set("0123456789+-.eEtruefalsn")
+
+def clean_llm_json(ai_response):
+    """Removes the ```json fence models like to wrap around JSON answers."""
+    return re.sub(r"```json\n(.*?)\n```", r"\1", ai_response, flags=re.DOTALL)
+
+def load_llm_json(ai_response):
+    """`parse_llm_json` without logging or metrics, for second looks at an answer already parsed once."""
+    try:
+        return json.loads(clean_llm_json(ai_response))
+    except json.JSONDecodeError:
+        return None
+
+def parse_llm_json(ai_response):
+    """Parses a JSON answer from the LLM. Returns None if it is not valid JSON."""
+    print(f"🔍 Raw AI Response:\n{ai_response}")
+
+    with stage("response_parse"):
+        ai_response_cleaned = clean_llm_json(ai_response)
+
+        print(f"🔍 Cleaned AI Response:\n{ai_response_cleaned}")
+
+        try:
+            return json.loads(ai_response_cleaned)
+        except json.JSONDecodeError:
+            print(f"❌ Error parsing LLM response: {ai_response_cleaned}")
+            ERRORS.inc(stage="response_parse")
+            return None
+
+class JSONStreamError(ValueError):
+    """The streamed answer can no longer turn into valid JSON."""
+
+class IncrementalJSONParser:
+    """
+    Parses a JSON answer while it streams in.
+
+    `feed` returns every object that closed within the chunk, if it is an item of the top-level
+    array or of an array directly inside the top-level object (each market of {"markets": [...]}).
+    It raises JSONStreamError as soon as the text cannot be valid JSON, so generation can be
+    cancelled. Examples are prose instead of JSON, mismatched brackets or a bare word. `close`
+    returns the whole document.
+    """
+
+    def __init__(self):
+        self.text = []  # The JSON document, without the fence
+        self._prefix = ""
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._item_start = None
+        self._done = False
+
+    def feed(self, chunk):
+        items = []
+        for char in chunk:
+            if self._done:
+                break  # Closing fence or trailing whitespace
+            if not self.text and char not in "{[":
+                self._prefix += char
+                if not JSON_FENCE.startswith(self._prefix.strip().lower()):
+                    raise JSONStreamError(f"Answer does not start with JSON: {self._prefix[:40]!r}")
+                continue
+
+            self.text.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if char == "{" and self._at_item_level():
+                    self._item_start = len(self.text) - 1
+                self._stack.append(char)
+            elif char in "}]":
+                if not self._stack or self._stack.pop() != BRACKETS[char]:
+                    raise JSONStreamError(f"Mismatched {char!r} at character {len(self.text)}")
+                if char == "}" and self._item_start is not None and self._at_item_level():
+                    items.append(self._item())
+                self._done = not self._stack
+            elif not (char.isspace() or char in ",:" or char in LITERAL_CHARS):
+                raise JSONStreamError(f"Unexpected {char!r} at character {len(self.text)}")
+        return items
+
+    def close(self):
+        """Returns the parsed document; raises JSONStreamError if it was cut off or is invalid."""
+        if not self._done:
+            raise JSONStreamError("Answer ended before the JSON was complete")
+        try:
+            return json.loads("".join(self.text))
+        except json.JSONDecodeError as e:
+            raise JSONStreamError(str(e))
+
+    def _at_item_level(self):
+        return self._stack == ["["] or self._stack == ["{", "["]
+
+    def _item(self):
+        text = "".join(self.text[self._item_start:])
+        self._item_start = None
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            raise JSONStreamError(f"Invalid item: {e}")
@@ -0,0 +1,408 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+from metrics import Counter, register_collector
+
+# Call policy settings
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "45"))  # Seconds for a whole call, retries included
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))  # Extra attempts after a retryable failure
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))  # e.g. 95 hedges calls slower than p95; 0 disables
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))  # Latencies needed before hedging starts
+LLM_FAILOVER = [name.strip().lower() for name in os.getenv("LLM_FAILOVER", "").split(",") if name.strip()]
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))  # Consecutive failures that open the circuit
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))  # Seconds before a trial call is let through
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+LLM_RETRIES_TOTAL = Counter("bigmarket_llm_retries_total", "LLM attempts retried after a failure.", ["provider", "reason"])
+LLM_HEDGES_TOTAL = Counter("bigmarket_llm_hedges_total", "Hedge requests sent for slow LLM calls.", ["provider"])
+LLM_FAILOVERS_TOTAL = Counter("bigmarket_llm_failovers_total", "LLM attempts served by a fallback provider.",
+                              ["provider"])
+
+# The provider that answered the current context's last successful call
+_served_by = contextvars.ContextVar("llm_served_by", default=None)
+
+class ProviderUnavailable(RuntimeError):
+    """Every provider in the failover chain has an open circuit."""
+
+def _status(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+def retryable(error):
+    """True for rate limits, server errors, timeouts and dropped connections."""
+    status = _status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    if isinstance(error, (requests.Timeout, requests.ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    httpx = sys.modules.get("httpx")  # Only loaded in async mode
+    return httpx is not None and isinstance(error, httpx.TransportError)
+
+def _reason(error):
+    status = _status(error)
+    return str(status) if status is not None else type(error).__name__
+
+def _retry_after(error):
+    """Seconds the provider asked us to wait, if it sent a Retry-After header."""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive failures and rejects calls for `cooldown` seconds.
+    After that a single trial call is let through (another after each further cooldown if it never
+    reports back); its failure re-opens the circuit, its success closes it.
+    """
+
+    def __init__(self, name, failures=LLM_BREAKER_FAILURES, cooldown=LLM_BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "open" if time.monotonic() - self.opened_at < self.cooldown else "half-open"
+
+    def available(self):
+        """True if a call would be let through now; unlike `allow`, doesn't take the trial call."""
+        with self._lock:
+            return self._available(time.monotonic())
+
+    def _available(self, now):
+        if self.opened_at is None:
+            return True
+        if now - self.opened_at < self.cooldown:
+            return False
+        return self.trial_at is None or now - self.trial_at >= self.cooldown
+
+    def allow(self):
+        """Lets a call through; when half-open, only the one trial call."""
+        with self._lock:
+            now = time.monotonic()
+            if not self._available(now):
+                return False
+            if self.opened_at is not None:
+                self.trial_at = now
+            return True
+
+    def success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                print(f"✅ {self.name} circuit closed")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_at = None
+
+    def failure(self):
+        with self._lock:
+            self.trial_at = None
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    print(f"🚫 {self.name} circuit open after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+class CallPolicy:
+    """
+    Wraps provider calls with an overall deadline, bounded retries with jittered exponential backoff,
+    optional hedging of slow calls, and failover to the next provider whose circuit is not open.
+    A `model` override only applies to the requested provider; fallbacks use their own model.
+    """
+
+    def __init__(self, providers, failover=LLM_FAILOVER, deadline=LLM_DEADLINE, retries=LLM_RETRIES,
+                 hedge_percentile=LLM_HEDGE_PERCENTILE):
+        self.providers = providers
+        self.failover = failover
+        self.deadline = deadline
+        self.retries = retries
+        self.hedge_percentile = hedge_percentile
+        self.breakers = {}
+        self._latencies = {}  # Provider name -> recent successful call durations
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(thread_name_prefix="llm-hedge")
+        register_collector(self._collect)
+
+    def breaker(self, provider):
+        with self._lock:
+            if provider.name not in self.breakers:
+                self.breakers[provider.name] = CircuitBreaker(provider.name)
+            return self.breakers[provider.name]
+
+    def chain(self, client):
+        """The requested provider followed by the configured fallbacks that have credentials."""
+        chain = [client]
+        for name in self.failover:
+            provider = self.providers.get(name)
+            if provider is not None and provider not in chain and provider.api_key:
+                chain.append(provider)
+        return chain
+
+    def complete(self, client, prompt, **params):
+        """Returns the completion text, raising the last error once retries or the deadline run out."""
+        deadline_at = time.monotonic() + self.deadline
+        chain = self.chain(client)
+        for attempt in range(self.retries + 1):
+            provider = self._pick(chain, attempt)
+            try:
+                served_by, text = self._hedged(provider, chain, prompt, params, deadline_at)
+            except Exception as e:
+                delay = self._retry_delay(provider, chain, attempt, e, deadline_at)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            _served_by.set(served_by)
+            return text
+
+    async def acomplete(self, client, prompt, **params):
+        """Async `complete`; losing hedge requests are cancelled."""
+        deadline_at = time.monotonic() + self.deadline
+        chain = self.chain(client)
+        for attempt in range(self.retries + 1):
+            provider = self._pick(chain, attempt)
+            try:
+                served_by, text = await self._ahedged(provider, chain, prompt, params, deadline_at)
+            except Exception as e:
+                delay = self._retry_delay(provider, chain, attempt, e, deadline_at)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            _served_by.set(served_by)
+            return text
+
+    def served_by(self):
+        """The provider that answered this context's last call: a fallback's answer isn't the requested one's."""
+        return _served_by.get()
+
+    def stream(self, client, prompt, **params):
+        """
+        Streaming `complete`. Failures before the first text arrives are retried and fail over like
+        `complete`; once text has been yielded the stream is not restarted. Streams are not hedged.
+        """
+        deadline_at = time.monotonic() + self.deadline
+        chain = self.chain(client)
+        for attempt in range(self.retries + 1):
+            provider = self._pick(chain, attempt)
+            chunks = provider.stream(prompt, timeout=self._timeout(provider, deadline_at),
+                                     **self._params(provider, chain, params))
+            try:
+                first = next(chunks, None)
+            except Exception as e:
+                self._record(provider, e)
+                delay = self._retry_delay(provider, chain, attempt, e, deadline_at)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+
+            self.breaker(provider).success()
+            _served_by.set(provider)
+            try:
+                if first is not None:
+                    yield first
+                yield from chunks
+            finally:
+                chunks.close()
+            return
+
+    async def astream(self, client, prompt, **params):
+        """Async `stream`."""
+        deadline_at = time.monotonic() + self.deadline
+        chain = self.chain(client)
+        for attempt in range(self.retries + 1):
+            provider = self._pick(chain, attempt)
+            chunks = provider.astream(prompt, timeout=self._timeout(provider, deadline_at),
+                                      **self._params(provider, chain, params))
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except Exception as e:
+                self._record(provider, e)
+                delay = self._retry_delay(provider, chain, attempt, e, deadline_at)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker(provider).success()
+            _served_by.set(provider)
+            try:
+                if first is not None:
+                    yield first
+                async for text in chunks:
+                    yield text
+            finally:
+                await chunks.aclose()
+            return
+
+    def _pick(self, chain, attempt):
+        """Rotates through the providers whose circuit is not open, so a retry fails over."""
+        healthy = [provider for provider in chain if self.breaker(provider).available()]
+        start = attempt % len(healthy) if healthy else 0
+        for provider in healthy[start:] + healthy[:start]:
+            if self.breaker(provider).allow():  # Another call may have just taken a half-open circuit's trial
+                if provider is not chain[0]:
+                    LLM_FAILOVERS_TOTAL.inc(provider=provider.name)
+                return provider
+        raise ProviderUnavailable(f"All LLM providers are unavailable: {', '.join(p.name for p in chain)}")
+
+    def _params(self, provider, chain, params):
+        """The call's params for `provider`, without the requested provider's model if it is a fallback."""
+        if provider is chain[0] or "model" not in params:
+            return params
+        return {key: value for key, value in params.items() if key != "model"}
+
+    def _retry_delay(self, provider, chain, attempt, error, deadline_at):
+        """Seconds to back off before the next attempt, or None when the error should be raised."""
+        if not retryable(error) or attempt >= self.retries:
+            return None
+        if not any(self.breaker(other).available() for other in chain):
+            return None  # Every circuit is open now; surface the provider's error rather than retrying
+        delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))  # Full jitter
+        delay = max(delay, _retry_after(error) or 0)
+        if time.monotonic() + delay >= deadline_at:
+            return None
+        print(f"🔁 {provider.name} call failed ({_reason(error)}), retrying in {delay:.2f}s")
+        LLM_RETRIES_TOTAL.inc(provider=provider.name, reason=_reason(error))
+        return delay
+
+    def _hedge_delay(self, provider):
+        """The provider's recent latency percentile, once enough calls have been seen."""
+        if not self.hedge_percentile:
+            return None
+        with self._lock:
+            latencies = sorted(self._latencies.get(provider.name, ()))
+        if len(latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100))]
+
+    def _hedge_target(self, provider, chain):
+        """Hedges go to the next healthy provider when there is one."""
+        for other in chain:
+            if other is not provider and self.breaker(other).allow():
+                return other
+        return provider
+
+    def _timeout(self, provider, deadline_at):
+        """The provider's timeout, capped by what is left of the call's deadline."""
+        timeout = min(provider.timeout, deadline_at - time.monotonic()) if provider.timeout else None
+        if timeout is not None and timeout <= 0:
+            raise TimeoutError(f"{provider.name} call deadline exceeded")
+        return timeout
+
+    def _attempt(self, provider, chain, prompt, params, deadline_at):
+        """Returns (provider, completion text)."""
+        timeout = self._timeout(provider, deadline_at)
+        started = time.monotonic()
+        try:
+            result = provider.complete(prompt, timeout=timeout, **self._params(provider, chain, params))
+        except Exception as e:
+            self._record(provider, e)
+            raise
+        self._record(provider, None, time.monotonic() - started)
+        return provider, result
+
+    async def _aattempt(self, provider, chain, prompt, params, deadline_at):
+        timeout = self._timeout(provider, deadline_at)
+        started = time.monotonic()
+        try:
+            result = await provider.acomplete(prompt, timeout=timeout, **self._params(provider, chain, params))
+        except Exception as e:
+            self._record(provider, e)
+            raise
+        self._record(provider, None, time.monotonic() - started)
+        return provider, result
+
+    def _hedged(self, provider, chain, prompt, params, deadline_at):
+        delay = self._hedge_delay(provider)
+        if delay is None or time.monotonic() + delay >= deadline_at:
+            return self._attempt(provider, chain, prompt, params, deadline_at)
+
+        first = self._executor.submit(contextvars.copy_context().run, self._attempt, provider, chain, prompt,
+                                      params, deadline_at)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        backup = self._hedge_target(provider, chain)
+        LLM_HEDGES_TOTAL.inc(provider=backup.name)
+        print(f"🪁 {provider.name} slower than p{self.hedge_percentile:g} ({delay:.2f}s), hedging to {backup.name}")
+        # The slower request cannot be cancelled mid-flight; its result is discarded
+        pending = {first, self._executor.submit(contextvars.copy_context().run, self._attempt, backup, chain, prompt,
+                                                params, deadline_at)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def _ahedged(self, provider, chain, prompt, params, deadline_at):
+        delay = self._hedge_delay(provider)
+        if delay is None or time.monotonic() + delay >= deadline_at:
+            return await self._aattempt(provider, chain, prompt, params, deadline_at)
+
+        first = asyncio.ensure_future(self._aattempt(provider, chain, prompt, params, deadline_at))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        backup = self._hedge_target(provider, chain)
+        LLM_HEDGES_TOTAL.inc(provider=backup.name)
+        print(f"🪁 {provider.name} slower than p{self.hedge_percentile:g} ({delay:.2f}s), hedging to {backup.name}")
+        pending = {first, asyncio.ensure_future(self._aattempt(backup, chain, prompt, params, deadline_at))}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _record(self, provider, error, seconds=None):
+        breaker = self.breaker(provider)
+        if error is None:
+            breaker.success()
+            with self._lock:
+                self._latencies.setdefault(provider.name, deque(maxlen=200)).append(seconds)
+        elif retryable(error):
+            breaker.failure()
+
+    def _collect(self):
+        states = {"closed": 0, "half-open": 1, "open": 2}
+        with self._lock:
+            breakers = list(self.breakers.values())
+        return [
+            ("bigmarket_llm_circuit_state", "gauge", "LLM provider circuit: 0 closed, 1 half-open, 2 open.",
+             [((("provider", breaker.name),), states[breaker.state]) for breaker in breakers]),
+        ]
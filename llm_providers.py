@@ -0,0 +1,355 @@
+import os
+import json
+import time
+import asyncio
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from llm_cache import cache_key, response_cache
+from single_flight import SingleFlight
+from llm_policy import CallPolicy
+from admission import llm_call, allm_call
+from metrics import stage, record_stage, LLM_TOKENS
+
+# Load environment variables
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")  # Default to OpenAI
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))  # In-flight calls per provider
+
+# Concurrent requests for the same rendered prompt share one LLM call
+llm_flights = SingleFlight("llm")
+
+class Provider:
+    """A long-lived completions client with its own keep-alive pool, timeout and concurrency cap."""
+
+    def __init__(self, name, base_url, api_key, model, timeout, max_concurrency=LLM_MAX_CONCURRENCY,
+                 json_model=None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.json_model = json_model  # Chat model for JSON-mode calls; None sends them as plain completions
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # Connection pool, created on the first call so unused providers cost nothing per worker
+        self._session = None
+        self._session_lock = threading.Lock()
+        # Async counterparts, created inside the event loop on first use
+        self._async_client = None
+        self._async_slots = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+        return self._session
+
+    def build_payload(self, prompt, json_mode=False, **params):
+        """
+        Returns the JSON body for a completions request. With `json_mode` and a `json_model`, it is a
+        chat request whose answer the provider guarantees to be a JSON object.
+        """
+        if json_mode and self.json_model:
+            payload = {
+                "model": self.json_model,
+                "messages": [{"role": "user", "content": prompt}],
+                "response_format": {"type": "json_object"},
+                "temperature": 0
+            }
+        else:
+            payload = {"model": self.model, "prompt": prompt, "temperature": 0}
+        payload.update({key: value for key, value in params.items() if value is not None})
+        return payload
+
+    def endpoint(self, payload):
+        return f"{self.base_url}/chat/completions" if "messages" in payload else f"{self.base_url}/completions"
+
+    def headers(self):
+        if not self.api_key:
+            raise ValueError(f"{self.name} API key is missing.")
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    def parse_response(self, response_json):
+        """Extracts the completion text from a completions API response."""
+        if "choices" not in response_json or not response_json["choices"]:
+            raise ValueError(f"Unexpected API response: {response_json}")
+
+        self._count_tokens(response_json)
+        choice = response_json["choices"][0]
+        text = choice["message"]["content"] if "message" in choice else choice["text"]
+        return text.strip()
+
+    def parse_stream_line(self, line):
+        """
+        Returns the text carried by one server-sent event line of a streamed completion:
+        "" for keep-alives and empty deltas, None once the stream is finished.
+        """
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.startswith("data:"):
+            return ""
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return None
+        event = json.loads(data)
+        self._count_tokens(event)
+        choices = event.get("choices") or [{}]
+        return choices[0].get("text") or ""
+
+    def _count_tokens(self, response_json):
+        usage = response_json.get("usage") or {}
+        LLM_TOKENS.inc(usage.get("prompt_tokens", 0), provider=self.name, kind="prompt")
+        LLM_TOKENS.inc(usage.get("completion_tokens", 0), provider=self.name, kind="completion")
+        # Prompt prefix served from the provider's cache (OpenAI reports details, DeepSeek hit tokens)
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or usage.get("prompt_cache_hit_tokens", 0)
+        LLM_TOKENS.inc(cached, provider=self.name, kind="cached_prompt")
+
+    def complete(self, prompt, timeout=None, **params):
+        """Sends the prompt to the provider and returns the completion text."""
+        headers = self.headers()
+        payload = self.build_payload(prompt, **params)
+        with self._slots:
+            response = self.session.post(
+                self.endpoint(payload),
+                headers=headers,
+                json=payload,
+                timeout=timeout or self.timeout
+            )
+        response.raise_for_status()
+        return self.parse_response(response.json())
+
+    async def acomplete(self, prompt, timeout=None, **params):
+        """Non-blocking `complete` for the ASGI server."""
+        headers = self.headers()
+        payload = self.build_payload(prompt, **params)
+        client, slots = self._async_state()
+        async with slots:
+            response = await client.post(
+                self.endpoint(payload),
+                headers=headers,
+                json=payload,
+                timeout=timeout or self.timeout
+            )
+        response.raise_for_status()
+        return self.parse_response(response.json())
+
+    def stream(self, prompt, timeout=None, **params):
+        """Yields the completion text as it is generated. Closing the generator stops the generation."""
+        headers = self.headers()
+        with self._slots:
+            response = self.session.post(
+                f"{self.base_url}/completions",
+                headers=headers,
+                json=self.build_payload(prompt, stream=True, **params),
+                timeout=timeout or self.timeout,
+                stream=True
+            )
+            try:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    text = self.parse_stream_line(line)
+                    if text is None:
+                        break
+                    if text:
+                        yield text
+            finally:
+                response.close()
+
+    async def astream(self, prompt, timeout=None, **params):
+        """Async `stream`."""
+        headers = self.headers()
+        client, slots = self._async_state()
+        async with slots:
+            async with client.stream(
+                "POST",
+                f"{self.base_url}/completions",
+                headers=headers,
+                json=self.build_payload(prompt, stream=True, **params),
+                timeout=timeout or self.timeout
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    text = self.parse_stream_line(line)
+                    if text is None:
+                        break
+                    if text:
+                        yield text
+
+    def _async_state(self):
+        if self._async_client is None:
+            import httpx  # Only needed in async mode
+
+            self._async_client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency)
+            )
+            self._async_slots = asyncio.Semaphore(self.max_concurrency)
+        return self._async_client, self._async_slots
+
+class StubProvider(Provider):
+    """Local provider for tests and benchmarks; answers without touching the network."""
+
+    def __init__(self):
+        super().__init__("stub", "http://localhost", "stub", "stub", timeout=0)
+        self.response = os.getenv("STUB_LLM_RESPONSE", "0")
+
+    def complete(self, prompt, timeout=None, **params):
+        """Returns the configured response, calling it with the prompt if it is callable."""
+        with self._slots:
+            return self.response(prompt) if callable(self.response) else self.response
+
+    async def acomplete(self, prompt, timeout=None, **params):
+        return self.complete(prompt, **params)
+
+    def stream(self, prompt, timeout=None, **params):
+        text = self.complete(prompt, **params)
+        for start in range(0, len(text), 16):
+            yield text[start:start + 16]
+
+    async def astream(self, prompt, timeout=None, **params):
+        for text in self.stream(prompt, **params):
+            yield text
+
+PROVIDERS = {
+    "openai": Provider(
+        "OpenAI",
+        os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+        os.getenv("OPENAI_API_KEY"),
+        os.getenv("OPENAI_MODEL", "gpt-3.5-turbo-instruct"),
+        timeout=float(os.getenv("OPENAI_TIMEOUT", "60")),
+        json_model=os.getenv("OPENAI_JSON_MODEL", "gpt-4o-mini") or None
+    ),
+    "deepseek": Provider(
+        "DeepSeek",
+        os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/beta"),
+        os.getenv("DEEPSEEK_API_KEY"),
+        os.getenv("DEEPSEEK_MODEL", "deepseek-chat"),
+        timeout=float(os.getenv("DEEPSEEK_TIMEOUT", "60")),
+        json_model=os.getenv("DEEPSEEK_JSON_MODEL", "deepseek-chat") or None
+    ),
+    "stub": StubProvider(),
+}
+
+# Deadlines, retries, hedging and failover around every provider call
+call_policy = CallPolicy(PROVIDERS)
+
+def get_provider(name=None):
+    """Returns the shared client for the named (or configured) provider."""
+    name = (name or LLM_PROVIDER).lower()
+    if name not in PROVIDERS:
+        raise ValueError("Invalid LLM_PROVIDER. Use 'openai', 'deepseek' or 'stub'.")
+    return PROVIDERS[name]
+
+def _response_cache_key(client, prompt, params):
+    """Returns the cache key for a call, or None when the answer is sampled and not reproducible."""
+    payload = client.build_payload(prompt, **params)
+    if payload.get("temperature") != 0:
+        return None
+    return cache_key(prompt, client.name, client.model, payload)
+
+def _cacheable(client, ai_response, valid):
+    """Only the requested provider's answers that the caller's `valid` check accepts are cached."""
+    # A fallback's answer would be cached under this provider's key
+    return call_policy.served_by() is client and (valid is None or valid(ai_response))
+
+def get_llm_response(prompt, provider=None, cache=True, valid=None, **params):
+    """
+    Selects LLM provider and returns the generated response, served from cache or a shared in-flight call.
+    With `cache` off the model is always asked, and its answer is not cached. Answers the `valid`
+    predicate rejects are returned but not cached, so a retry asks the model again.
+    """
+    client = get_provider(provider)
+    key = _response_cache_key(client, prompt, params) if cache else None
+    cached = response_cache.get(key) if key else None
+    if cached is not None:
+        return cached
+
+    if not key:
+        with llm_call(prompt, params), stage("llm_call"):
+            return call_policy.complete(client, prompt, **params)
+
+    def call():
+        with llm_call(prompt, params), stage("llm_call"):
+            ai_response = call_policy.complete(client, prompt, **params)
+        if _cacheable(client, ai_response, valid):
+            response_cache.put(key, ai_response)
+        return ai_response
+
+    return llm_flights.do(key, call)
+
+async def aget_llm_response(prompt, provider=None, cache=True, valid=None, **params):
+    """Async `get_llm_response`: same provider selection and cache, non-blocking I/O."""
+    client = get_provider(provider)
+    key = _response_cache_key(client, prompt, params) if cache else None
+    cached = await response_cache.aget(key) if key else None
+    if cached is not None:
+        return cached
+
+    if not key:
+        async with allm_call(prompt, params):
+            with stage("llm_call"):
+                return await call_policy.acomplete(client, prompt, **params)
+
+    async def call():
+        async with allm_call(prompt, params):
+            with stage("llm_call"):
+                ai_response = await call_policy.acomplete(client, prompt, **params)
+        if _cacheable(client, ai_response, valid):
+            await response_cache.aput(key, ai_response)
+        return ai_response
+
+    return await llm_flights.ado(key, call)
+
+def stream_llm_response(prompt, provider=None, valid=None, **params):
+    """
+    Yields the completion text as the provider generates it. A cached answer is yielded whole.
+    Closing the generator early cancels the generation; only complete (and `valid`) answers are cached.
+    """
+    client = get_provider(provider)
+    key = _response_cache_key(client, prompt, params)
+    cached = response_cache.get(key) if key else None
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    with llm_call(prompt, params):
+        started = time.perf_counter()
+        for text in call_policy.stream(client, prompt, **params):
+            if not parts:
+                record_stage("llm_first_token", time.perf_counter() - started)
+            parts.append(text)
+            yield text
+        record_stage("llm_call", time.perf_counter() - started)
+    ai_response = "".join(parts).strip()
+    if key and _cacheable(client, ai_response, valid):
+        response_cache.put(key, ai_response)
+
+async def astream_llm_response(prompt, provider=None, valid=None, **params):
+    """Async `stream_llm_response`."""
+    client = get_provider(provider)
+    key = _response_cache_key(client, prompt, params)
+    cached = await response_cache.aget(key) if key else None
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    async with allm_call(prompt, params):
+        started = time.perf_counter()
+        async for text in call_policy.astream(client, prompt, **params):
+            if not parts:
+                record_stage("llm_first_token", time.perf_counter() - started)
+            parts.append(text)
+            yield text
+        record_stage("llm_call", time.perf_counter() - started)
+    ai_response = "".join(parts).strip()
+    if key and _cacheable(client, ai_response, valid):
+        await response_cache.aput(key, ai_response)
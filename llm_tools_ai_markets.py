@@ -1,110 +1,71 @@
-import os
-import json
-import requests
-import re
-from bs4 import BeautifulSoup
+import asyncio
+import llm_providers
+from llm_json import IncrementalJSONParser, JSONStreamError, load_llm_json
+from scraping_tools import fetch_news_summary, afetch_news_summary
+from metrics import stage, timed, ERRORS
+from prompt_registry import render, prompt_info
+from market_schema import DISCOVERY, DISCOVERED_MARKET, check, repair, arepair
+from market_index import existing_markets, index_market, index_markets
 from datetime import datetime, timezone, timedelta
 
-# Load OpenAI or DeepSeek API keys
-LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-
 def get_current_utc_date():
     """Returns the current date in UTC format YYYY-MM-DD."""
     return datetime.now(timezone.utc).strftime("%Y-%m-%d")
 
-MARKET_DISCOVERY_PROMPT = """
-You are an AI specializing in identifying prediction market opportunities from real-world news.
-Given the following news story, suggest 1 **highly actionable prediction market**.
-
-### **Current UTC Date:**
-{current_date}
-
-### **News Story:**
-{news_story}
-
-### **Instructions:**
-1. Extract speculative or uncertain aspects of the story.
-2. Convert them into a **prediction market question**.
-3. **The market MUST be resolvable between 2 and 30 days from today ({current_date}).**
-4. If no market fits this requirement, **respond with an error message instead of guessing**.
-5. Ensure the market has:
-   - A title
-   - A clear description
-   - 2-10 possible outcomes
-   - An objective resolution criteria
-   - A valid resolution date **between {min_resolution_date} and {max_resolution_date}**
-   - Reliable news sources for verification.
-
-### **Response format (JSON):**
-{{
-    "markets": [
-        {{
-            "title": "...",
-            "description": "...",
-            "outcome_categories": ["...", "...", "..."],
-            "market_sector": "...",
-            "resolution_criteria": "...",
-            "earliest_resolution_date": "...",
-            "sources": ["...", "..."]
-        }},
-        ...
-    ]
-}}
-
-DO NOT include explanations—just return valid JSON.
-"""
+def format_news_summary(title, paragraphs):
+    """Formats a scraped article as a bold title followed by its opening paragraphs."""
+    summary = " ".join(paragraphs)
+
+    if not summary:
+        return "No summary available."
+    return f"**{title}**\n{summary}" if title else summary
 
 def scrape_news_summary(news_url):
     """Scrapes the article summary from a news URL."""
     try:
-        response = requests.get(news_url, headers={"User-Agent": "Mozilla/5.0"})
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        # Extract title & first paragraph (or meta description)
-        title = soup.find("title").get_text()
-        paragraphs = soup.find_all("p", limit=3)
-        summary = " ".join([p.get_text() for p in paragraphs])
+        # Extract title & first paragraphs, without downloading the rest of the page
+        return format_news_summary(*fetch_news_summary(news_url))
+    except Exception as e:
+        print(f"❌ Error scraping news: {e}")
+        return "No summary available."
 
-        return f"**{title}**\n{summary}" if summary else "No summary available."
+async def ascrape_news_summary(news_url):
+    """Async `scrape_news_summary`."""
+    try:
+        return format_news_summary(*await afetch_news_summary(news_url))
     except Exception as e:
         print(f"❌ Error scraping news: {e}")
         return "No summary available."
 
+def _passes_schema(market):
+    """Whether a discovered market is valid, ignoring a resolution date that `fix_resolution_date` will replace."""
+    errors = DISCOVERED_MARKET.errors(market)
+    if isinstance(market, dict) and "earliest_resolution_date" in market:
+        errors = [error for error in errors if not error.startswith("earliest_resolution_date:")]
+    return not errors
+
+def cacheable_discovery(ai_response):
+    """True for discovery answers worth caching: the model's refusal, or markets that all pass the schema."""
+    market_data = load_llm_json(ai_response)
+    if _is_refusal(market_data):
+        return True
+    return not DISCOVERY.errors(market_data) and all(_passes_schema(market) for market in market_data["markets"])
+
 def get_llm_response(prompt):
     """Selects LLM provider and returns structured JSON response."""
-    if LLM_PROVIDER.lower() == "deepseek":
-        if not DEEPSEEK_API_KEY:
-            raise ValueError("DeepSeek API key is missing.")
-
-        response = requests.post(
-            "https://api.deepseek.com/beta/completions",
-            headers={"Authorization": f"Bearer {DEEPSEEK_API_KEY}", "Content-Type": "application/json"},
-            json={"model": "deepseek-chat", "prompt": prompt, "temperature": 0}
-        )
-        response_json = response.json()
-        return response_json["choices"][0]["text"].strip()
-
-    elif LLM_PROVIDER.lower() == "openai":
-        if not OPENAI_API_KEY:
-            raise ValueError("OpenAI API key is missing.")
-
-        response = requests.post(
-            "https://api.openai.com/v1/completions",
-            headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
-            json={
-                "model": "gpt-4",
-                "prompt": prompt,
-                "temperature": 0,
-                "max_tokens": 500
-            }
-        )
-        response_json = response.json()
-        return response_json["choices"][0]["text"].strip()
-
-    else:
-        raise ValueError("Invalid LLM_PROVIDER. Use 'openai' or 'deepseek'.")
+    return llm_providers.get_llm_response(prompt, max_tokens=500, valid=cacheable_discovery)
+
+async def aget_llm_response(prompt):
+    """Async `get_llm_response`."""
+    return await llm_providers.aget_llm_response(prompt, max_tokens=500, valid=cacheable_discovery)
+
+def stream_llm_response(prompt):
+    """Streaming `get_llm_response`."""
+    return llm_providers.stream_llm_response(prompt, max_tokens=500, valid=cacheable_discovery)
+
+def astream_llm_response(prompt):
+    """Async `stream_llm_response`."""
+    return llm_providers.astream_llm_response(prompt, max_tokens=500, valid=cacheable_discovery)
 
 def ensure_valid_resolution_date(date_str):
     """Ensures the resolution date is between 2 and 30 days in the future."""
@@ -117,46 +78,193 @@ def ensure_valid_resolution_date(date_str):
         if resolution_date < min_future_date or resolution_date > max_future_date:
             print(f"⚠️ Invalid date {date_str}. Adjusting to within allowed range.")
             resolution_date = min_future_date  # Default to minimum allowed
-    except ValueError:
+    except (TypeError, ValueError):
         resolution_date = min_future_date  # Default if parsing fails
 
     return resolution_date.strftime("%Y-%m-%d")
 
-def discover_markets_from_news(news_url):
-    """Generates market ideas based on a news story and ensures resolution dates are in the future."""
-    news_story = scrape_news_summary(news_url)
+def resolution_window():
+    """Today and the earliest and latest allowed resolution dates, as YYYY-MM-DD."""
+    return dict(
+        current_date=get_current_utc_date(),
+        min_resolution_date=(datetime.now(timezone.utc) + timedelta(days=2)).strftime("%Y-%m-%d"),
+        max_resolution_date=(datetime.now(timezone.utc) + timedelta(days=30)).strftime("%Y-%m-%d")
+    )
+
+@timed("prompt_build")
+def build_discovery_prompt(news_story):
+    """Renders the discovery prompt for a scraped news story."""
     print(f"🔍 Scraped News Summary:\n{news_story}")
 
-    current_date = get_current_utc_date()
-    min_resolution_date = (datetime.now(timezone.utc) + timedelta(days=2)).strftime("%Y-%m-%d")
-    max_resolution_date = (datetime.now(timezone.utc) + timedelta(days=30)).strftime("%Y-%m-%d")
+    return render("market_discovery", news_story=news_story, **resolution_window())
 
-    prompt = MARKET_DISCOVERY_PROMPT.format(
-        news_story=news_story,
-        current_date=current_date,
-        min_resolution_date=min_resolution_date,
-        max_resolution_date=max_resolution_date
+@timed("prompt_build")
+def build_batch_discovery_prompt(news_stories):
+    """Renders one discovery prompt covering several short stories, numbered from 1."""
+    numbered = "\n\n".join(f"#### Story {number}\n{story}" for number, story in enumerate(news_stories, 1))
+    return render(
+        "market_discovery_batch", article_count=len(news_stories), news_stories=numbered, **resolution_window()
     )
 
-    ai_response = get_llm_response(prompt)
+def _is_refusal(market_data):
+    """True when the model answered with its own {"error": ...} instead of markets."""
+    return isinstance(market_data, dict) and "error" in market_data and "markets" not in market_data
 
-    print(f"🔍 Raw AI Response:\n{ai_response}")
+def parse_discovery_response(ai_response):
+    """
+    Parses the LLM answer, repairs markets that fail the schema, drops the ones that can't be
+    repaired and fixes resolution dates that fall outside the allowed window.
+    """
+    market_data, errors = check(ai_response, DISCOVERY)
+    if _is_refusal(market_data):
+        return market_data
+    market_data, errors = repair(market_data, errors, DISCOVERY, ai_response)
+    if errors:
+        return {"error": "Invalid response format"}
 
-    # ✅ Step 1: Remove triple backticks if present
-    ai_response_cleaned = re.sub(r"```json\n(.*?)\n```", r"\1", ai_response, flags=re.DOTALL)
+    markets = [validate_market(market) for market in market_data["markets"]]
+    market_data["markets"] = [market for market in markets if market is not None]
+    return market_data
 
-    print(f"🔍 Cleaned AI Response:\n{ai_response_cleaned}")
+async def aparse_discovery_response(ai_response):
+    """Async `parse_discovery_response`."""
+    market_data, errors = check(ai_response, DISCOVERY)
+    if _is_refusal(market_data):
+        return market_data
+    market_data, errors = await arepair(market_data, errors, DISCOVERY, ai_response)
+    if errors:
+        return {"error": "Invalid response format"}
 
-    # ✅ Step 2: Try parsing the JSON
-    try:
-        market_data = json.loads(ai_response_cleaned)  # Convert string to JSON
+    markets = [await avalidate_market(market) for market in market_data["markets"]]
+    market_data["markets"] = [market for market in markets if market is not None]
+    return market_data
 
-        # ✅ Step 3: Fix resolution dates
-        for market in market_data.get("markets", []):
-            if "earliest_resolution_date" in market:
-                market["earliest_resolution_date"] = ensure_valid_resolution_date(market["earliest_resolution_date"])
+def fix_resolution_date(market):
+    """Moves a discovered market's resolution date into the allowed window."""
+    with stage("date_fixup"):
+        if isinstance(market, dict) and "earliest_resolution_date" in market:
+            market["earliest_resolution_date"] = ensure_valid_resolution_date(market["earliest_resolution_date"])
+    return market
 
-        return market_data
-    except json.JSONDecodeError:
-        print(f"❌ Error parsing LLM response: {ai_response_cleaned}")
-        return {"error": "Invalid response format"}
+def validate_market(market):
+    """
+    Returns a discovered market with its date fixed, sending only this market back for repair if it
+    fails the schema. None if it can't be repaired.
+    """
+    market, errors = repair(market, DISCOVERED_MARKET.errors(fix_resolution_date(market)), DISCOVERED_MARKET)
+    return None if errors else fix_resolution_date(market)
+
+async def avalidate_market(market):
+    """Async `validate_market`."""
+    market, errors = await arepair(market, DISCOVERED_MARKET.errors(fix_resolution_date(market)), DISCOVERED_MARKET)
+    return None if errors else fix_resolution_date(market)
+
+def with_prompt_info(market_data, prompt):
+    """Records the template version and hash that produced a result."""
+    if isinstance(market_data, dict):
+        market_data["prompt_template"] = prompt_info(prompt)
+    return market_data
+
+def discover_markets_from_news(news_url, force=False):
+    """
+    Generates market ideas based on a news story and ensures resolution dates are in the future.
+    If indexed markets already cover the story they are returned instead, unless `force` is set.
+    """
+    news_story = scrape_news_summary(news_url)
+    existing = None if force else existing_markets(news_story)
+    if existing is not None:
+        return existing
+    prompt = build_discovery_prompt(news_story)
+    return index_markets(with_prompt_info(parse_discovery_response(get_llm_response(prompt)), prompt))
+
+async def adiscover_markets_from_news(news_url, force=False):
+    """Async `discover_markets_from_news`."""
+    news_story = await ascrape_news_summary(news_url)
+    existing = None if force else await asyncio.to_thread(existing_markets, news_story)
+    if existing is not None:
+        return existing
+    prompt = build_discovery_prompt(news_story)
+    market_data = with_prompt_info(await aparse_discovery_response(await aget_llm_response(prompt)), prompt)
+    return await asyncio.to_thread(index_markets, market_data)
+
+def _streamed_markets(parser, chunk):
+    """Markets completed by one streamed chunk."""
+    with stage("response_parse"):
+        return parser.feed(chunk)
+
+def _stream_end(parser, found):
+    """What to send once the stream ends: nothing if markets were found, else the model's error."""
+    with stage("response_parse"):
+        market_data = parser.close()
+    if found:
+        return None
+    if isinstance(market_data, dict) and market_data.get("error"):
+        return {"error": market_data["error"]}
+    return {"error": "No markets found"}
+
+def stream_markets_from_news(news_url, force=False):
+    """
+    Yields each market discovered in a news story as soon as its JSON object is complete.
+    Generation is cancelled as soon as the answer cannot be valid JSON; failures are yielded as {"error": ...}.
+    Indexed markets that already cover the story are yielded instead, unless `force` is set.
+    """
+    news_story = scrape_news_summary(news_url)
+    existing = None if force else existing_markets(news_story)
+    if existing is not None:
+        yield from existing["markets"]
+        return
+    prompt = build_discovery_prompt(news_story)
+    parser = IncrementalJSONParser()
+    chunks = stream_llm_response(prompt)
+    found = 0
+    try:
+        for chunk in chunks:
+            for market in _streamed_markets(parser, chunk):
+                market = validate_market(market)
+                if market is not None:
+                    found += 1
+                    yield index_market(with_prompt_info(market, prompt), "discovered")
+        end = _stream_end(parser, found)
+        if end:
+            yield end
+    except JSONStreamError as e:
+        print(f"❌ Invalid streamed response, cancelling generation: {e}")
+        ERRORS.inc(stage="response_parse")
+        yield {"error": "Invalid response format"}
+    except Exception as e:
+        print(f"🚨 Error streaming markets: {e}")
+        yield {"error": "LLM API failed"}
+    finally:
+        chunks.close()
+
+async def astream_markets_from_news(news_url, force=False):
+    """Async `stream_markets_from_news`."""
+    news_story = await ascrape_news_summary(news_url)
+    existing = None if force else await asyncio.to_thread(existing_markets, news_story)
+    if existing is not None:
+        for market in existing["markets"]:
+            yield market
+        return
+    prompt = build_discovery_prompt(news_story)
+    parser = IncrementalJSONParser()
+    chunks = astream_llm_response(prompt)
+    found = 0
+    try:
+        async for chunk in chunks:
+            for market in _streamed_markets(parser, chunk):
+                market = await avalidate_market(market)
+                if market is not None:
+                    found += 1
+                    yield await asyncio.to_thread(index_market, with_prompt_info(market, prompt), "discovered")
+        end = _stream_end(parser, found)
+        if end:
+            yield end
+    except JSONStreamError as e:
+        print(f"❌ Invalid streamed response, cancelling generation: {e}")
+        ERRORS.inc(stage="response_parse")
+        yield {"error": "Invalid response format"}
+    except Exception as e:
+        print(f"🚨 Error streaming markets: {e}")
+        yield {"error": "LLM API failed"}
+    finally:
+        await chunks.aclose()
@@ -1,125 +1,28 @@
 import os
-import json
-import re
-import requests
-from datetime import datetime, timedelta
-from langchain_community.llms import OpenAI
+import asyncio
+import llm_providers
+import scraping_tools
+from price_feed import price_feed, KNOWN_ASSETS
+from metrics import stage, timed
+from prompt_registry import render, prompt_info
+from market_schema import NEWS_MARKET, FINANCIAL_MARKET, validate, avalidate
+from market_index import existing_market, index_market
 from decimal import Decimal
 from datetime import datetime, timedelta
-from bs4 import BeautifulSoup
-
-# Load environment variables
-LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")  # Default to OpenAI
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-
-MARKET_CREATION_PROMPT_NEWS = """
-You are an AI that generates structured event-based prediction markets based on a user's speculative idea.
-Your response must be in **JSON format**.
-
-### **User's Input:**
-{user_idea}
-
-### **Live News Context (Scraped from Reputable Sources):**
-{news_summary}
-
-### **Generate the following structured event market details:**
-1. **title** → A short and engaging title for the market.
-2. **description** → A 2-3 sentence explanation of what the market is about.
-3. **outcome_categories** → Generate **between 2 and 6 possible outcomes**, directly based on recent news developments.
-4. **market_sector** → Select one from: `["politics", "sports", "economy", "climate", "technology"]`.
-5. **resolution_criteria** → Define **how the market is resolved** using reputable news sources.
-6. **earliest_resolution_date** → **Set a reasonable future date** (e.g., 3-7 days for short-term events).
-7. **sources** → List of **trusted news sources** where users can verify the outcome.
-
-### **Response format (JSON):**
-{{
-    "title": "...",
-    "description": "...",
-    "outcome_categories": ["...", "...", "..."],
-    "market_sector": "...",
-    "resolution_criteria": "...",
-    "earliest_resolution_date": "...",
-    "sources": ["...", "..."]
-}}
-
-DO NOT include explanations—just return a valid JSON object.
-"""
-
-MARKET_CREATION_PROMPT_FINANCIAL = """
-You are an AI that generates structured financial prediction markets based on a user's speculative idea.
-Your response must be in **JSON format**.
-
-### **User's Input:**
-{user_idea}
-
-### **Live Asset Pricing:**
-- **Asset Name**: {asset}
-- **Current Price**: ${current_price}
-- **Price Volatility Context**: Expected short-term movement of {volatility_range}%.
-
-### **Generate the following structured financial market details:**
-1. **title** → A short and engaging title for the market.
-2. **description** → A 2-3 sentence explanation of what the market is about.
-3. **outcome_categories** → Generate **realistic price brackets** based on asset history and short-term volatility.
-4. **market_sector** → Set to `"crypto"`, `"stocks"`, or `"commodities"` based on the asset type.
-5. **resolution_criteria** → Clearly define **how the price is measured** (e.g., CoinGecko closing price at 23:59 UTC).
-6. **earliest_resolution_date** → **Must be at least 3 days in the future**.
-7. **sources** → A list of **trusted financial data sources**.
-
-### **Response format (JSON):**
-{{
-    "title": "...",
-    "description": "...",
-    "outcome_categories": ["...", "...", "..."],
-    "market_sector": "...",
-    "resolution_criteria": "...",
-    "earliest_resolution_date": "...",
-    "sources": ["...", "..."]
-}}
-
-DO NOT include explanations—just return a valid JSON object.
-"""
-
-def get_llm_response(prompt):
-    """Selects LLM provider and returns structured JSON response."""
-    if LLM_PROVIDER.lower() == "deepseek":
-        if not DEEPSEEK_API_KEY:
-            raise ValueError("DeepSeek API key is missing.")
-
-        response = requests.post(
-            "https://api.deepseek.com/beta/completions",
-            headers={"Authorization": f"Bearer {DEEPSEEK_API_KEY}", "Content-Type": "application/json"},
-            json={"model": "deepseek-chat", "prompt": prompt, "temperature": 0}
-        )
-        response_json = response.json()
-        print("🔍 DeepSeek API Response:", response_json)
-        return response_json["choices"][0]["text"].strip()
-
-    elif LLM_PROVIDER.lower() == "openai":
-        if not OPENAI_API_KEY:
-            raise ValueError("OpenAI API key is missing.")
-
-        llm = OpenAI(api_key=OPENAI_API_KEY)
-        return llm.invoke(prompt)
 
-    else:
-        raise ValueError("Invalid LLM_PROVIDER. Use 'openai' or 'deepseek'.")
+NEWS_SEARCH_URL = os.getenv("NEWS_SEARCH_URL", "https://news.google.com/search")  # Headline source for news markets
 
-def get_asset_price(asset):
-    """Fetch the current price of an asset from CoinGecko and return a properly formatted price."""
-    url = f"https://api.coingecko.com/api/v3/simple/price?ids={asset}&vs_currencies=usd"
-    try:
-        response = requests.get(url)
-        data = response.json()
-        price = data.get(asset, {}).get("usd", None)
+def get_llm_response(prompt, schema=NEWS_MARKET):
+    """Selects LLM provider and returns structured JSON response; only answers valid for `schema` are cached."""
+    return llm_providers.get_llm_response(prompt, max_tokens=500, valid=schema.accepts)
 
-        if price is not None:
-            return Decimal(price)  # Ensure a properly formatted decimal value
-        return None
-    except Exception as e:
-        print(f"❌ Error fetching asset price: {e}")
-        return None  # Return None if price lookup fails
+async def aget_llm_response(prompt, schema=NEWS_MARKET):
+    """Async `get_llm_response`."""
+    return await llm_providers.aget_llm_response(prompt, max_tokens=500, valid=schema.accepts)
+
+def get_asset_price(asset):
+    """Returns the asset's price from the background CoinGecko snapshot, never waiting on the network."""
+    return price_feed.get(asset)
 
 def get_realistic_price_brackets(asset, current_price, resolution_timeframe):
     """Generate more realistic price brackets based on the asset's price and resolution timeframe."""
@@ -156,8 +59,7 @@ def extract_asset(user_idea):
     user_idea = user_idea.lower()
     
     # Look for known cryptocurrency keywords
-    known_assets = ["bitcoin", "ethereum", "stacks", "solana", "cardano", "ripple"]
-    for asset in known_assets:
+    for asset in KNOWN_ASSETS:
         if asset in user_idea:
             return asset  # Return the matched asset
     
@@ -170,23 +72,49 @@ def extract_asset(user_idea):
 
     return None  # Return None if no asset is detected
 
+def news_search_url(user_idea):
+    search_query = user_idea.replace(" ", "+")  # Convert user input to a search-friendly format
+    return f"{NEWS_SEARCH_URL}?q={search_query}&hl=en-US&gl=US&ceid=US:en"
+
+def parse_news_headlines(html):
+    """Formats the top headlines of a Google News results page."""
+    from bs4 import BeautifulSoup  # Only the news search needs it; keeps it out of worker startup
+
+    soup = BeautifulSoup(html, "html.parser")
+    headlines = soup.find_all("h3", limit=5)  # Get the top 5 news headlines
+
+    news_summary = []
+    for headline in headlines:
+        title = headline.get_text()
+        link = "https://news.google.com" + headline.find("a")["href"][1:]  # Build full URL
+        news_summary.append(f"{title} ({link})")
+
+    return "\n".join(news_summary) if news_summary else "No relevant news found."
+
 def scrape_latest_news(user_idea):
     """Scrapes recent news articles related to the market topic."""
-    search_query = user_idea.replace(" ", "+")  # Convert user input to a search-friendly format
-    news_url = f"https://news.google.com/search?q={search_query}&hl=en-US&gl=US&ceid=US:en"
-    
     try:
-        response = requests.get(news_url, headers={"User-Agent": "Mozilla/5.0"})
-        soup = BeautifulSoup(response.text, "html.parser")
-        headlines = soup.find_all("h3", limit=5)  # Get the top 5 news headlines
-        
-        news_summary = []
-        for headline in headlines:
-            title = headline.get_text()
-            link = "https://news.google.com" + headline.find("a")["href"][1:]  # Build full URL
-            news_summary.append(f"{title} ({link})")
-
-        return "\n".join(news_summary) if news_summary else "No relevant news found."
+        with stage("fetch"):
+            return scraping_tools.fetch_cached(
+                news_search_url(user_idea), "headlines", lambda response: parse_news_headlines(response.text),
+                headers={"User-Agent": "Mozilla/5.0"}
+            )
+
+    except Exception as e:
+        print(f"❌ Error scraping news: {e}")
+        return "No relevant news available."
+
+async def ascrape_latest_news(user_idea):
+    """Async `scrape_latest_news`."""
+    try:
+        async def aheadlines(response):
+            await response.aread()
+            return parse_news_headlines(response.text)
+
+        with stage("fetch"):
+            return await scraping_tools.afetch_cached(
+                news_search_url(user_idea), "headlines", aheadlines, headers={"User-Agent": "Mozilla/5.0"}
+            )
 
     except Exception as e:
         print(f"❌ Error scraping news: {e}")
@@ -198,46 +126,90 @@ def ensure_future_date():
     min_future_date = today + timedelta(days=3)  # Ensure at least 3 days ahead
     return min_future_date.strftime("%Y-%m-%d")
 
-def generate_market(user_idea, market_type):
-    """Calls LLM to generate a market structure based on whether it's financial or news-based."""
+@timed("prompt_build")
+def build_financial_prompt(user_idea, asset, current_price):
+    """Renders the financial market prompt around the live asset price."""
+    volatility_range = "10-20"  # Default expected short-term volatility in %
+
+    print(f"🔍 Detected Asset: {asset}, Current Price: ${current_price}")
+
+    return render(
+        "market_creation_financial",
+        user_idea=user_idea,
+        asset=asset if asset else "unknown",
+        current_price=current_price if current_price else "unknown",
+        volatility_range=volatility_range
+    )
+
+@timed("prompt_build")
+def build_news_prompt(user_idea, news_summary):
+    """Renders the news market prompt around the scraped headlines."""
+    print(f"🔍 Scraped News Summary:\n{news_summary}")
+
+    return render(
+        "market_creation_news",
+        user_idea=user_idea,
+        news_summary=news_summary
+    )
+
+def market_result(market_data, errors, prompt=None):
+    """The validated market with its template info, or an error payload listing what was wrong."""
+    if market_data is None:
+        return {"error": "Invalid response format"}
+    if errors:
+        return {"error": "Invalid response format", "details": errors}
+    if prompt is not None:
+        market_data["prompt_template"] = prompt_info(prompt)
+    return market_data
+
+def parse_market_response(ai_response, prompt=None, schema=NEWS_MARKET):
+    """Parses and validates the LLM's JSON market, repairing it with a targeted prompt if needed."""
+    return market_result(*validate(ai_response, schema), prompt)
+
+async def aparse_market_response(ai_response, prompt=None, schema=NEWS_MARKET):
+    """Async `parse_market_response`."""
+    return market_result(*await avalidate(ai_response, schema), prompt)
+
+def generate_market(user_idea, market_type, force=False):
+    """
+    Calls LLM to generate a market structure based on whether it's financial or news-based.
+    An indexed market that already covers the idea is returned instead, unless `force` is set.
+    """
+    if market_type not in ("financial", "news"):
+        return {"error": "Invalid market type"}
+    existing = None if force else existing_market(user_idea, market_type)
+    if existing is not None:
+        return existing
 
     if market_type == "financial":
         asset = extract_asset(user_idea)
         current_price = get_asset_price(asset) if asset else None
-        volatility_range = "10-20"  # Default expected short-term volatility in %
-
-        print(f"🔍 Detected Asset: {asset}, Current Price: ${current_price}")
-
-        prompt = MARKET_CREATION_PROMPT_FINANCIAL.format(
-            user_idea=user_idea,
-            asset=asset if asset else "unknown",
-            current_price=current_price if current_price else "unknown",
-            volatility_range=volatility_range
-        )
-
-    elif market_type == "news":
-        news_summary = scrape_latest_news(user_idea)
-        print(f"🔍 Scraped News Summary:\n{news_summary}")
-
-        prompt = MARKET_CREATION_PROMPT_NEWS.format(
-            user_idea=user_idea,
-            news_summary=news_summary
-        )
+        prompt = build_financial_prompt(user_idea, asset, current_price)
+        schema = FINANCIAL_MARKET
 
     else:
-        return {"error": "Invalid market type"}
+        prompt = build_news_prompt(user_idea, scrape_latest_news(user_idea))
+        schema = NEWS_MARKET
 
-    ai_response = get_llm_response(prompt)
+    return index_market(parse_market_response(get_llm_response(prompt, schema), prompt, schema), market_type)
 
-    print(f"🔍 Raw AI Response:\n{ai_response}")
+async def agenerate_market(user_idea, market_type, force=False):
+    """Async `generate_market`."""
+    if market_type not in ("financial", "news"):
+        return {"error": "Invalid market type"}
+    existing = None if force else await asyncio.to_thread(existing_market, user_idea, market_type)
+    if existing is not None:
+        return existing
 
-    ai_response_cleaned = re.sub(r"```json\n(.*?)\n```", r"\1", ai_response, flags=re.DOTALL)
+    if market_type == "financial":
+        asset = extract_asset(user_idea)
+        current_price = get_asset_price(asset) if asset else None
+        prompt = build_financial_prompt(user_idea, asset, current_price)
+        schema = FINANCIAL_MARKET
 
-    print(f"🔍 Cleaned AI Response:\n{ai_response_cleaned}")
+    else:
+        prompt = build_news_prompt(user_idea, await ascrape_latest_news(user_idea))
+        schema = NEWS_MARKET
 
-    try:
-        market_data = json.loads(ai_response_cleaned)
-        return market_data
-    except json.JSONDecodeError:
-        print(f"❌ Error parsing LLM response: {ai_response_cleaned}")
-        return {"error": "Invalid response format"}
+    market_data = await aparse_market_response(await aget_llm_response(prompt, schema), prompt, schema)
+    return await asyncio.to_thread(index_market, market_data, market_type)
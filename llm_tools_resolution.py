@@ -1,79 +1,64 @@
 import os
-import requests
-from langchain_community.llms import OpenAI
-
-# Load environment variables
-LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")  # Default to OpenAI
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-
-def get_llm_response(prompt):
-    """Selects LLM provider and returns the generated response."""
-    if LLM_PROVIDER.lower() == "deepseek":
-        if not DEEPSEEK_API_KEY:
-            raise ValueError("DeepSeek API key is missing.")
-
-        try:
-            response = requests.post(
-                "https://api.deepseek.com/beta/completions",
-                headers={"Authorization": f"Bearer {DEEPSEEK_API_KEY}", "Content-Type": "application/json"},
-                json={
-                    "model": "deepseek-chat",
-                    "prompt": prompt,
-                    "temperature": 0,
-                    "max_tokens": 5,  # Restrict output to a short number
-                    "stop": ["\n"]  # Ensure it stops after a single response
-                }
-            )
-            response_json = response.json()  # Get JSON response
-            
-            # 🛠 Debugging: Print the API response
-            print("🔍 DeepSeek API Response:", response_json)
-
-            if "choices" not in response_json or not response_json["choices"]:
-                raise ValueError(f"Unexpected API response: {response_json}")
-
-            # ✅ Extract response and clean it
-            ai_response = response_json["choices"][0]["text"].strip()
-
-            if not ai_response.isdigit():
-                raise ValueError(f"Invalid response format: {result_text}")
-
-            return ai_response
-
-        except Exception as e:
-            print(f"🚨 Error calling DeepSeek API: {e}")
-            return "ERROR: DeepSeek API failed"
-
-    elif LLM_PROVIDER.lower() == "openai":
-        if not OPENAI_API_KEY:
-            raise ValueError("OpenAI API key is missing.")
-
-        llm = OpenAI(api_key=OPENAI_API_KEY)
-        return llm.invoke(prompt)
-
-    else:
-        raise ValueError("Invalid LLM_PROVIDER. Use 'openai' or 'deepseek'.")
+import llm_providers
+from metrics import timed
+from prompt_registry import render
 
-def get_ai_resolution(market_title, description, resolution_criteria, outcome_categories, evidence):
-    """Uses an LLM (OpenAI or DeepSeek) to determine the correct market outcome."""
-    
-    prompt = f"""
-    You are an AI resolving a prediction market.
-
-    Market: {market_title}
-    Description: {description}
-    Resolution Criteria: {resolution_criteria}
-    Outcomes: {', '.join(outcome_categories)}
-    Evidence: {evidence}
-
-    Your response should be a **single integer**, representing the index of the most suitable outcome from the given list.
-    **Only respond with a number** (0, 1, 2, etc.) and nothing else.
-    """
+# Restrict output to a short number and stop after a single response
+OUTCOME_PARAMS = {"max_tokens": 5, "stop": ["\n"]}
+
+def check_outcome_response(provider, ai_response):
+    """Validates that the provider answered with a bare outcome index."""
+    print(f"🔍 {provider.name} API Response:", ai_response)
+
+    if not ai_response.isdigit():
+        raise ValueError(f"Invalid response format: {ai_response}")
+
+    return ai_response
+
+def get_llm_response(prompt, provider_name=None, model=None, **params):
+    """Asks the configured (or named) LLM provider for a single outcome index."""
+    provider = llm_providers.get_provider(provider_name)
+    try:
+        ai_response = llm_providers.get_llm_response(
+            prompt, provider_name, model=model, valid=str.isdigit, **dict(OUTCOME_PARAMS, **params)
+        )
+        return check_outcome_response(provider, ai_response)
+
+    except Exception as e:
+        print(f"🚨 Error calling {provider.name} API: {e}")
+        return f"ERROR: {provider.name} API failed"
+
+async def aget_llm_response(prompt, provider_name=None, model=None, **params):
+    """Async `get_llm_response`."""
+    provider = llm_providers.get_provider(provider_name)
+    try:
+        ai_response = await llm_providers.aget_llm_response(
+            prompt, provider_name, model=model, valid=str.isdigit, **dict(OUTCOME_PARAMS, **params)
+        )
+        return check_outcome_response(provider, ai_response)
+
+    except Exception as e:
+        print(f"🚨 Error calling {provider.name} API: {e}")
+        return f"ERROR: {provider.name} API failed"
+
+@timed("prompt_build")
+def build_resolution_prompt(market_title, description, resolution_criteria, outcome_categories, evidence):
+    """Renders the resolution prompt for one market."""
+    prompt = render(
+        "market_resolution",
+        market_title=market_title,
+        description=description,
+        resolution_criteria=resolution_criteria,
+        outcomes=", ".join(outcome_categories),
+        evidence=evidence
+    )
 
     print("🔍 Sent Prompt to AI:\n", prompt)  # Debugging the prompt
+    return prompt
 
-    ai_response = get_llm_response(prompt)
+@timed("response_parse")
+def parse_resolution(prompt, ai_response, model=None):
+    """Turns the LLM answer into the (prompt, ai_response, outcome_index, model) result."""
 
     # Debugging: Print LLM Response
     print(f"🔍 AI Response: {ai_response}")
@@ -85,7 +70,32 @@ def get_ai_resolution(market_title, description, resolution_criteria, outcome_ca
         print(f"❌ Invalid AI response format: {ai_response}")
         outcome_index = -1  # Default error case
 
-    model = os.getenv("LLM_PROVIDER", "unknown")  # Capture which LLM was used
+    model = model or os.getenv("LLM_PROVIDER", "unknown")  # Capture which LLM was used
 
     print(f"✅ Returning from get_ai_resolution: {prompt}, {ai_response}, {outcome_index}, {model}")
     return prompt, ai_response, outcome_index, model
+
+def get_ai_resolution(market_title, description, resolution_criteria, outcome_categories, evidence):
+    """Uses an LLM (OpenAI or DeepSeek) to determine the correct market outcome."""
+    prompt = build_resolution_prompt(market_title, description, resolution_criteria, outcome_categories, evidence)
+    ai_response = get_llm_response(prompt)
+    return parse_resolution(prompt, ai_response)
+
+async def aget_ai_resolution(market_title, description, resolution_criteria, outcome_categories, evidence):
+    """Async `get_ai_resolution`."""
+    prompt = build_resolution_prompt(market_title, description, resolution_criteria, outcome_categories, evidence)
+    ai_response = await aget_llm_response(prompt)
+    return parse_resolution(prompt, ai_response)
+
+def replay_ai_resolution(prompt, provider_name=None, model=None):
+    """
+    Re-asks a stored resolution prompt, optionally of another provider or model.
+    The response cache is bypassed so the model really answers again.
+    """
+    ai_response = get_llm_response(prompt, provider_name, model, cache=False)
+    return parse_resolution(prompt, ai_response, model or llm_providers.get_provider(provider_name).model)
+
+async def areplay_ai_resolution(prompt, provider_name=None, model=None):
+    """Async `replay_ai_resolution`."""
+    ai_response = await aget_llm_response(prompt, provider_name, model, cache=False)
+    return parse_resolution(prompt, ai_response, model or llm_providers.get_provider(provider_name).model)
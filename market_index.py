@@ -0,0 +1,306 @@
+"""
+Near-duplicate detection of markets before they are generated.
+
+Every market is indexed by the hashed set of its title and description terms and adjacent term
+pairs, a sparse binary embedding that needs no model. The sets of all markets sit in one flat
+array, so a lookup scores every market with a single gather and sum (NumPy when installed, a plain
+loop otherwise). Before an LLM call the user's idea, or the news story, is looked up:
+
+- an idea whose terms are mostly found in an existing market gets that market back;
+- a story that covers most of an existing market's terms gets the markets it is about.
+
+New markets are added as they are generated, and ones that repeat an indexed market are flagged.
+Markets stop matching once their resolution date has passed; financial markets, whose price
+brackets come from the price at creation, after MARKET_FINANCIAL_REUSE_SECONDS.
+"""
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from array import array
+from datetime import datetime
+
+from evidence import terms, STOPWORDS
+from metrics import Counter, stage, register_collector
+from market_schema import FINANCIAL_SECTORS
+
+MARKET_INDEX_PATH = os.getenv("MARKET_INDEX_PATH", "market_index.sqlite3")  # SQLite file of indexed markets ("" disables)
+MARKET_DUPLICATE_THRESHOLD = float(os.getenv("MARKET_DUPLICATE_THRESHOLD", "0.8"))  # Term overlap returned as a duplicate
+MARKET_STORY_THRESHOLD = float(os.getenv("MARKET_STORY_THRESHOLD", "0.6"))  # Share of a market's terms a story must contain
+MARKET_SIMILAR_THRESHOLD = float(os.getenv("MARKET_SIMILAR_THRESHOLD", "0.5"))  # Term overlap listed as similar
+MARKET_SIMILAR_LIMIT = int(os.getenv("MARKET_SIMILAR_LIMIT", "5"))  # Matches returned per lookup
+MARKET_MIN_IDEA_FEATURES = int(os.getenv("MARKET_MIN_IDEA_FEATURES", "5"))  # Terms and term pairs an idea needs to be looked up
+MARKET_FINANCIAL_REUSE_SECONDS = float(os.getenv("MARKET_FINANCIAL_REUSE_SECONDS", "3600"))  # How long a financial market is reused
+
+# Feature hashing range; collisions are negligible at a few hundred terms per market
+FEATURE_BITS = 20
+KINDS = ("news", "financial", "discovered")
+
+MARKET_INDEX_RESULTS = Counter(
+    "bigmarket_market_index_results_total",
+    "Market index checks: reused (LLM call skipped), added, or duplicate (generated, then flagged).",
+    ["result"]
+)
+
+def _numpy():
+    """NumPy if installed, else None; imported on first use so workers don't pay for it at startup."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def features(text):
+    """Hashed content terms and adjacent term pairs of `text`."""
+    words = [word for word in terms(text) if word not in STOPWORDS]
+    grams = set(words) | {f"{first} {second}" for first, second in zip(words, words[1:])}
+    mask = (1 << FEATURE_BITS) - 1
+    return {zlib.crc32(gram.encode("utf-8")) & mask for gram in grams}
+
+def market_text(market):
+    return f"{market.get('title', '')}\n{market.get('description', '')}"
+
+def market_expiry(market, kind, created_at):
+    """When the market stops being reused: its resolution date, sooner for price-bracket markets."""
+    expires_at = float("inf")
+    try:
+        expires_at = datetime.fromisoformat(market["earliest_resolution_date"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        pass
+    if kind == "financial" or market.get("market_sector") in FINANCIAL_SECTORS:
+        expires_at = min(expires_at, created_at + MARKET_FINANCIAL_REUSE_SECONDS)
+    return expires_at
+
+class MarketIndex:
+    """
+    Markets stored in SQLite and held in memory as feature sets for scoring. Expired markets score
+    0; otherwise there are three scores, each the share of features two texts have in common:
+
+    - "query": of the query's features (the query is contained in the market);
+    - "market": of the market's features (the market is contained in the query);
+    - "overlap": of the smaller set's, like the evidence deduplication.
+    """
+
+    def __init__(self, path=MARKET_INDEX_PATH):
+        self._lock = threading.Lock()
+        self._np = _numpy()
+        self.count = 0
+        self._ids = []
+        self._kinds = []
+        self._sizes = []
+        self._expires = []
+        self._sets = []  # Feature arrays, without NumPy
+        if self._np is not None:
+            np = self._np
+            self._ids = np.empty(1024, dtype=np.int64)
+            self._kinds = np.empty(1024, dtype=np.uint8)
+            self._sizes = np.empty(1024, dtype=np.float64)
+            self._expires = np.empty(1024, dtype=np.float64)
+            self._starts = np.empty(1024, dtype=np.int64)
+            self._features = np.empty(64 * 1024, dtype=np.uint32)
+            self._used = 0
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS markets ("
+            "id INTEGER PRIMARY KEY, kind TEXT NOT NULL, text TEXT NOT NULL, market TEXT NOT NULL, "
+            "created_at REAL NOT NULL, expires_at REAL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(markets)")}
+        if "expires_at" not in columns:  # Indexes created before markets expired
+            self._db.execute("ALTER TABLE markets ADD COLUMN expires_at REAL")
+        self._db.commit()
+        rows = self._db.execute("SELECT id, kind, text, market, created_at, expires_at FROM markets ORDER BY id")
+        for market_id, kind, text, market, created_at, expires_at in rows:
+            if expires_at is None:
+                expires_at = market_expiry(json.loads(market), kind, created_at)
+            self._append(market_id, kind, features(text), expires_at)
+        print(f"🔹 Loaded {self.count} markets into the market index")
+
+    def _grown(self, values, minimum):
+        grown = self._np.empty(max(minimum, 2 * len(values)), dtype=values.dtype)
+        grown[:len(values)] = values
+        return grown
+
+    def _append(self, market_id, kind, feature_ids, expires_at):
+        if not feature_ids:
+            return
+        code = KINDS.index(kind)
+        if self._np is None:
+            self._ids.append(market_id)
+            self._kinds.append(code)
+            self._sizes.append(len(feature_ids))
+            self._expires.append(expires_at)
+            self._sets.append(array("I", feature_ids))
+            self.count += 1
+            return
+
+        n, used = self.count, self._used
+        if n == len(self._ids):
+            self._ids, self._kinds, self._sizes, self._expires, self._starts = (
+                self._grown(values, n + 1)
+                for values in (self._ids, self._kinds, self._sizes, self._expires, self._starts)
+            )
+        if used + len(feature_ids) > len(self._features):
+            self._features = self._grown(self._features, used + len(feature_ids))
+        self._features[used:used + len(feature_ids)] = sorted(feature_ids)
+        self._ids[n], self._kinds[n], self._sizes[n], self._starts[n] = market_id, code, len(feature_ids), used
+        self._expires[n] = expires_at
+        self._used = used + len(feature_ids)
+        self.count = n + 1
+
+    def _scores(self, query, mode, kinds):
+        """Score of every indexed market against the `query` feature set, 0 for expired markets and other kinds."""
+        codes = {KINDS.index(kind) for kind in kinds} if kinds else None
+        now = time.time()
+        if self._np is None:
+            scores = []
+            for code, size, expires_at, feature_ids in zip(self._kinds, self._sizes, self._expires, self._sets):
+                if expires_at <= now or (codes is not None and code not in codes):
+                    scores.append(0)
+                    continue
+                shared = len(query.intersection(feature_ids))
+                denominator = len(query) if mode == "query" else size if mode == "market" else min(size, len(query))
+                scores.append(shared / denominator)
+            return scores
+
+        np, n = self._np, self.count
+        lookup = np.zeros(1 << FEATURE_BITS, dtype=bool)
+        lookup[list(query)] = True
+        # Features each market shares with the query: one gather over the flat array, summed per market.
+        # take() gathers with the uint32 indices as they are; fancy indexing would copy them to intp first.
+        shared = np.add.reduceat(lookup.take(self._features[:self._used]), self._starts[:n], dtype=np.int32)
+        sizes = self._sizes[:n]
+        if mode == "query":
+            scores = shared / len(query)
+        elif mode == "market":
+            scores = shared / sizes
+        else:
+            scores = shared / np.minimum(sizes, len(query))
+        scores[self._expires[:n] <= now] = 0
+        if codes is not None:
+            scores[~np.isin(self._kinds[:n], list(codes))] = 0
+        return scores
+
+    def search(self, text, mode="overlap", kinds=None, threshold=MARKET_SIMILAR_THRESHOLD, limit=MARKET_SIMILAR_LIMIT):
+        """[(score, market_id, market)] scoring at least `threshold`, best first."""
+        query = features(text)
+        if not query:
+            return []
+        with self._lock:
+            if not self.count:
+                return []
+            scores = self._scores(query, mode, kinds)
+            if self._np is None:
+                best = sorted((i for i, score in enumerate(scores) if score >= threshold), key=lambda i: -scores[i])
+                found = [(scores[i], self._ids[i]) for i in best[:limit]]
+            else:
+                candidates = self._np.flatnonzero(scores >= threshold)
+                best = candidates[self._np.argsort(-scores[candidates], kind="stable")][:limit]
+                found = [(float(scores[i]), int(self._ids[i])) for i in best]
+        return [(score, market_id, self.get(market_id)) for score, market_id in found]
+
+    def get(self, market_id):
+        with self._lock:
+            row = self._db.execute("SELECT market FROM markets WHERE id = ?", (market_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add(self, market, kind):
+        """Indexes a market and returns its ID, or None if it has no indexable text."""
+        text = market_text(market)
+        feature_ids = features(text)
+        if not feature_ids:
+            return None
+        created_at = time.time()
+        expires_at = market_expiry(market, kind, created_at)
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO markets (kind, text, market, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, text, json.dumps(market), created_at, expires_at)
+            )
+            self._db.commit()
+            self._append(cursor.lastrowid, kind, feature_ids, expires_at)
+        return cursor.lastrowid
+
+_market_index = None
+_market_index_lock = threading.Lock()
+
+def market_index():
+    """The shared market index, loaded on first use. None when MARKET_INDEX_PATH is empty."""
+    global _market_index
+    if not MARKET_INDEX_PATH:
+        return None
+    with _market_index_lock:
+        if _market_index is None:
+            _market_index = MarketIndex()
+        return _market_index
+
+def _collect():
+    size = _market_index.count if _market_index is not None else 0
+    return [("bigmarket_market_index_markets", "gauge", "Markets in the near-duplicate index.", [((), size)])]
+
+register_collector(_collect)
+
+def _duplicate(market, market_id, score):
+    return dict(market, duplicate_of=market_id, similarity=round(score, 3))
+
+def existing_market(user_idea, market_type):
+    """
+    An indexed market that already covers the user's idea, to return instead of generating one.
+    Ideas of only a word or two are not looked up: every market mentioning them would contain them.
+    """
+    index = market_index()
+    if index is None or len(features(user_idea)) < MARKET_MIN_IDEA_FEATURES:
+        return None
+    with stage("market_index"):
+        found = index.search(user_idea, "query", (market_type, "discovered"), MARKET_DUPLICATE_THRESHOLD, 1)
+    if not found:
+        return None
+    score, market_id, market = found[0]
+    print(f"♻️ Returning existing market {market_id} ({score:.2f}) instead of generating one")
+    MARKET_INDEX_RESULTS.inc(result="reused")
+    return _duplicate(market, market_id, score)
+
+def existing_markets(news_story):
+    """Indexed markets the news story is about, to return instead of discovering them again; else None."""
+    index = market_index()
+    if index is None:
+        return None
+    with stage("market_index"):
+        found = index.search(news_story, "market", None, MARKET_STORY_THRESHOLD)
+    if not found:
+        return None
+    print(f"♻️ Story covered by {len(found)} existing markets, skipping discovery")
+    MARKET_INDEX_RESULTS.inc(result="reused")
+    return {"markets": [_duplicate(market, market_id, score) for score, market_id, market in found]}
+
+def index_market(market, kind):
+    """
+    Adds a generated market to the index, listing similar indexed markets under `similar_markets`.
+    One that repeats an indexed market is not added but marked `duplicate_of` it.
+    """
+    index = market_index()
+    if index is None or not isinstance(market, dict) or "error" in market:
+        return market
+    with stage("market_index"):
+        similar = index.search(market_text(market))
+        if similar and similar[0][0] >= MARKET_DUPLICATE_THRESHOLD:
+            market["duplicate_of"] = similar[0][1]
+            MARKET_INDEX_RESULTS.inc(result="duplicate")
+        else:
+            market["market_index_id"] = index.add(market, kind)
+            MARKET_INDEX_RESULTS.inc(result="added")
+    if similar:
+        market["similar_markets"] = [
+            {"id": market_id, "title": other.get("title"), "similarity": round(score, 3)}
+            for score, market_id, other in similar
+        ]
+    return market
+
+def index_markets(market_data):
+    """`index_market` for each market of a discovery result."""
+    if isinstance(market_data, dict) and isinstance(market_data.get("markets"), list):
+        market_data["markets"] = [index_market(market, "discovered") for market in market_data["markets"]]
+    return market_data
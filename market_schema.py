@@ -0,0 +1,208 @@
+"""
+Validation of the markets the LLM returns, and targeted repair of the ones that fail.
+
+Schemas are compiled once into plain validator closures. When an answer fails, only the broken
+document (a single market for discovery) is sent back to the model together with the errors, in
+JSON mode where the provider supports it, instead of regenerating everything from the news.
+"""
+import os
+import re
+import json
+from datetime import datetime
+
+import llm_providers
+from llm_json import parse_llm_json, load_llm_json
+from metrics import Counter, stage, ERRORS
+from prompt_registry import render
+
+MARKET_REPAIR_ATTEMPTS = int(os.getenv("MARKET_REPAIR_ATTEMPTS", "1"))  # Repair calls per invalid answer (0 disables)
+MARKET_REPAIR_MAX_TOKENS = int(os.getenv("MARKET_REPAIR_MAX_TOKENS", "600"))  # Output cap of a repair call
+
+NEWS_SECTORS = ("politics", "sports", "economy", "climate", "technology")
+FINANCIAL_SECTORS = ("crypto", "stocks", "commodities")
+DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+SCHEMA_RESULTS = Counter(
+    "bigmarket_schema_results_total",
+    "LLM answers checked against a schema: valid, repaired or invalid after repair.",
+    ["schema", "result"]
+)
+
+def string(choices=None, pattern=None, expected=None):
+    choices = set(choices) if choices else None
+    def check(value, path, errors):
+        if not isinstance(value, str) or not value.strip():
+            errors.append(f"{path}: must be a non-empty string")
+        elif choices and value not in choices:
+            errors.append(f"{path}: must be one of {sorted(choices)}, got {value!r}")
+        elif pattern and not pattern(value):
+            errors.append(f"{path}: must be {expected}, got {value!r}")
+    return check
+
+def _is_date(value):
+    if not DATE_PATTERN.match(value):
+        return False
+    try:
+        datetime.fromisoformat(value)  # Much faster than strptime; the pattern already pinned the format
+    except ValueError:
+        return False
+    return True
+
+def date():
+    return string(pattern=_is_date, expected="a YYYY-MM-DD date")
+
+def integer(minimum=None):
+    def check(value, path, errors):
+        if not isinstance(value, int) or isinstance(value, bool):
+            errors.append(f"{path}: must be an integer")
+        elif minimum is not None and value < minimum:
+            errors.append(f"{path}: must be at least {minimum}")
+    return check
+
+def array(item, min_items=0, max_items=None, unique=False):
+    def check(value, path, errors):
+        if not isinstance(value, list):
+            errors.append(f"{path}: must be a list")
+            return
+        if len(value) < min_items or (max_items is not None and len(value) > max_items):
+            bounds = f"between {min_items} and {max_items}" if max_items is not None else f"at least {min_items}"
+            errors.append(f"{path}: must have {bounds} item(s), got {len(value)}")
+        if unique and len({element.strip().lower() if isinstance(element, str) else repr(element)
+                           for element in value}) < len(value):
+            errors.append(f"{path}: items must be distinct")
+        for index, element in enumerate(value):
+            item(element, f"{path}[{index}]", errors)
+    return check
+
+def obj(required, optional=None):
+    """An object with the `required` and `optional` {key: validator} fields; other keys are allowed."""
+    fields = [(key, validator, True) for key, validator in required.items()]
+    fields += [(key, validator, False) for key, validator in (optional or {}).items()]
+    def check(value, path, errors):
+        if not isinstance(value, dict):
+            errors.append(f"{path or 'answer'}: must be an object")
+            return
+        for key, validator, is_required in fields:
+            field_path = f"{path}.{key}" if path else key
+            if key in value:
+                validator(value[key], field_path, errors)
+            elif is_required:
+                errors.append(f"{field_path}: is required")
+    return check
+
+class Schema:
+    """A named, compiled validator."""
+
+    def __init__(self, name, validator, sectors=()):
+        self.name = name
+        self.validator = validator
+        self.sectors = sectors
+
+    def errors(self, value):
+        """Every problem with `value`, as "path: message" strings; empty when it is valid."""
+        errors = []
+        self.validator(value, "", errors)
+        return errors
+
+    def accepts(self, ai_response):
+        """True if a raw LLM answer parses and is valid; answers that aren't are kept out of the cache."""
+        data = load_llm_json(ai_response)
+        return data is not None and not self.errors(data)
+
+def market_fields(sectors):
+    return {
+        "title": string(),
+        "description": string(),
+        "outcome_categories": array(string(), min_items=2, max_items=10, unique=True),
+        "market_sector": string(choices=sectors),
+        "resolution_criteria": string(),
+        "earliest_resolution_date": date(),
+        "sources": array(string(), min_items=1),
+    }
+
+NEWS_MARKET = Schema("news_market", obj(market_fields(NEWS_SECTORS)), NEWS_SECTORS)
+FINANCIAL_MARKET = Schema("financial_market", obj(market_fields(FINANCIAL_SECTORS)), FINANCIAL_SECTORS)
+DISCOVERED_MARKET = Schema(
+    "discovered_market",
+    obj(market_fields(NEWS_SECTORS + FINANCIAL_SECTORS), {"article": integer(minimum=1)}),
+    NEWS_SECTORS + FINANCIAL_SECTORS
+)
+# The discovery answer itself: a list of markets (checked one by one) or the model's refusal
+DISCOVERY = Schema("discovery", obj({"markets": array(obj({}))}))
+
+def build_repair_prompt(document, errors, schema):
+    """A prompt asking the model to fix only the listed errors in `document` (parsed JSON or raw text)."""
+    if not isinstance(document, str):
+        document = json.dumps(document, indent=2, ensure_ascii=False)
+    return render(
+        "market_repair",
+        sectors=", ".join(schema.sectors) or "any",
+        errors="\n".join(f"- {error}" for error in errors),
+        document=document
+    )
+
+def check(ai_response, schema):
+    """Parses and validates an LLM answer. Returns (data, errors); data is None if it isn't JSON."""
+    data = parse_llm_json(ai_response)
+    if data is None:
+        return None, ["answer is not valid JSON"]
+    with stage("schema_validate"):
+        return data, schema.errors(data)
+
+def _repair_params(schema):
+    return dict(json_mode=True, max_tokens=MARKET_REPAIR_MAX_TOKENS, valid=schema.accepts)
+
+def _record(schema, errors, repaired):
+    if errors:
+        print(f"❌ {schema.name} still invalid after repair: {errors}")
+        ERRORS.inc(stage="schema_validate")
+    SCHEMA_RESULTS.inc(schema=schema.name, result="invalid" if errors else "repaired" if repaired else "valid")
+
+def repair(data, errors, schema, raw=None):
+    """
+    Sends the targeted repair prompt up to MARKET_REPAIR_ATTEMPTS times.
+    Returns (data, errors) for the last attempt, or the input unchanged if the call fails.
+    """
+    attempts = 0
+    while errors and attempts < MARKET_REPAIR_ATTEMPTS:
+        attempts += 1
+        print(f"🔧 Repairing {schema.name}: {errors}")
+        prompt = build_repair_prompt(raw if data is None else data, errors, schema)
+        try:
+            with stage("repair"):
+                ai_response = llm_providers.get_llm_response(prompt, **_repair_params(schema))
+        except Exception as e:
+            print(f"🚨 Error calling repair prompt: {e}")
+            break
+        data, errors = check(ai_response, schema)
+        raw = ai_response
+    _record(schema, errors, attempts > 0)
+    return data, errors
+
+async def arepair(data, errors, schema, raw=None):
+    """Async `repair`."""
+    attempts = 0
+    while errors and attempts < MARKET_REPAIR_ATTEMPTS:
+        attempts += 1
+        print(f"🔧 Repairing {schema.name}: {errors}")
+        prompt = build_repair_prompt(raw if data is None else data, errors, schema)
+        try:
+            with stage("repair"):
+                ai_response = await llm_providers.aget_llm_response(prompt, **_repair_params(schema))
+        except Exception as e:
+            print(f"🚨 Error calling repair prompt: {e}")
+            break
+        data, errors = check(ai_response, schema)
+        raw = ai_response
+    _record(schema, errors, attempts > 0)
+    return data, errors
+
+def validate(ai_response, schema):
+    """Checks an LLM answer and repairs it if needed. Returns (data, errors)."""
+    data, errors = check(ai_response, schema)
+    return repair(data, errors, schema, ai_response)
+
+async def avalidate(ai_response, schema):
+    """Async `validate`."""
+    data, errors = check(ai_response, schema)
+    return await arepair(data, errors, schema, ai_response)
@@ -0,0 +1,170 @@
+import json
+import time
+import uuid
+import bisect
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+_collectors = []  # Callables returning [(name, type, help, [(labels, value), ...])] at scrape time
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _format_value(bound)
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-1])}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+def register_collector(collector):
+    """Adds a callable whose samples are read on every /metrics scrape (for stats kept elsewhere)."""
+    _collectors.append(collector)
+
+def render():
+    """Returns all metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+
+    # Several collectors may report samples for the same metric name
+    collected = {}
+    for collector in _collectors:
+        for name, kind, help, samples in collector():
+            collected.setdefault(name, (kind, help, []))[2].extend(samples)
+    for name, (kind, help, samples) in collected.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{_format_labels([k for k, _ in labels], [v for _, v in labels])} "
+                         f"{_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+REQUEST_SECONDS = Histogram("bigmarket_request_seconds", "End-to-end HTTP request latency.", ["endpoint"])
+REQUESTS = Counter("bigmarket_requests_total", "HTTP requests by endpoint and status.", ["endpoint", "status"])
+STAGE_SECONDS = Histogram("bigmarket_stage_seconds", "Latency of each pipeline stage.", ["stage"])
+ERRORS = Counter("bigmarket_errors_total", "Errors raised inside a pipeline stage.", ["stage"])
+LLM_TOKENS = Counter("bigmarket_llm_tokens_total", "Tokens reported by the LLM provider.", ["provider", "kind"])
+
+# Per-request trace: {"trace_id": ..., "stages": {stage: seconds}}
+_trace = contextvars.ContextVar("trace", default=None)
+
+def start_trace(trace_id=None):
+    """Begins a request trace in the current context and returns its ID."""
+    trace = {"trace_id": trace_id or uuid.uuid4().hex, "stages": {}}
+    _trace.set(trace)
+    return trace["trace_id"]
+
+def current_trace_id():
+    trace = _trace.get()
+    return trace["trace_id"] if trace else None
+
+@contextmanager
+def stage(name):
+    """Times a pipeline stage into the stage histogram and the current trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.inc(stage=name)
+        raise
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+def timed(name):
+    """Decorator form of `stage` for functions that are a whole stage."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_stage(name, seconds):
+    """Records a stage duration measured by the caller."""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    trace = _trace.get()
+    if trace is not None:
+        stages = trace["stages"]
+        stages[name] = stages.get(name, 0) + seconds
+
+def log_event(event, **fields):
+    """Prints one JSON log line tagged with the current trace ID."""
+    trace = _trace.get()
+    record = {"ts": round(time.time(), 3), "event": event, "trace_id": trace["trace_id"] if trace else None}
+    record.update(fields)
+    print(json.dumps(record, default=str), flush=True)
+
+def finish_trace(endpoint, status, seconds):
+    """Records the request in the endpoint metrics and logs its per-stage breakdown."""
+    REQUEST_SECONDS.observe(seconds, endpoint=endpoint)
+    REQUESTS.inc(endpoint=endpoint, status=status)
+    trace = _trace.get()
+    stages = {name: round(value, 4) for name, value in trace["stages"].items()} if trace else {}
+    log_event("request", endpoint=endpoint, status=status, duration=round(seconds, 4), stages=stages)
@@ -0,0 +1,262 @@
+"""
+Bulk market discovery from RSS/Atom feeds and sitemaps.
+
+    python news_pipeline.py https://example.com/rss.xml https://example.com/news-sitemap.xml --every 300
+
+writes one JSON line per discovered market. The same pipeline backs POST /discover-markets/feeds.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from scraping_tools import fetch_cached, fetch_news_summary, normalize_url
+from llm_tools_ai_markets import (
+    format_news_summary, build_discovery_prompt, build_batch_discovery_prompt, get_llm_response,
+    parse_discovery_response, with_prompt_info
+)
+from market_index import existing_markets, index_market
+
+NEWS_SEEN_PATH = os.getenv("NEWS_SEEN_PATH", "news_seen.sqlite3")  # SQLite file of processed articles
+NEWS_CONCURRENCY = int(os.getenv("NEWS_CONCURRENCY", "8"))  # Articles scraped / LLM calls in parallel
+NEWS_MAX_ARTICLES = int(os.getenv("NEWS_MAX_ARTICLES", "200"))  # New articles handled per scan
+NEWS_PACK_CHARS = int(os.getenv("NEWS_PACK_CHARS", "1500"))  # Summaries shorter than this are packed
+NEWS_PACK_SIZE = int(os.getenv("NEWS_PACK_SIZE", "4"))  # Short articles per packed LLM call (1 disables)
+NEWS_SITEMAP_DEPTH = 1  # Sitemap indexes are followed this many levels down
+
+def _local(tag):
+    """Element name without its XML namespace."""
+    return tag.rsplit("}", 1)[-1].lower()
+
+def _child_text(element, name):
+    for child in element:
+        if _local(child.tag) == name:
+            return (child.text or "").strip()
+    return ""
+
+def parse_feed(content):
+    """
+    Returns {"articles": [{"url", "title"}], "sitemaps": [url]} from an RSS or Atom feed, a sitemap,
+    or a sitemap index (whose child sitemaps are listed rather than fetched).
+    """
+    import xml.etree.ElementTree as ElementTree  # Only feed discovery parses XML
+
+    root = ElementTree.fromstring(content)
+    articles, sitemaps = [], []
+    for element in root.iter():
+        name = _local(element.tag)
+        if name == "item":  # RSS
+            url = _child_text(element, "link") or _child_text(element, "guid")
+            articles.append({"url": url, "title": _child_text(element, "title")})
+        elif name == "entry":  # Atom
+            links = [child for child in element if _local(child.tag) == "link"]
+            alternate = [link for link in links if link.get("rel", "alternate") == "alternate"] or links
+            url = alternate[0].get("href", "") if alternate else ""
+            articles.append({"url": url, "title": _child_text(element, "title")})
+        elif name == "url":  # Sitemap, possibly with a Google News <news:title>
+            title = next((child.text or "" for child in element.iter() if _local(child.tag) == "title"), "")
+            articles.append({"url": _child_text(element, "loc"), "title": title.strip()})
+        elif name == "sitemap":  # Sitemap index
+            sitemaps.append(_child_text(element, "loc"))
+    return {"articles": [article for article in articles if article["url"]], "sitemaps": [s for s in sitemaps if s]}
+
+def fetch_feed(url):
+    """Fetches and parses a feed; repeat scans revalidate it instead of downloading it again."""
+    return fetch_cached(url, "feed", lambda response: parse_feed(response.content),
+                        headers={"User-Agent": "Mozilla/5.0"})
+
+def feed_articles(feed_urls, depth=NEWS_SITEMAP_DEPTH):
+    """Articles from every feed, following sitemap indexes, with duplicate URLs removed."""
+    articles = {}
+    for url in feed_urls:
+        try:
+            feed = fetch_feed(url)
+        except Exception as e:
+            print(f"❌ Error reading feed {url}: {e}")
+            continue
+        for article in feed["articles"]:
+            articles.setdefault(normalize_url(article["url"]), article)
+        if depth > 0 and feed["sitemaps"]:
+            for article in feed_articles(feed["sitemaps"], depth - 1):
+                articles.setdefault(normalize_url(article["url"]), article)
+    return list(articles.values())
+
+def content_hash(text):
+    """Hash of an article's summary, ignoring case and whitespace, to spot syndicated copies."""
+    return hashlib.sha256(" ".join(text.lower().split()).encode("utf-8")).hexdigest()
+
+class SeenStore:
+    """Persistent set of processed articles, keyed on canonical URL and on content hash."""
+
+    def __init__(self, path=NEWS_SEEN_PATH):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS seen (url TEXT PRIMARY KEY, content_hash TEXT, seen_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS seen_hash ON seen (content_hash)")
+        self._db.commit()
+
+    def unseen(self, urls):
+        """The canonical URLs (in order) that have not been processed yet."""
+        urls = list(dict.fromkeys(normalize_url(url) for url in urls))
+        seen = set()
+        with self._lock:
+            for start in range(0, len(urls), 500):  # Stay under SQLite's bound-parameter limit
+                batch = urls[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT url FROM seen WHERE url IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                seen.update(row[0] for row in rows)
+        return [url for url in urls if url not in seen]
+
+    def has_content(self, digest):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM seen WHERE content_hash = ?", (digest,)).fetchone() is not None
+
+    def add(self, url, digest=None):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO seen (url, content_hash, seen_at) VALUES (?, ?, ?)",
+                (normalize_url(url), digest, time.time())
+            )
+            self._db.commit()
+
+def _summarise(article):
+    """Adds the scraped summary to an article, or returns None when there is nothing to read."""
+    try:
+        summary = format_news_summary(*fetch_news_summary(article["url"]))
+    except Exception as e:
+        print(f"❌ Error scraping news: {e}")
+        return None
+    if summary == "No summary available.":
+        return None
+    return dict(article, summary=summary, content_hash=content_hash(summary))
+
+def pack(articles, max_chars=NEWS_PACK_CHARS, pack_size=NEWS_PACK_SIZE):
+    """Groups articles into LLM calls: long ones alone, short ones up to `pack_size` per call."""
+    groups, short = [], []
+    for article in articles:
+        if len(article["summary"]) >= max_chars or pack_size <= 1:
+            groups.append([article])
+        else:
+            short.append(article)
+            if len(short) == pack_size:
+                groups.append(short)
+                short = []
+    if short:
+        groups.append(short)
+    return groups
+
+def _discover(group):
+    """
+    Runs one discovery call for a group of articles; returns its markets tagged with their article.
+    Markets repeating an indexed one are left out.
+    """
+    if len(group) == 1:
+        prompt = build_discovery_prompt(group[0]["summary"])
+    else:
+        prompt = build_batch_discovery_prompt([article["summary"] for article in group])
+    market_data = parse_discovery_response(get_llm_response(prompt))
+    if "error" in market_data:
+        raise ValueError(market_data["error"])
+
+    markets = []
+    for market in market_data.get("markets", []):
+        number = market.pop("article", 1) if len(group) > 1 else 1
+        if not isinstance(number, int) or not 1 <= number <= len(group):
+            continue  # The model referred to a story that does not exist
+        market["news_url"] = group[number - 1]["url"]
+        market = index_market(with_prompt_info(market, prompt), "discovered")
+        if "duplicate_of" not in market:
+            markets.append(market)
+    return markets
+
+def max_articles_of(data):
+    """A request's `max_articles` as a positive int, NEWS_MAX_ARTICLES when absent, or None when invalid."""
+    value = data.get("max_articles", NEWS_MAX_ARTICLES)
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        return None
+    return value if value > 0 else None
+
+def discover_markets_from_feeds(feed_urls, max_articles=NEWS_MAX_ARTICLES, seen=None, concurrency=NEWS_CONCURRENCY):
+    """
+    Yields candidate markets for the new articles in the given feeds as each LLM call completes.
+    Articles are only marked as seen once their call succeeded, so failures are retried on the next scan.
+    """
+    seen = seen or seen_store()
+    articles = {normalize_url(article["url"]): article for article in feed_articles(feed_urls)}
+    new_urls = seen.unseen(articles)[:max_articles]
+    print(f"🔹 {len(new_urls)} new of {len(articles)} articles in {len(feed_urls)} feeds")
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="news") as pool:
+        summaries = pool.map(lambda url: _summarise(articles[url]), new_urls)
+        fresh, hashes = [], set()
+        for article in summaries:
+            if article is None:
+                continue
+            if article["content_hash"] in hashes or seen.has_content(article["content_hash"]):
+                seen.add(article["url"], article["content_hash"])  # Same story under another URL
+                continue
+            if existing_markets(article["summary"]) is not None:
+                seen.add(article["url"], article["content_hash"])  # Another article on an indexed event
+                continue
+            hashes.add(article["content_hash"])
+            fresh.append(article)
+
+        groups = pack(fresh)
+        print(f"🔹 Discovering markets for {len(fresh)} articles in {len(groups)} LLM calls")
+        futures = {pool.submit(contextvars.copy_context().run, _discover, group): group for group in groups}
+        try:
+            for future in as_completed(futures):
+                group = futures[future]
+                try:
+                    markets = future.result()
+                except Exception as e:
+                    print(f"❌ Error discovering markets for {len(group)} articles: {e}")
+                    continue
+                for article in group:
+                    seen.add(article["url"], article["content_hash"])
+                yield from markets
+        except GeneratorExit:
+            # The consumer went away (e.g. a streaming client disconnected): skip the calls not yet started
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+_seen_store = None
+_seen_store_lock = threading.Lock()
+
+def seen_store():
+    """The shared seen-set, opened on first use."""
+    global _seen_store
+    with _seen_store_lock:
+        if _seen_store is None:
+            _seen_store = SeenStore()
+        return _seen_store
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("feeds", nargs="+", help="RSS/Atom feed or sitemap URLs")
+    parser.add_argument("--every", type=float, default=0, help="Rescan the feeds every N seconds")
+    parser.add_argument("--max-articles", type=int, default=NEWS_MAX_ARTICLES)
+    parser.add_argument("--output", help="Append markets to this file instead of stdout")
+    args = parser.parse_args()
+
+    output = open(args.output, "a") if args.output else sys.stdout
+    while True:
+        for market in discover_markets_from_feeds(args.feeds, args.max_articles):
+            output.write(json.dumps(market) + "\n")
+            output.flush()
+        if not args.every:
+            break
+        time.sleep(args.every)
@@ -0,0 +1,205 @@
+import os
+import json
+import asyncio
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+from metrics import register_collector
+
+# Scraped-content cache settings
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))  # In-memory budget, 0 disables
+PAGE_CACHE_PATH = os.getenv("PAGE_CACHE_PATH")  # SQLite file for the on-disk tier (optional)
+PAGE_CACHE_DISK_MAX_BYTES = int(os.getenv("PAGE_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "300"))  # Seconds a page is served without revalidating
+
+# Per-domain freshness overrides (seconds); subdomains inherit. Extend with PAGE_CACHE_DOMAIN_TTL='{"host": secs}'.
+DOMAIN_TTL = {
+    "news.google.com": 120,
+    "coingecko.com": 30,
+    "reuters.com": 300,
+}
+DOMAIN_TTL.update(json.loads(os.getenv("PAGE_CACHE_DOMAIN_TTL", "{}")))
+
+class CachedPage:
+    """Extracted content of a page plus the validators needed to revalidate it."""
+
+    __slots__ = ("value", "etag", "last_modified", "validated_at", "size")
+
+    def __init__(self, value, etag=None, last_modified=None, validated_at=None):
+        self.value = value
+        self.etag = etag
+        self.last_modified = last_modified
+        self.validated_at = validated_at if validated_at is not None else time.time()
+        self.size = len(json.dumps(value))
+
+    def conditional_headers(self):
+        """Headers that let the server answer 304 Not Modified."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+def freshness(url):
+    """Seconds a page from this URL's domain may be served without revalidation."""
+    host = (urlsplit(url).hostname or "").lower()
+    while host:
+        if host in DOMAIN_TTL:
+            return DOMAIN_TTL[host]
+        host = host.partition(".")[2]
+    return PAGE_CACHE_TTL
+
+class PageCache:
+    """Byte-bounded LRU of extracted page content, with an optional SQLite tier."""
+
+    def __init__(self, max_bytes=PAGE_CACHE_MAX_BYTES, path=PAGE_CACHE_PATH, disk_max_bytes=PAGE_CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.hits = 0  # Served without a request
+        self.revalidations = 0  # Served after a 304
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if path and max_bytes > 0:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, value TEXT NOT NULL, etag TEXT, "
+                "last_modified TEXT, validated_at REAL NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed_at)")
+            self._db.commit()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def lookup(self, key, url):
+        """
+        Returns (entry, fresh). `entry` is None on a miss; a stale entry is returned with
+        fresh=False so its validators can be sent with the next request.
+        """
+        if not self.enabled:
+            return None, False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            else:
+                entry = self._disk_get(key)
+                if entry is not None:
+                    self._remember(key, entry)
+
+            if entry is None:
+                self.misses += 1
+                return None, False
+            fresh = time.time() - entry.validated_at < freshness(url)
+            if fresh:
+                self.hits += 1
+            return entry, fresh
+
+    def store(self, key, value, headers):
+        """Caches freshly extracted content with the response's validators."""
+        if not self.enabled:
+            return
+        entry = CachedPage(value, headers.get("ETag"), headers.get("Last-Modified"))
+        with self._lock:
+            self._remember(key, entry)
+            self._disk_put(key, entry)
+
+    def revalidated(self, key, entry):
+        """Marks a stale entry fresh again after the server answered 304."""
+        entry.validated_at = time.time()
+        with self._lock:
+            self.revalidations += 1
+            self._disk_put(key, entry)
+
+    async def alookup(self, key, url):
+        """`lookup` for the event loop: memory hits are served inline, SQLite lookups from a worker thread."""
+        with self._lock:
+            in_memory = key in self._entries
+        if in_memory or self._db is None:
+            return self.lookup(key, url)
+        return await asyncio.to_thread(self.lookup, key, url)
+
+    async def astore(self, key, value, headers):
+        """`store` for the event loop: the SQLite write runs in a worker thread."""
+        if self._db is None:
+            self.store(key, value, headers)
+        else:
+            await asyncio.to_thread(self.store, key, value, headers)
+
+    async def arevalidated(self, key, entry):
+        """`revalidated` for the event loop: the SQLite write runs in a worker thread."""
+        if self._db is None:
+            self.revalidated(key, entry)
+        else:
+            await asyncio.to_thread(self.revalidated, key, entry)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "revalidations": self.revalidations,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _remember(self, key, entry):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.size
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+
+    def _disk_get(self, key):
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT value, etag, last_modified, validated_at FROM pages WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._db.execute("UPDATE pages SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+        return CachedPage(json.loads(row[0]), row[1], row[2], row[3])
+
+    def _disk_put(self, key, entry):
+        if self._db is None:
+            return
+        self._db.execute(
+            "INSERT OR REPLACE INTO pages (key, value, etag, last_modified, validated_at, size, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, json.dumps(entry.value), entry.etag, entry.last_modified, entry.validated_at, entry.size, time.time())
+        )
+        # Evict least recently used rows beyond the disk budget
+        self._db.execute(
+            "DELETE FROM pages WHERE key IN (SELECT key FROM "
+            "(SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC) AS running FROM pages) WHERE running > ?)",
+            (self.disk_max_bytes,)
+        )
+        self._db.commit()
+
+# Shared by every scraper
+page_cache = PageCache()
+
+def _collect():
+    stats = page_cache.stats()
+    return [
+        ("bigmarket_page_cache_lookups_total", "counter", "Scraped-page cache lookups by outcome.", [
+            ((("result", "hit"),), stats["hits"]),
+            ((("result", "revalidated"),), stats["revalidations"]),
+            ((("result", "miss"),), stats["misses"]),
+        ]),
+        ("bigmarket_page_cache_bytes", "gauge", "Extracted page content held in memory.", [((), stats["bytes"])]),
+    ]
+
+register_collector(_collect)
@@ -0,0 +1,107 @@
+import os
+import time
+import threading
+from decimal import Decimal
+
+import scraping_tools
+from metrics import register_collector
+
+PRICE_FEED_URL = os.getenv("PRICE_FEED_URL", "https://api.coingecko.com/api/v3/simple/price")
+PRICE_FEED_TTL = float(os.getenv("PRICE_FEED_TTL", "60"))  # Seconds between snapshot refreshes
+PRICE_FEED_MIN_INTERVAL = float(os.getenv("PRICE_FEED_MIN_INTERVAL", "5"))  # Floor between requests
+PRICE_FEED_TIMEOUT = float(os.getenv("PRICE_FEED_TIMEOUT", "10"))
+PRICE_FEED_MAX_EXTRA_ASSETS = int(os.getenv("PRICE_FEED_MAX_EXTRA_ASSETS", "50"))
+
+# CoinGecko ids always included in the snapshot
+KNOWN_ASSETS = ["bitcoin", "ethereum", "stacks", "solana", "cardano", "ripple"]
+
+class PriceFeed:
+    """
+    In-memory USD price snapshot for a set of assets, refreshed in the background with one
+    batched /simple/price request. Lookups never wait on the network: they return the latest
+    snapshot, stale if the feed is slow or down.
+    """
+
+    def __init__(self, assets=KNOWN_ASSETS, ttl=PRICE_FEED_TTL):
+        self.ttl = ttl
+        self._known = list(assets)
+        self._extra = []  # Other assets users asked about, most recent last
+        self._prices = {}
+        self.updated_at = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._started = False
+
+    def start(self):
+        """Starts the refresh thread. Safe to call repeatedly."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name="price-feed", daemon=True).start()
+
+    def get(self, asset):
+        """Returns the latest known price of `asset` as a Decimal, or None if it has not been fetched yet."""
+        self.start()
+        with self._lock:
+            if asset not in self._known and asset not in self._extra:
+                self._extra.append(asset)
+                del self._extra[:-PRICE_FEED_MAX_EXTRA_ASSETS]
+                self._wake.set()  # Fetch the new asset on the next refresh rather than now
+            return self._prices.get(asset)
+
+    def refresh(self):
+        """Fetches every tracked asset in a single request; keeps the old snapshot on failure."""
+        with self._lock:
+            assets = self._known + self._extra
+        try:
+            response = scraping_tools.session.get(
+                PRICE_FEED_URL,
+                params={"ids": ",".join(assets), "vs_currencies": "usd"},
+                timeout=PRICE_FEED_TIMEOUT
+            )
+            response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            print(f"❌ Error fetching asset prices: {e}")
+            return False
+
+        prices = {
+            asset: Decimal(str(quote["usd"]))  # Ensure a properly formatted decimal value
+            for asset, quote in data.items() if isinstance(quote, dict) and quote.get("usd") is not None
+        }
+        with self._lock:
+            self._prices.update(prices)
+            self.updated_at = time.time()
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "assets": len(self._known) + len(self._extra),
+                "priced": len(self._prices),
+                "age": None if self.updated_at is None else time.time() - self.updated_at,
+            }
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            self._wake.clear()
+            self.refresh()
+            self._wake.wait(self.ttl)
+            # Bursts of new assets still cost at most one request per PRICE_FEED_MIN_INTERVAL
+            time.sleep(max(PRICE_FEED_MIN_INTERVAL - (time.monotonic() - started), 0))
+
+# Shared by every request
+price_feed = PriceFeed()
+
+def _collect():
+    stats = price_feed.stats()
+    samples = [
+        ("bigmarket_price_feed_assets", "gauge", "Assets with a cached price.", [((), stats["priced"])]),
+    ]
+    if stats["age"] is not None:
+        samples.append(("bigmarket_price_feed_age_seconds", "gauge", "Age of the price snapshot.", [((), stats["age"])]))
+    return samples
+
+register_collector(_collect)
@@ -0,0 +1,110 @@
+"""
+Prompt templates, loaded from PROMPTS_DIR once at import.
+
+Each template is a text file with a small front-matter header:
+
+    ---
+    version: 2
+    ---
+    Static instructions and response format...
+    {variable} input last
+    Fixed answer cue:
+
+Everything before the first {field} is identical on every call, so providers that cache prompt
+prefixes (OpenAI, DeepSeek) bill and process it once. Keep instructions first and inputs last,
+followed by a fixed line cueing the answer: without it a completions model continues the input
+text instead of answering. Trailing newlines are dropped, so the prompt ends right at the cue.
+"""
+import os
+import hashlib
+import string
+
+from evidence import count_tokens
+from metrics import Counter
+
+PROMPTS_DIR = os.getenv("PROMPTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts"))  # Template files
+
+PROMPT_TOKENS = Counter(
+    "bigmarket_prompt_tokens_total",
+    "Estimated prompt tokens rendered, split into the cacheable static prefix and the rest.",
+    ["template", "part"]
+)
+
+class Prompt(str):
+    """A rendered prompt that remembers which template version produced it."""
+
+    def __new__(cls, text, template):
+        prompt = super().__new__(cls, text)
+        prompt.template = template
+        return prompt
+
+class PromptTemplate:
+    """A template parsed once, with its static prefix and fields known up front."""
+
+    def __init__(self, name, text, version="1"):
+        self.name = name
+        self.version = version
+        self.text = text
+        self.hash = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        # [(literal, field)] pairs, so rendering never re-parses the format string. The parser
+        # also splits at escaped braces; those literals are merged into the next field's.
+        self.segments, literal = [], ""
+        for text_part, field, _, _ in string.Formatter().parse(text):
+            literal += text_part
+            if field is not None:
+                self.segments.append((literal, field))
+                literal = ""
+        self.segments.append((literal, None))
+        self.fields = [field for _, field in self.segments if field is not None]
+        self.prefix = self.segments[0][0]
+        self.prefix_tokens = count_tokens(self.prefix)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a template file, taking its version from the front-matter header."""
+        with open(path, encoding="utf-8") as file:
+            content = file.read()
+        meta = {}
+        if content.startswith("---\n"):
+            header, _, content = content[4:].partition("\n---\n")
+            for line in header.splitlines():
+                key, _, value = line.partition(":")
+                meta[key.strip()] = value.strip()
+        name = os.path.splitext(os.path.basename(path))[0]
+        return cls(name, content.rstrip("\n"), meta.get("version", "1"))
+
+    def info(self):
+        return {"name": self.name, "version": self.version, "hash": self.hash}
+
+    def render(self, **values):
+        """Fills in the fields; raises KeyError for a missing one like str.format."""
+        parts = []
+        for literal, field in self.segments:
+            parts.append(literal)
+            if field is not None:
+                parts.append(str(values[field]))
+        prompt = Prompt("".join(parts), self)
+        PROMPT_TOKENS.inc(self.prefix_tokens, template=self.name, part="static")
+        PROMPT_TOKENS.inc(count_tokens(prompt) - self.prefix_tokens, template=self.name, part="variable")
+        return prompt
+
+def load_templates(directory=PROMPTS_DIR):
+    """Loads every *.txt template in `directory`, keyed on file name."""
+    templates = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".txt"):
+            template = PromptTemplate.load(os.path.join(directory, filename))
+            templates[template.name] = template
+    print(f"🔹 Loaded {len(templates)} prompt templates from {directory}")
+    return templates
+
+TEMPLATES = load_templates()
+
+def render(name, **values):
+    """Renders the named template."""
+    return TEMPLATES[name].render(**values)
+
+def prompt_info(prompt):
+    """{"name", "version", "hash"} of the template behind a rendered prompt, or None."""
+    template = getattr(prompt, "template", None)
+    return template.info() if template else None
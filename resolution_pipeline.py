@@ -0,0 +1,171 @@
+import os
+import time
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import llm_providers
+from scraping_tools import fetch_resolution_pages, afetch_resolution_pages
+from llm_tools_resolution import get_ai_resolution, aget_ai_resolution, replay_ai_resolution, areplay_ai_resolution
+from evidence import compact_evidence, market_query
+from prompt_registry import prompt_info
+from consensus import get_consensus_resolution, aget_consensus_resolution
+from audit_store import audit_store
+from metrics import current_trace_id
+
+RESOLVE_BATCH_CONCURRENCY = int(os.getenv("RESOLVE_BATCH_CONCURRENCY", "8"))  # Parallel LLM calls per batch
+RESOLVE_BATCH_SCRAPE_DEADLINE = float(os.getenv("RESOLVE_BATCH_SCRAPE_DEADLINE", "60"))  # Seconds to scrape a batch
+
+def _evidence(data, pages):
+    """Compacts the scraped passages of a market's sources into the most relevant evidence."""
+    scraped_data = compact_evidence(data["sources"], pages, market_query(data))
+    print(f"🔹 Scraped Data: {scraped_data}")  # 🛠 Debugging scraped data
+    return scraped_data
+
+def _resolution_request(data, evidence):
+    return dict(
+        market_title=data["title"],
+        description=data["description"],
+        resolution_criteria=data["resolution_criteria"],
+        outcome_categories=data["outcome_categories"],
+        evidence=evidence
+    )
+
+def _resolution_result(data, resolution, consensus=None):
+    prompt, ai_response, outcome_index, model = resolution
+
+    print(f"✅ AI Resolved Outcome: {outcome_index}")  # 🛠 Debugging AI response
+
+    result = {
+        "market_id": data["market_id"],
+        "market_type": data["market_type"],
+        "resolution": outcome_index,
+        "prompt": prompt,
+        "ai_response": ai_response,
+        "model": model,
+        "prompt_template": prompt_info(prompt)
+    }
+    if consensus is not None:
+        result["consensus"] = consensus
+    return result
+
+@contextmanager
+def _timed(timings, name):
+    """Adds the seconds spent in the block to `timings[name]`, for the audit record."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.perf_counter() - started, 4)
+
+def _audit(data, evidence, result, timings, replay_of=None, provider_name=None, model=None):
+    """Appends the resolution to the audit store and adds its `audit_id` to the result."""
+    store = audit_store()
+    if store is None:
+        return result
+    try:
+        if "consensus" in result:
+            votes = result["consensus"]["votes"]
+            provider_label = "consensus"
+            model = ",".join(f"{vote['provider']}:{vote['model']}" for vote in votes)
+        else:
+            provider = llm_providers.get_provider(provider_name)
+            provider_label, model = provider.name, model or provider.model
+        result["audit_id"] = store.record(
+            data.get("market_id"), data, evidence, result["prompt"], result["prompt_template"],
+            result["ai_response"], result["resolution"], provider_label, model, timings,
+            trace_id=current_trace_id(), replay_of=replay_of, consensus=result.get("consensus")
+        )
+    except Exception as e:
+        print(f"❌ Error recording resolution audit: {e}")
+    return result
+
+def resolve_market(data, pages=None):
+    """
+    Resolves one market payload (the body of /resolve-market).
+    `pages` is an optional {url: [passage, ...]} map of sources that were already scraped.
+    """
+    timings = {}
+    # Scrape market resolution sources
+    if pages is None:
+        with _timed(timings, "fetch"):
+            pages = fetch_resolution_pages(data["sources"])
+    with _timed(timings, "evidence"):
+        evidence = _evidence(data, pages)
+
+    # Use LLM to determine correct outcome, or let several models vote on it
+    with _timed(timings, "llm"):
+        if data.get("consensus"):
+            resolution, report = get_consensus_resolution(data["consensus"], **_resolution_request(data, evidence))
+        else:
+            resolution, report = get_ai_resolution(**_resolution_request(data, evidence)), None
+    return _audit(data, evidence, _resolution_result(data, resolution, report), timings)
+
+async def aresolve_market(data):
+    """Async `resolve_market`."""
+    timings = {}
+    with _timed(timings, "fetch"):
+        pages = await afetch_resolution_pages(data["sources"])
+    with _timed(timings, "evidence"):
+        evidence = _evidence(data, pages)
+    with _timed(timings, "llm"):
+        if data.get("consensus"):
+            request = _resolution_request(data, evidence)
+            resolution, report = await aget_consensus_resolution(data["consensus"], **request)
+        else:
+            resolution, report = await aget_ai_resolution(**_resolution_request(data, evidence)), None
+    result = _resolution_result(data, resolution, report)
+    return await asyncio.to_thread(_audit, data, evidence, result, timings)
+
+def _replay_result(record, resolution, timings, provider_name, model):
+    result = _resolution_result(record["request"], resolution)
+    result["prompt_template"] = record["prompt_template"]
+    result["replay_of"] = record["id"]
+    result["original_resolution"] = record["outcome"]
+    return _audit(record["request"], record["evidence"], result, timings, record["id"], provider_name, model)
+
+def replay_resolution(audit_id, provider_name=None, model=None):
+    """
+    Re-runs a stored resolution against another provider or model, sending the exact prompt and
+    evidence snapshot that were recorded. Nothing is scraped. Returns None for an unknown `audit_id`.
+    """
+    store = audit_store()
+    record = store.get(audit_id) if store else None
+    if record is None:
+        return None
+    timings = {}
+    with _timed(timings, "llm"):
+        resolution = replay_ai_resolution(record["prompt"], provider_name, model)
+    return _replay_result(record, resolution, timings, provider_name, model)
+
+async def areplay_resolution(audit_id, provider_name=None, model=None):
+    """Async `replay_resolution`."""
+    store = audit_store()
+    record = await asyncio.to_thread(store.get, audit_id) if store else None
+    if record is None:
+        return None
+    timings = {}
+    with _timed(timings, "llm"):
+        resolution = await areplay_ai_resolution(record["prompt"], provider_name, model)
+    return await asyncio.to_thread(_replay_result, record, resolution, timings, provider_name, model)
+
+def resolve_markets(markets, max_concurrency=RESOLVE_BATCH_CONCURRENCY):
+    """
+    Resolves many markets at once, scraping each distinct source URL a single time.
+    Yields one result per market as soon as it completes; failures are yielded as
+    {"market_id": ..., "error": ...} instead of aborting the batch.
+    """
+    urls = [url for market in markets if isinstance(market, dict) for url in market.get("sources") or []]
+    pages = fetch_resolution_pages(urls, deadline=RESOLVE_BATCH_SCRAPE_DEADLINE)
+    print(f"🔹 Scraped {len(pages)} of {len(set(urls))} sources for {len(markets)} markets")
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+        futures = {pool.submit(contextvars.copy_context().run, resolve_market, market, pages): market for market in markets}
+        for future in as_completed(futures):
+            market = futures[future]
+            try:
+                yield future.result()
+            except Exception as e:
+                market_id = market.get("market_id") if isinstance(market, dict) else None
+                print(f"❌ Error resolving market {market_id}: {e!r}")
+                yield {"market_id": market_id, "error": f"Resolution failed: {e!r}"}
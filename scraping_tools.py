@@ -1,19 +1,229 @@
+import os
+import asyncio
+import threading
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+import html_text
+from page_cache import page_cache
+from single_flight import SingleFlight
+from metrics import stage
 
-def fetch_resolution_data(urls):
+# Scraping limits (seconds / counts)
+SCRAPE_TIMEOUT = float(os.getenv("SCRAPE_TIMEOUT", "10"))  # Per-request socket timeout
+SCRAPE_DEADLINE = float(os.getenv("SCRAPE_DEADLINE", "15"))  # Budget for a whole fetch_resolution_data call
+SCRAPE_MAX_WORKERS = int(os.getenv("SCRAPE_MAX_WORKERS", "16"))
+SCRAPE_PER_HOST_LIMIT = int(os.getenv("SCRAPE_PER_HOST_LIMIT", "4"))
+SCRAPE_MAX_CHARS = int(os.getenv("SCRAPE_MAX_CHARS", "20000"))  # Text kept per page, before evidence compaction
+
+# Shared keep-alive connection pool, reused by every scrape
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=SCRAPE_MAX_WORKERS)
+session.mount("http://", _adapter)
+session.mount("https://", _adapter)
+
+_executor = ThreadPoolExecutor(max_workers=SCRAPE_MAX_WORKERS, thread_name_prefix="scrape")
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+# Concurrent scrapes of the same page share one download
+scrape_flights = SingleFlight("scrape")
+TRACKING_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid", "ref"}
+
+# Async counterparts for the ASGI server, created inside the event loop on first use
+_async_client = None
+_async_host_slots = {}
+
+def normalize_url(url):
     """
-    Scrapes resolution sources for market data.
+    Canonical form of a URL, so trivially different links to the same page match:
+    lower-case scheme and host, no default port, fragment or tracking parameters, sorted query.
     """
-    scraped_data = []
-    for url in urls:
-        try:
-            response = requests.get(url, timeout=10)
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    )
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+def _host_slot(url):
+    """Returns the semaphore limiting concurrent requests to the URL's host."""
+    host = urlsplit(url).netloc.lower()
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(SCRAPE_PER_HOST_LIMIT)
+        return _host_slots[host]
+
+def fetch_cached(url, kind, extract, headers=None, deadline=None):
+    """
+    GETs `url` through the page cache and returns `extract(response)`.
+    `kind` names the extraction, so different views of one page are cached separately.
+    A fresh cached value costs no request; a stale one is revalidated with its ETag/Last-Modified
+    and reused on 304. Concurrent calls for the same page share one download.
+    """
+    key = f"{kind} {normalize_url(url)}"
+    return scrape_flights.do(key, lambda: _conditional_get(key, url, extract, headers or {}, deadline))
+
+def _conditional_get(key, url, extract, headers, deadline):
+    entry, fresh = page_cache.lookup(key, url)
+    if fresh:
+        return entry.value
+
+    deadline = deadline if deadline is not None else time.monotonic() + SCRAPE_TIMEOUT
+    slot = _host_slot(url)
+    if not slot.acquire(timeout=max(deadline - time.monotonic(), 0)):
+        raise TimeoutError("deadline reached while waiting for a host slot")
+    try:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("deadline reached before request started")
+        if entry is not None:
+            headers = {**headers, **entry.conditional_headers()}
+        # Closing the streamed response returns its connection to the pool, whatever happens below
+        with session.get(url, headers=headers, timeout=min(SCRAPE_TIMEOUT, remaining), stream=True) as response:
+            if response.status_code == 304 and entry is not None:
+                page_cache.revalidated(key, entry)
+                return entry.value
             response.raise_for_status()  # Raise an error for bad responses (4xx, 5xx)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            text_content = soup.get_text()[:2000]  # Limit text to 2000 characters
-            scraped_data.append(text_content)
+            value = extract(response)
+    finally:
+        slot.release()
+
+    page_cache.store(key, value, response.headers)
+    return value
+
+def async_client():
+    """Returns the shared httpx.AsyncClient used for non-blocking scrapes."""
+    global _async_client
+    if _async_client is None:
+        import httpx  # Only needed in async mode
+
+        _async_client = httpx.AsyncClient(timeout=SCRAPE_TIMEOUT, follow_redirects=True)
+    return _async_client
+
+def _async_host_slot(url):
+    host = urlsplit(url).netloc.lower()
+    if host not in _async_host_slots:
+        _async_host_slots[host] = asyncio.Semaphore(SCRAPE_PER_HOST_LIMIT)
+    return _async_host_slots[host]
+
+async def afetch_cached(url, kind, aextract, headers=None):
+    """Async `fetch_cached`; `aextract` is awaited with the streamed httpx response."""
+    key = f"{kind} {normalize_url(url)}"
+    return await scrape_flights.ado(key, lambda: _aconditional_get(key, url, aextract, headers or {}))
+
+async def _aconditional_get(key, url, aextract, headers):
+    entry, fresh = await page_cache.alookup(key, url)
+    if fresh:
+        return entry.value
+
+    if entry is not None:
+        headers = {**headers, **entry.conditional_headers()}
+    async with _async_host_slot(url):
+        async with async_client().stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and entry is not None:
+                await page_cache.arevalidated(key, entry)
+                return entry.value
+            response.raise_for_status()
+            value = await aextract(response)
+
+    await page_cache.astore(key, value, response.headers)
+    return value
+
+def _page_passages(response):
+    return html_text.extract(response, max_chars=SCRAPE_MAX_CHARS).passages
+
+async def _apage_passages(response):
+    return (await html_text.aextract(response, max_chars=SCRAPE_MAX_CHARS)).passages
+
+def _news_summary(response):
+    page = html_text.extract(response, max_paragraphs=3, want_title=True)
+    return page.title, page.paragraphs
+
+async def _anews_summary(response):
+    page = await html_text.aextract(response, max_paragraphs=3, want_title=True)
+    return page.title, page.paragraphs
+
+def _fetch_page_passages(url, deadline):
+    """Returns one resolution source's visible text as passages, honouring the overall deadline."""
+    return fetch_cached(url, "passages", _page_passages, deadline=deadline)
+
+async def _afetch_page_passages(url):
+    return await afetch_cached(url, "passages", _apage_passages)
+
+def fetch_news_summary(news_url):
+    """Streams a news article just far enough to read its <title> and first three paragraphs."""
+    with stage("fetch"):
+        return fetch_cached(news_url, "summary", _news_summary, headers={"User-Agent": "Mozilla/5.0"})
+
+async def afetch_news_summary(news_url):
+    """Async `fetch_news_summary`."""
+    with stage("fetch"):
+        return await afetch_cached(news_url, "summary", _anews_summary, headers={"User-Agent": "Mozilla/5.0"})
+
+def fetch_resolution_pages(urls, deadline=SCRAPE_DEADLINE):
+    """
+    Scrapes resolution sources concurrently.
+    Returns {url: [passage, ...]} for the sources that finished within `deadline` seconds, in input order.
+    """
+    unique_urls = list(dict.fromkeys(urls))
+    if not unique_urls:
+        return {}
+
+    deadline_at = time.monotonic() + deadline
+    with stage("fetch"):
+        # Workers run in a copy of this context so their timings land in the caller's trace
+        futures = {
+            url: _executor.submit(contextvars.copy_context().run, _fetch_page_passages, url, deadline_at)
+            for url in unique_urls
+        }
+        done, not_done = wait(futures.values(), timeout=deadline)
+
+    pages = {}
+    for url, future in futures.items():
+        if future not in done:
+            future.cancel()
+            print(f"⏱️ Deadline reached, skipping {url}")
+            continue
+        try:
+            pages[url] = future.result()
         except Exception as e:
             print(f"Error scraping {url}: {e}")
-    return " ".join(scraped_data)  # Return all scraped data as a single string
+    return pages
+
+async def afetch_resolution_pages(urls, deadline=SCRAPE_DEADLINE):
+    """Async `fetch_resolution_pages`; sources still running at the deadline are cancelled."""
+    unique_urls = list(dict.fromkeys(urls))
+    if not unique_urls:
+        return {}
+
+    with stage("fetch"):
+        tasks = {url: asyncio.ensure_future(_afetch_page_passages(url)) for url in unique_urls}
+        done, not_done = await asyncio.wait(tasks.values(), timeout=deadline)
 
+    pages = {}
+    for url, task in tasks.items():
+        if task not in done:
+            task.cancel()
+            print(f"⏱️ Deadline reached, skipping {url}")
+            continue
+        try:
+            pages[url] = task.result()
+        except Exception as e:
+            print(f"Error scraping {url}: {e}")
+    return pages
+
+def fetch_resolution_data(urls):
+    """
+    Scrapes resolution sources for market data.
+    """
+    pages = fetch_resolution_pages(urls)
+    return " ".join(" ".join(passages) for passages in pages.values())  # Return all scraped data as a single string
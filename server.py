@@ -1,13 +1,54 @@
 import os
-import requests
-from flask import Flask, request, jsonify
-from scraping_tools import fetch_resolution_data
-from llm_tools_resolution import get_ai_resolution
+import json
+import time
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from resolution_pipeline import resolve_market as resolve_market_data, resolve_markets, replay_resolution
 from llm_tools_creation import generate_market
-from llm_tools_ai_markets import discover_markets_from_news
+from llm_tools_ai_markets import discover_markets_from_news, stream_markets_from_news
+from news_pipeline import discover_markets_from_feeds, max_articles_of
+from job_queue import QueueFull
+from background_jobs import jobs, job_request
+from price_feed import price_feed
+from audit_store import audit_store, AUDIT_HISTORY_LIMIT
+from llm_providers import PROVIDERS
+from consensus import consensus_options
+import admission
+import metrics
 
 app = Flask(__name__)
 
+@app.before_request
+def start_background_workers():
+    # Started on first request, not at import, so the debug reloader's parent process and tools that
+    # only import the app never run jobs or poll prices
+    price_feed.start()
+    jobs.start()
+
+@app.before_request
+def start_request_trace():
+    g.started = time.perf_counter()
+    g.trace_id = metrics.start_trace(request.headers.get("X-Trace-Id"))
+
+@app.before_request
+def admit_request():
+    endpoint = request.url_rule.rule if request.url_rule else request.path
+    rejected = admission.admit(request.method, request.path, endpoint, request.headers, request.remote_addr)
+    if rejected is not None:
+        message, retry_after = rejected
+        return jsonify({"error": message}), 429, {"Retry-After": str(retry_after)}
+
+@app.after_request
+def finish_request_trace(response):
+    if request.path != "/metrics":
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.finish_trace(endpoint, response.status_code, time.perf_counter() - g.started)
+    response.headers["X-Trace-Id"] = g.trace_id
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route('/discover-markets', methods=['POST'])
 def discover_markets():
     data = request.json
@@ -18,10 +59,47 @@ def discover_markets():
 
     print(f"🔹 Discovering markets from news: {news_url}")
 
-    market_data = discover_markets_from_news(news_url)
+    market_data = discover_markets_from_news(news_url, bool(data.get("force")))
 
     return jsonify(market_data)
 
+@app.route('/discover-markets/stream', methods=['POST'])
+def discover_markets_stream():
+    data = request.json
+    news_url = data.get("news_url", "")
+
+    if not news_url:
+        return jsonify({"error": "News URL is required"}), 400
+
+    print(f"🔹 Streaming markets from news: {news_url}")
+
+    # One JSON line per market, sent as soon as the model finishes writing it
+    markets = stream_markets_from_news(news_url, bool(data.get("force")))
+    return Response(
+        stream_with_context(json.dumps(market) + "\n" for market in markets),
+        mimetype="application/x-ndjson"
+    )
+
+@app.route('/discover-markets/feeds', methods=['POST'])
+def discover_markets_feeds():
+    data = request.json
+    feeds = data.get("feeds")
+
+    if not isinstance(feeds, list) or not feeds:
+        return jsonify({"error": "A list of feed URLs is required"}), 400
+    max_articles = max_articles_of(data)
+    if max_articles is None:
+        return jsonify({"error": "max_articles must be a positive integer"}), 400
+
+    print(f"🔹 Discovering markets from {len(feeds)} feeds")
+
+    # One JSON line per candidate market, for articles not processed by an earlier scan
+    markets = discover_markets_from_feeds(feeds, max_articles)
+    return Response(
+        stream_with_context(json.dumps(market) + "\n" for market in markets),
+        mimetype="application/x-ndjson"
+    )
+
 @app.route('/create-market', methods=['POST'])
 def create_market():
     data = request.json
@@ -33,7 +111,7 @@ def create_market():
 
     print(f"🔹 User wants to create a {market_type} market: {user_idea}")
 
-    market_data = generate_market(user_idea, market_type)
+    market_data = generate_market(user_idea, market_type, bool(data.get("force")))
 
     return jsonify(market_data)
 
@@ -42,33 +120,98 @@ def resolve_market():
     data = request.json
     print(f"🔹 Received Market Resolution Request: {data}")  # 🛠 Debugging incoming request
 
-    market_id = data["market_id"]
-    market_type = data["market_type"]
-    sources = data["sources"]
-
-    # Scrape market resolution sources
-    scraped_data = fetch_resolution_data(sources)
-    print(f"🔹 Scraped Data: {scraped_data}")  # 🛠 Debugging scraped data
-
-    # Use LLM to determine correct outcome
-    prompt, ai_response, outcome_index, model = get_ai_resolution(
-        market_title=data["title"],
-        description=data["description"],
-        resolution_criteria=data["resolution_criteria"],
-        outcome_categories=data["outcome_categories"],
-        evidence=scraped_data
+    if isinstance(data, dict) and data.get("consensus"):
+        try:
+            consensus_options(data["consensus"])
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": f"Invalid consensus options: {e}"}), 400
+
+    return jsonify(resolve_market_data(data))
+
+@app.route('/resolve-markets', methods=['POST'])
+def resolve_markets_batch():
+    data = request.json
+    markets = data.get("markets") if isinstance(data, dict) else data
+
+    if not isinstance(markets, list) or not markets:
+        return jsonify({"error": "A list of markets is required"}), 400
+
+    print(f"🔹 Received Batch Resolution Request for {len(markets)} markets")
+
+    # Stream one JSON line per market as each resolution completes
+    results = resolve_markets(markets)
+    return Response(
+        stream_with_context(json.dumps(result) + "\n" for result in results),
+        mimetype="application/x-ndjson"
     )
 
-    print(f"✅ AI Resolved Outcome: {outcome_index}")  # 🛠 Debugging AI response
+@app.route('/resolutions/<audit_id>', methods=['GET'])
+def get_resolution(audit_id):
+    store = audit_store()
+    record = store.get(audit_id) if store else None
+
+    if record is None:
+        return jsonify({"error": "Resolution not found"}), 404
+
+    return jsonify(record)
+
+@app.route('/markets/<market_id>/resolutions', methods=['GET'])
+def get_market_resolutions(market_id):
+    store = audit_store()
+
+    if store is None:
+        return jsonify({"error": "Audit store is disabled"}), 404
+
+    limit = request.args.get("limit", AUDIT_HISTORY_LIMIT, type=int)
+    since = request.args.get("since", type=float)
+
+    return jsonify({"market_id": market_id, "resolutions": store.history(market_id, limit, since)})
+
+@app.route('/resolutions/<audit_id>/replay', methods=['POST'])
+def replay_market_resolution(audit_id):
+    data = request.get_json(silent=True) or {}
+    provider = data.get("provider")
+
+    if provider and provider.lower() not in PROVIDERS:
+        return jsonify({"error": f"Unknown provider: {provider}"}), 400
+
+    print(f"🔹 Replaying resolution {audit_id} with {provider or 'the configured provider'}")
+
+    result = replay_resolution(audit_id, provider, data.get("model"))
+
+    if result is None:
+        return jsonify({"error": "Resolution not found"}), 404
+
+    return jsonify(result)
+
+@app.route('/jobs/<job_type>', methods=['POST'])
+def submit_job(job_type):
+    data = request.json
+
+    if job_type not in jobs.handlers:
+        return jsonify({"error": f"Unknown job type: {job_type}"}), 404
+    try:
+        payload, callback_url = job_request(job_type, data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        job_id, created = jobs.submit(job_type, payload, callback_url, admission.current_tenant())
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429
+
+    print(f"🔹 {'Queued' if created else 'Joined in-flight'} {job_type} job {job_id}")
+
+    return jsonify({"job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = jobs.get(job_id)
+
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
 
-    return jsonify({
-        "market_id": market_id,
-        "market_type": market_type, 
-        "resolution": outcome_index,
-        "prompt": prompt,
-        "ai_response": ai_response,
-        "model": model
-    })
+    return jsonify(job)
 
 if __name__ == '__main__':
     app.run(port=5000, debug=True)
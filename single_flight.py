@@ -0,0 +1,100 @@
+import asyncio
+import threading
+from metrics import register_collector
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.callers = 1
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the work,
+    callers arriving while it is in flight wait for and receive the same result (or exception).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.flights = 0  # Completed executions
+        self.callers = 0  # Callers served by those executions
+        self.max_callers = 0
+        self._flights = {}
+        self._async_flights = {}
+        self._lock = threading.Lock()
+        register_collector(self._collect)
+
+    def do(self, key, fn):
+        """Runs `fn()` unless a call with the same key is already in flight, then shares its outcome."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.callers += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                self._record(flight.callers)
+            flight.done.set()
+
+    async def ado(self, key, coro_fn):
+        """Async `do`: awaits `coro_fn()` once per key among concurrent callers."""
+        flight = self._async_flights.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(coro_fn())
+            flight = self._async_flights[key] = [task, 1]
+            task.add_done_callback(lambda _: self._finish_async(key, flight))
+        else:
+            flight[1] += 1
+        # Shield so one cancelled caller does not cancel the work the others are waiting on
+        return await asyncio.shield(flight[0])
+
+    def stats(self):
+        """Returns how many executions ran and how many callers they served."""
+        with self._lock:
+            return {
+                "flights": self.flights,
+                "callers": self.callers,
+                "shared_callers": self.callers - self.flights,
+                "max_callers": self.max_callers,
+                "in_flight": len(self._flights) + len(self._async_flights),
+            }
+
+    def _collect(self):
+        stats = self.stats()
+        labels = (("flight", self.name),)
+        return [
+            ("bigmarket_single_flight_executions_total", "counter", "Coalesced executions.",
+             [(labels, stats["flights"])]),
+            ("bigmarket_single_flight_callers_total", "counter", "Callers served by coalesced executions.",
+             [(labels, stats["callers"])]),
+        ]
+
+    def _finish_async(self, key, flight):
+        if self._async_flights.get(key) is flight:
+            del self._async_flights[key]
+        with self._lock:
+            self._record(flight[1])
+
+    def _record(self, callers):
+        self.flights += 1
+        self.callers += callers
+        self.max_callers = max(self.max_callers, callers)
+        if callers > 1:
+            print(f"🔁 {self.name}: one flight served {callers} callers")